@@ -292,8 +292,7 @@ for tr, t in tlist:
         last_tr = tr
         print('trial %d' % tr)
         if pflag:
-            for ch in range(nch):
-                D[ch, :] = dofilt(D[ch], lineFilt)
+            D = dofilt(D, lineFilt)
     samp = ds.getSampleNo(t + t0)
     for ch in range(nch):
         d = D[ch][samp : samp + seglen]
@@ -7,8 +7,9 @@ from pylab import *
 import pyctf
 from pyctf.util import *
 from pyctf.st.smt import calc_tapers, calcbw, mtst
-from pyctf.st import st
+from pyctf.st import st, st_accumulate
 from pyctf.samiir import mkfft, mkiir, dofilt
+from pyctf.processing import Pipeline
 
 usage("""[options] -c channel ... [dataset]
 
@@ -57,7 +58,9 @@ Options are:
     -T trial        Only process the specified trial(s). You can
                     specify more than one trial.
 
-    -p              Apply a 60 Hz notch filter.
+    -p              Apply the dataset's processing parameters (from
+                    processing.cfg), or a 60 Hz notch filter if it
+                    doesn't have any.
 
     -l              Plot the log of the power.
 
@@ -276,24 +279,40 @@ m = 1
 if K > 0:
     tapers = calc_tapers(K, seglen)
 
-# Optionally notch filter the data. @@@ Should really apply all processing parameters.
+# Optionally apply the processing parameters, all channels at once.
 
+pipe = None
 if pflag:
-    lineFilt = mkfft(61., 59., srate, nsamples)
+    try:
+        pipe = Pipeline(ds)
+    except FileNotFoundError:
+        pipe = Pipeline(ds, {'offset': [1, 2, 0, 0], 'bandreject': [[1, 4, 59., 61.]]})
 
 last_tr = None
 for tr, t in tlist:
     if t + t0 < T0 or t + t1 > T1:
         continue
     if tr != last_tr:
-        D = ds.getIdxArray(tr, idx)
+        if pipe:
+            D = pipe.getIdxArray(tr, idx)
+        else:
+            D = ds.getIdxArray(tr, idx)
         D *= 1e15 # convert from tesla to femtotesla
         last_tr = tr
         print('trial %d' % tr)
-        if pflag:
-            for ch in range(nch):
-                D[ch, :] = dofilt(D[ch], lineFilt)
     samp = ds.getSampleNo(t + t0)
+    if aflag and K == 0:
+        # Accumulate the power (or the complex sum, for -P) of all
+        # the channels at once, in place.
+        if n == 0:
+            s = zeros((freq(hi) - freq(lo) + 1, seglen))
+            c = zeros(s.shape, dtype = complex) if Pflag else None
+        st_accumulate(s, D[:, samp : samp + seglen], freq(lo), freq(hi),
+                      csum = c, nthreads = 0)
+        n += nch
+        if verbose:
+            print(n)
+        continue
     for ch in range(nch):
         d = D[ch][samp : samp + seglen]
         if aflag:
@@ -332,6 +351,8 @@ print('%d total epochs, avg. %g per channel' % (n, float(n) / nch))
 r /= n
 if aflag:
     if Pflag:
+        if K == 0:
+            s = c
         s = abs(s)**2
     else:
         s /= n
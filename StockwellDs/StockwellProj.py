@@ -314,8 +314,7 @@ for tr, t in tlist:
                 last_tr = tr
                 print('trial %d' % tr)
                 if pflag:
-                        for ch in idx:
-                                D[ch, :] = dofilt(D[ch], lineFilt)
+                        D[idx] = dofilt(D[idx], lineFilt)
         samp = round((t - T0 + t0) * srate)
         i = 0
         for ch in idx:
@@ -16,7 +16,7 @@ dslist = sys.argv[1:]
 
 l = []
 for dsname in dslist:
-    ds = pyctf.dsopen(dsname)
+    ds = pyctf.dsopen(dsname, lazy = True)
     t = ds.r.time
     coilPos = ds.dewar
     l.append((t, coilPos, ds.setname))
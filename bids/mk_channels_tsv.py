@@ -9,7 +9,7 @@ if len(sys.argv) != 2:
     sys.exit(1)
 
 dsname = sys.argv[1]
-ds = pyctf.dsopen(dsname)
+ds = pyctf.dsopen(dsname, lazy = True)
 
 types = {
     ctf.TYPE_EEG:       "EEG",
@@ -12,7 +12,7 @@ if len(sys.argv) != 2:
 # Open the dataset and extract basic fields.
 
 dsname = sys.argv[1]
-ds = pyctf.dsopen(dsname)
+ds = pyctf.dsopen(dsname, lazy = True)
 
 subj, study, date, run = ds.setname.split('_')
 
@@ -30,18 +30,11 @@ def measureNoise(p, chs, filt = None, tr = 0):
     ds = p.ds
     p.log("Measuring noise in trial {} of {}".format(tr, ds.setname))
 
-    noise = []
-    if filt is None:
-        for ch in chs:
-            x = ds.getDsData(tr, ch)        # this removes the mean
-            noise.append(x.std())
-    else:
-        for ch in chs:
-            x = ds.getDsData(tr, ch)
-            x = dofilt(x, filt)
-            noise.append(x.std())
+    x = ds.getIdxArray(tr, chs)             # this removes the mean
+    if filt is not None:
+        x = dofilt(x, filt)
 
-    return np.array(noise)
+    return x.std(axis = 1)
 
 def measureSimNoise(chs, sim, filt = None):
     "return an array of noise estimates for the optionally filtered simulated data"
@@ -1,7 +1,6 @@
 import os
 from copy import deepcopy
-from struct import Struct
-from pyctf import ctf
+from pyctf import ctf, dsWriter
 
 def res4New(ds, nsamp, srate):
     "return a copy of the res4 struct, with new parameters"
@@ -33,15 +32,18 @@ def getsetname(dsname):
 def writeOutput(ds, newdsname, nsamp, srate, data):
     "create (overwrite if it exists) the new dataset"
 
-    newset = getsetname(newdsname)
-    os.system("rm -rf %s" % newdsname)
-    os.mkdir(newdsname)
-
     # Set up a new .res4 file, based on the old one.
 
-    res4name = os.path.join(newdsname, newset + ".res4")
     res4 = res4New(ds, nsamp, srate)
-    ctf.write_res4_structs(res4name, res4)
+    with dsWriter(newdsname, res4) as w:
+        newset = w.setname
+
+        # Write the .meg4 file a few channels at a time.
+
+        M = ds.getNumberOfChannels()
+        step = 16
+        for m in range(0, M, step):
+            w.writeChannels(data[m : m + step])
 
     # Copy the important files.
 
@@ -62,24 +64,3 @@ def writeOutput(ds, newdsname, nsamp, srate, data):
             docopy(oldname, name)
         except:
             pass
-
-    # Get the channel gains.
-
-    gains = ds.r.chanGain
-
-    # Format to write big endian 32-bit integers.
-
-    be_int = Struct(">%di" % nsamp)
-
-    # Create the new .meg4 file.
-
-    M = ds.getNumberOfChannels()
-    meg4name = os.path.join(newdsname, newset + ".meg4")
-    with open(meg4name, "wb") as f:
-        f.write(b"MEG41CP\x00")
-        for m in range(M):
-            d = data[m] / gains[m]
-            # convert to int
-            l = [int(x + .5) for x in d]
-            f.write(be_int.pack(*l))
-
@@ -1,6 +1,9 @@
 from __future__ import division, with_statement
 
 from .dsopen import dsopen, PRI_idx
+from .dsWriter import dsWriter
+from .balance import balancer
+from .decimate import decimated
 from . import ctf_res4 as ctf
 from . import fid, samiir, st, util
 from .getfidrot import getfidrot
@@ -0,0 +1,109 @@
+"""Synthetic gradiometer balancing, using the coefficients in the .res4 file."""
+
+import numpy as np
+from . import ctf_res4 as ctf
+
+# The coefficient types for each gradient order.
+
+GRADTYPE = [None, b'G1BR', b'G2BR', b'G3BR']
+
+def coeffMatrix(r, order):
+    """Return the (numPrimaries, numRefs) matrix of balancing coefficients
+    of the given gradient order (0 to 3), from the .res4 container r. Row
+    i is for primary channel r.firstPrimary + i, and column j is for
+    reference channel r.firstRef + j. For order 0 the matrix is zero."""
+
+    if order not in range(len(GRADTYPE)):
+        raise ValueError("invalid gradient order {}".format(order))
+    if r.numRefs == 0:
+        raise ValueError("this dataset has no reference channels")
+
+    W = np.zeros((r.numPrimaries, r.numRefs))
+    if order == 0:
+        return W
+
+    gt = GRADTYPE[order]
+    for ci in r.coeff:
+        if ci[ctf.ci_type] != gt:
+            continue
+        i = r.chanIndex[ci[ctf.ci_sensorName]] - r.firstPrimary
+        if i < 0 or i >= r.numPrimaries:
+            continue        # the references can have coefficients too
+        for name, cidx, c in ci[ctf.ci_sensorList]:
+            W[i, cidx - r.firstRef] = c
+    return W
+
+class balancer:
+
+    def __init__(self, r, order):
+        """b = balancer(r, order)
+        Make an operator that changes the primary channels of a dataset
+        with .res4 container r to the given gradient order. The order each
+        channel was recorded (or saved) with comes from its SensorRes, so
+        data that are already balanced are handled correctly; the
+        reference channels are assumed to be unbalanced.
+
+        The data are in Tesla, with the channels on the next to last axis.
+        The whole operation is one matrix multiply:
+
+            b.apply(x)              # x has all the channels
+            b.apply(x, ref, idx)    # x has channels [idx], ref has
+                                    # all the references
+
+        b.W is the (numPrimaries, numRefs) matrix that is applied."""
+
+        self.r = r
+        self.order = order
+        self.pri = slice(r.firstPrimary, r.firstPrimary + r.numPrimaries)
+        self.ref = slice(r.firstRef, r.firstRef + r.numRefs)
+
+        # B_order = B_raw - W_order R = B_cur - (W_order - W_cur) R
+
+        cur = r.chanRec['sensor']['gradOrder'][self.pri]
+        W = coeffMatrix(r, order)
+        for k in set(cur.tolist()):
+            rows = cur == k
+            W[rows] -= coeffMatrix(r, k)[rows]
+        self.W = W
+        self._W = {W.dtype: W}
+
+    def getW(self, dtype):
+        """Return W converted to dtype."""
+
+        W = self._W.get(dtype)
+        if W is None:
+            W = self.W.astype(dtype)
+            self._W[dtype] = W
+        return W
+
+    def rows(self, idx):
+        """For channels [idx], return the positions in [idx] of the
+        primaries, and the corresponding rows of W."""
+
+        C = self.r.numChannels
+        ch = np.atleast_1d(np.arange(C)[idx])
+        pos = np.flatnonzero((ch >= self.pri.start) & (ch < self.pri.stop))
+        return pos, ch[pos] - self.pri.start
+
+    def apply(self, x, ref = None, idx = None):
+        """Balance x in place, and return it. If ref is None, x holds all
+        the channels. Otherwise x holds channels [idx] (default, all the
+        primaries) and ref holds all the reference channels, with the
+        same leading dimensions. If idx is a single channel, x may be
+        one-dimensional."""
+
+        W = self.getW(x.dtype)
+        if ref is None:
+            y = x[..., self.pri, :]
+            y -= np.matmul(W, x[..., self.ref, :])
+            return x
+
+        if idx is None or (isinstance(idx, slice) and idx == self.pri):
+            x -= np.matmul(W, ref)
+            return x
+
+        pos, wrows = self.rows(idx)
+        y = x if x.ndim > 1 else x[np.newaxis]
+        if len(pos) > 0:
+            y[..., pos, :] -= np.matmul(W[wrows], ref)
+        return x
@@ -1,58 +1,215 @@
-import sys
+import sys, os
+import json, hashlib
 import numpy as np
 
 MEG4HDR = "MEG41CP\x00"
+SIDECAREXT = '.f32meg4'
 
 class dsData(object):
-    """mmap() the .meg4 file. Return byteswapped, scaled arrays of data."""
+    """mmap() the .meg4 file. Return byteswapped, scaled arrays of data.
+    The arrays are float64 unless another dtype (e.g. 'float32') is given.
 
-    def __init__(self, r, meg4name):
+    If sidecar is True or the name of a cache directory, the data are read
+    from a native-endian, pre-scaled float32 copy of the .meg4 file, which
+    is created (next to the .meg4 file or in the cache directory) if it
+    doesn't exist or is out of date. See mkSidecar()."""
+
+    def __init__(self, r, meg4name, dtype = 'float64', sidecar = None,
+                 lazy = False):
         self.r = r
+        self.dtype = np.dtype(dtype)
         self.T = r.numTrials
         self.C = r.numChannels
         self.S = r.numSamples
-        self.m = np.memmap(meg4name, dtype = 'int32', mode = 'r',
-            shape = (self.T, self.C, self.S), offset = len(MEG4HDR))
+        self.meg4name = meg4name
+        self.sidecar = sidecar
+        self.closed = False
+        if not lazy:
+            self._map()
+
+    # With lazy = True, the file isn't mapped until the data are used. The
+    # writeable map, w, is only made if it's used.
+
+    def __getattr__(self, name):
+        if name in ('m', 'f', 'w') and self.__dict__.get('closed'):
+            raise ValueError("the dataset has been closed")
+        if name in ('m', 'f'):
+            self._map()
+        elif name == 'w':
+            self._mapw()
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    def _map(self):
+        meg4name = self.meg4name
+
+        # The samples are big-endian; numpy converts them as they are read.
+        self.m = openMeg4(meg4name, self.T, self.C, self.S, '>i4', 'r')
+
+        # Use a float32 copy of the data, if requested.
+
+        self.f = None
+        sidecar = self.sidecar
+        if sidecar:
+            cachedir = None
+            if type(sidecar) == str:
+                cachedir = sidecar
+            self.f = openSidecar(self.r, meg4name, cachedir)
+
+    def _mapw(self):
+        # w has the same dtype either way; if the file can't be written
+        # it's mapped read-only, and assigning to it raises ValueError.
+
         try:
-            self.w = np.memmap(meg4name, dtype = 'int32', mode = 'r+',
-                shape = (self.T, self.C, self.S), offset = len(MEG4HDR))
+            self.w = openMeg4(self.meg4name, self.T, self.C, self.S, 'int32', 'r+')
         except PermissionError as e:
             print("[pyctf] Note: .meg4 file is read-only", file = sys.stderr)
-            self.w = self.m
+            self.w = openMeg4(self.meg4name, self.T, self.C, self.S, 'int32', 'r')
 
     def close(self):
-        # call this to release the memory
-        del self.w
-        del self.m
+        # call this to release the memory; the data can't be used after
+        for name in ('w', 'm', 'f'):
+            self.__dict__.pop(name, None)
+        self.closed = True
+
+    def readInto(self, tr, idx, start, n, out, demean = True):
+        """Convert n samples of channels idx of trial tr, starting at
+        sample start, into the preallocated array out, which must be
+        float64 or float32 with shape (len(idx), n), or (n,) if idx is a
+        single channel. idx may be an int, a slice, or a list of channel
+        indices. The big-endian samples are scaled to Tesla in a single
+        pass, and if demean is true the mean is then removed from each
+        channel in place. Returns out."""
+
+        idx = chanSlice(idx, self.C)
+        if self.f is not None:
+            np.copyto(out, self.f[tr, idx, start : start + n], casting = 'unsafe')
+        else:
+            a = self.m[tr, idx, start : start + n]
+            g = self.r.chanGain[idx]
+            if a.ndim == 1:
+                g = g[0]
+            np.multiply(a, g, out = out, dtype = out.dtype, casting = 'unsafe')
+        if demean:
+            out -= out.mean(axis = -1, keepdims = True)
+        return out
+
+    def readContinuous(self, sample0, n, idx, out, demean = True):
+        """Like readInto(), but treat the trials as one continuous run
+        of T * S samples, and read n samples starting at sample0 of the
+        run. The segment may span trial boundaries; each trial's part is
+        converted directly into out."""
+
+        S = self.S
+        if sample0 < 0 or sample0 + n > self.T * S:
+            raise ValueError("samples {} to {} out of range".format(sample0, sample0 + n))
+        t = 0
+        while t < n:
+            tr, s = divmod(sample0 + t, S)
+            k = min(n - t, S - s)
+            self.readInto(tr, idx, s, k, out[..., t : t + k], False)
+            t += k
+        if demean:
+            out -= out.mean(axis = -1, keepdims = True)
+        return out
+
+    def getEpochs(self, seglist, seglen, idx, out, demean = True):
+        """Read the segments in seglist, a list of (tr, s) pairs as made
+        by get_segment_list(), from channels idx into out, an array of
+        shape (len(seglist), len(idx), seglen). The raw samples are
+        gathered in trial order, then byteswapped and scaled to Tesla
+        in a single pass over the whole block. Segments may cross trial
+        boundaries. If demean is true the mean is removed from each
+        channel of each epoch. Returns out."""
+
+        # chanSlice() checks the indices, and makes them non-negative.
+
+        idx = chanSlice(idx, self.C)
+        if type(idx) == int:
+            idx = range(self.C)[idx]
+            idx = slice(idx, idx + 1)
+        S = self.S
+        order = sorted(range(len(seglist)), key = lambda k: seglist[k])
+        src = self.f
+        if src is None:
+            src = self.m
+            dst = np.empty(out.shape, dtype = src.dtype)
+        else:
+            dst = out
+
+        take = type(idx) == list and dst.dtype == src.dtype
+        for k in order:
+            tr, s = seglist[k]
+            s0 = tr * S + s
+            if s0 < 0 or s0 + seglen > self.T * S:
+                raise ValueError("segment ({}, {}) out of range".format(tr, s))
+            t = 0
+            while t < seglen:
+                tr, s = divmod(s0 + t, S)
+                n = min(seglen - t, S - s)
+                if take:
+                    np.take(src[tr, :, s : s + n], idx, axis = 0,
+                            out = dst[k, :, t : t + n], mode = 'raise')
+                else:
+                    dst[k, :, t : t + n] = src[tr, idx, s : s + n]
+                t += n
+
+        if src is self.m:
+            g = self.r.chanGain[idx]
+            np.multiply(dst, g, out = out, dtype = out.dtype, casting = 'unsafe')
+        if demean:
+            out -= out.mean(axis = -1, keepdims = True)
+        return out
+
+    def nsamp(self, start, n):
+        """Return the number of samples read from start, where n == 0
+        means to the end of the trial."""
+
+        if n == 0:
+            n = self.S
+        return len(range(self.S)[start : start + n])
+
+    def mkout(self, idx, n, dtype = None):
+        """Return an uninitialized output array for readInto()."""
+
+        if dtype is None:
+            dtype = self.dtype
+        idx = chanSlice(idx, self.C)
+        if type(idx) == int:
+            return np.empty((n,), dtype = dtype)
+        if type(idx) == slice:
+            return np.empty((len(range(self.C)[idx]), n), dtype = dtype)
+        return np.empty((len(idx), n), dtype = dtype)
+
+    def _read(self, tr, idx, start, n, demean):
+        if self.f is not None and self.dtype == self.f.dtype:
+            # The sidecar slice needs no conversion.
+            if n == 0:
+                n = self.r.numSamples
+            a = self.f[tr, chanSlice(idx, self.C), start : start + n]
+            if demean:
+                return a - a.mean(axis = -1, keepdims = True)
+            return a
+        n = self.nsamp(start, n)
+        return self.readInto(tr, idx, start, n, self.mkout(idx, n), demean)
 
     def getRawSegment(self, tr, ch, start = 0, n = 0):
         """Read a segment of data from trial tr channel ch."""
 
-        if n == 0:
-            n = self.r.numSamples
-        a = self.m[tr, ch, start : start + n]
-        s = a.byteswap() * self.r.chanGain[ch]
-        return s
+        return self._read(tr, ch, start, n, False)
 
     def getSegment(self, tr, ch, start = 0, n = 0):
         """Read a segment of MEG data from trial tr channel ch. Return a
         numpy array with units of Tesla. The mean is removed."""
 
-        if n == 0:
-            n = self.r.numSamples
-        a = self.m[tr, ch, start : start + n]
-        s = a.byteswap() * self.r.chanGain[ch]
-        return s - s.mean()
+        return self._read(tr, ch, start, n, True)
 
     def getArray(self, tr, ch, nch, start, n):
         """Return an array of data from channels ch:ch+nch of trial tr. The
         mean is removed from each channel."""
 
-        a = self.m[tr, ch : ch + nch, start : start + n]
-        s = a.byteswap() * self.r.chanGain[ch : ch + nch]
-        sm = s.mean(axis = 1)
-        sm.shape += (1,)    # make it a column array
-        return s - sm
+        return self._read(tr, slice(ch, ch + nch), start, n, True)
 
     def getRefArray(self, tr, start = 0, n = 0):
         """Return an array of data from all reference channels of trial tr."""
@@ -76,16 +233,187 @@ class dsData(object):
         """Return an array of data from channels [idx] of trial tr. The
         mean is removed from each channel."""
 
-        if n == 0:
-            n = self.r.numSamples
-        a = self.m[tr, idx, start : start + n]
-        s = a.byteswap() * self.r.chanGain[idx]
-        sm = s.mean(axis = 1)
-        sm.shape += (1,)    # make it a column array
-        return s - sm
+        return self._read(tr, idx, start, n, True)
 
 #    def getArray(self, tr, ch, nch, start, n):
 #        """Return an array of data from channels ch:ch+nch of trial tr. The
 #        mean is removed from each channel."""
 #
 #        return self.getIdxArray(tr, range(ch, ch + nch), start, n)
+
+# Datasets larger than 2 GB are split into several files, name.meg4,
+# name.1_meg4, name.2_meg4, etc. Each file has its own header and holds
+# a whole number of trials.
+
+MEG4MAX = 2**31 - 1         # the largest a .meg4 file can be
+
+def meg4Files(meg4name):
+    """Return the list of .meg4 files that make up a dataset."""
+
+    l = [meg4name]
+    base = os.path.splitext(meg4name)[0]
+    i = 1
+    while True:
+        name = '{}.{}_meg4'.format(base, i)
+        if not os.access(name, os.F_OK):
+            break
+        l.append(name)
+        i += 1
+    return l
+
+def openMeg4(meg4name, T, C, S, dtype, mode):
+    """Return a (T, C, S) array view of the dataset's .meg4 file(s).
+    For a single file this is just a memmap, otherwise it's a meg4Array."""
+
+    names = meg4Files(meg4name)
+    if len(names) == 1:
+        return np.memmap(meg4name, dtype = dtype, mode = mode,
+            shape = (T, C, S), offset = len(MEG4HDR))
+    return meg4Array(names, T, C, S, dtype, mode)
+
+class meg4Array(object):
+    """A virtual (T, C, S) array that stitches together the memmaps of
+    a multi-file dataset. It's indexed like the memmap of a single file,
+    [tr, ch, samp], and with an integer trial the result is a view of
+    the file that holds that trial."""
+
+    def __init__(self, names, T, C, S, dtype, mode):
+        self.shape = (T, C, S)
+        self.ndim = 3
+        self.dtype = np.dtype(dtype)
+        trsize = C * S * self.dtype.itemsize
+        self.maps = []
+        self.first = []     # first trial in each file
+        t = 0
+        for name in names:
+            nt = (os.stat(name).st_size - len(MEG4HDR)) // trsize
+            nt = min(nt, T - t)
+            if nt <= 0:
+                break
+            self.maps.append(np.memmap(name, dtype = dtype, mode = mode,
+                shape = (nt, C, S), offset = len(MEG4HDR)))
+            self.first.append(t)
+            t += nt
+        if t != T:
+            raise ValueError("the .meg4 files contain {} of {} trials".format(t, T))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _locate(self, tr):
+        if tr < 0:
+            tr += self.shape[0]
+        if tr < 0 or tr >= self.shape[0]:
+            raise IndexError("trial {} out of range".format(tr))
+        i = np.searchsorted(self.first, tr, side = 'right') - 1
+        return self.maps[i], tr - self.first[i]
+
+    def __getitem__(self, key):
+        if type(key) != tuple:
+            key = (key,)
+        tr = key[0]
+        if isinstance(tr, (int, np.integer)):
+            m, t = self._locate(int(tr))
+            return m[(t,) + key[1:]]
+
+        # Several trials; this makes a copy.
+
+        trs = range(self.shape[0])[tr] if type(tr) == slice else tr
+        return np.stack([self[(t,) + key[1:]] for t in trs])
+
+    def __setitem__(self, key, val):
+        if type(key) != tuple:
+            key = (key,)
+        m, t = self._locate(int(key[0]))
+        m[(t,) + key[1:]] = val
+
+# Fancy indexing the memmap makes a copy. A run of consecutive channel
+# indices is converted into a slice, which doesn't.
+
+def chanSlice(idx, C):
+    """Convert a list of consecutive channel indices into a slice. Other
+    lists, arrays, and boolean masks are converted into a list of
+    channel indices in [0, C), with negative indices counting from the
+    end as usual; out of range indices raise IndexError. Ints and slices
+    are returned unchanged."""
+
+    if isinstance(idx, (int, np.integer)) and not isinstance(idx, bool):
+        return int(idx)
+    if type(idx) == slice:
+        return idx
+    a = np.asarray(idx)
+    if a.ndim == 0:
+        return int(a)
+    if a.size == 0:
+        return []
+    idx = np.arange(C)[a].tolist()
+    if idx == list(range(idx[0], idx[0] + len(idx))):
+        return slice(idx[0], idx[0] + len(idx))
+    return idx
+
+# A sidecar file is a native-endian float32 copy of the .meg4 data, already
+# scaled to Tesla, so that reading it is a plain mmap slice. It's described
+# by a .json file that records the sizes and mtimes of the .meg4 files it was
+# made from; if any of them change, the sidecar is remade.
+
+def sidecarName(meg4name, cachedir = None):
+    """Return the name of the sidecar for meg4name. If cachedir is None,
+    the sidecar goes next to the .meg4 file."""
+
+    if cachedir is None:
+        return os.path.splitext(meg4name)[0] + SIDECAREXT
+    path = os.path.abspath(meg4name)
+    h = hashlib.sha1(bytes(path, 'utf8')).hexdigest()
+    name = os.path.splitext(os.path.basename(meg4name))[0]
+    return os.path.join(cachedir, '{}-{}{}'.format(name, h, SIDECAREXT))
+
+def _sidecarMeta(r, meg4name):
+    st = [os.stat(name) for name in meg4Files(meg4name)]
+    return {'meg4': os.path.abspath(meg4name),
+            'size': [x.st_size for x in st],
+            'mtime': [x.st_mtime for x in st],
+            'shape': [r.numTrials, r.numChannels, r.numSamples],
+            'dtype': 'float32'}
+
+def mkSidecar(r, meg4name, cachedir = None):
+    """Convert the .meg4 file into a float32 sidecar, one trial at a time.
+    Returns the name of the sidecar."""
+
+    name = sidecarName(meg4name, cachedir)
+    if cachedir is not None:
+        os.makedirs(cachedir, exist_ok = True)
+    meta = _sidecarMeta(r, meg4name)
+    m = openMeg4(meg4name, *meta['shape'], '>i4', 'r')
+    g = r.chanGain.astype('float32')
+    buf = np.empty(meta['shape'][1:], dtype = 'float32')
+
+    # Write to a temporary file and rename it, so that a partially
+    # written sidecar is never used.
+
+    tmp = '{}.{}'.format(name, os.getpid())
+    with open(tmp, 'wb') as f:
+        for tr in range(r.numTrials):
+            np.multiply(m[tr], g, out = buf, dtype = 'float32', casting = 'unsafe')
+            buf.tofile(f)
+    del m
+    os.replace(tmp, name)
+    with open(name + '.json', 'w') as f:
+        f.write(json.dumps(meta, indent = 4))
+
+    return name
+
+def openSidecar(r, meg4name, cachedir = None):
+    """Return a memmap of the float32 sidecar for meg4name, creating it
+    first if it doesn't exist or doesn't match the .meg4 file."""
+
+    name = sidecarName(meg4name, cachedir)
+    meta = _sidecarMeta(r, meg4name)
+    try:
+        with open(name + '.json') as f:
+            valid = json.loads(f.read()) == meta
+    except (FileNotFoundError, ValueError):
+        valid = False
+    if not valid:
+        mkSidecar(r, meg4name, cachedir)
+    return np.memmap(name, dtype = 'float32', mode = 'r',
+        shape = tuple(meta['shape']))
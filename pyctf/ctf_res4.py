@@ -1,3 +1,5 @@
+import os
+from copy import copy, deepcopy
 from struct import Struct
 import numpy as np
 
@@ -91,6 +93,31 @@ CoilRec = Struct(""">
  cr_nturns, cr_area
 ) = range(8)
 
+# The same records as numpy dtypes, so that a whole block of them can
+# be parsed with a single read. The field names match the sr_ and cr_
+# indices, and .tolist() gives the same tuples as Struct.unpack().
+
+SensorResDtype = np.dtype([
+    ('type', '>i2'), ('runNum', '>i2'), ('shape', '>i4'),
+    ('properGain', '>f8'), ('qGain', '>f8'), ('ioGain', '>f8'), ('ioOffset', '>f8'),
+    ('numCoils', '>i2'), ('gradOrder', '>i2'), ('stimPol', '>i4')
+])
+
+CoilRecDtype = np.dtype({
+    'names': ['x', 'y', 'z', 'nx', 'ny', 'nz', 'nturns', 'area'],
+    'formats': ['>f8'] * 6 + ['>i2', '>f8'],
+    'offsets': [0, 8, 16, 32, 40, 48, 64, 72],
+    'itemsize': CoilRec.size
+})
+
+ChanRecDtype = np.dtype([
+    ('sensor', SensorResDtype),
+    ('dewar', CoilRecDtype, (MAX_COILS,)),
+    ('head', CoilRecDtype, (MAX_COILS,))
+])
+
+assert SensorResDtype.itemsize == SensorRes.size
+
 # Then NumCoeffs CoeffInfo structs.
 
 MAX_BALANCING = 50
@@ -109,6 +136,14 @@ CoeffInfo = Struct(""">
  ci_coeff
 ) = range(5)
 
+CoeffInfoDtype = np.dtype({
+    'names': ['sensorName', 'type', 'ncoeff', 'sensorList', 'coeff'],
+    'formats': ['V32', 'V4', '>i2', 'V%d' % (MAX_BALANCING * SENSOR_LABEL),
+                ('>f8', (MAX_BALANCING,))],
+    'offsets': [0, 32, 40, 42, 42 + MAX_BALANCING * SENSOR_LABEL],
+    'itemsize': CoeffInfo.size
+})
+
 # Strings returned by Struct.unpack() include '\x00' bytes at the end.
 
 def nullstrip(s):
@@ -132,10 +167,60 @@ def putstruct(f, s, vl):
 # Read the structs from a res4 file into a res4data container.
 
 class res4data:
-    pass
 
-def read_res4_structs(res4name):
-    """Low level .res4 file access."""
+    # r.sensRes is made from the channel records when first used. In a
+    # lazy container, the balancing coefficients are also not read
+    # from the file until they are needed.
+
+    def __getattr__(self, name):
+        d = self.__dict__
+        if name == 'sensRes' and 'chanRec' in d:
+            make_sensRes(self)
+            return self.sensRes
+        if d.get('_lazy') and name in ('coeffInfo', 'coeff'):
+            d['_lazy'] = False
+            with open(d['_res4name'], 'rb') as f:
+                f.seek(d['_coeffOffset'])
+                read_coeff_structs(f, self)
+            if self.numRefs > 0:
+                fmt_coeff(self)
+            return getattr(self, name)
+        raise AttributeError(name)
+
+def getarray(f, dtype, n):
+    """Read n records of the given dtype from file f, all at once."""
+
+    a = np.frombuffer(f.read(dtype.itemsize * n), dtype)
+    if len(a) != n:
+        raise RuntimeError("short .res4 file")
+    return a
+
+def read_sensor_structs(f, r):
+    """Read the SensorRes and coil records for each channel, into the
+    structured array r.chanRec."""
+
+    M = r.genRes[gr_numChannels]
+    r.chanRec = getarray(f, ChanRecDtype, M)
+    r.sensorRes = r.chanRec['sensor'].tolist()
+
+def make_sensRes(r):
+    """Make the list of (SensorRes, dewar CoilRecs, head CoilRecs)
+    tuples from r.chanRec."""
+
+    crd = r.chanRec['dewar'].tolist()
+    crh = r.chanRec['head'].tolist()
+    r.sensRes = list(zip(r.sensorRes, crd, crh))
+
+def read_coeff_structs(f, r):
+    """Read the balancing coefficients."""
+
+    n = getstruct(f, NumCoeffs)[0]
+    a = getarray(f, CoeffInfoDtype, n)
+    r.coeffInfo = [ci[:ci_coeff] + tuple(ci[ci_coeff]) for ci in a.tolist()]
+
+def read_res4_structs(res4name, lazy = False):
+    """Low level .res4 file access. If lazy is true, the balancing
+    coefficients are read on first access."""
 
     f = open(res4name, 'rb')
     s = f.read(8)
@@ -156,30 +241,7 @@ def read_res4_structs(res4name):
         filterInfo[i] = (fi, fp)
 
     M = gr[gr_numChannels]
-    chanName = [None] * M
-    for i in range(M):
-        s = getstruct(f, ChannelName)
-        chanName[i] = nullstrip(s[0])
-
-    sensRes = [None] * M
-    for i in range(M):
-        sr = getstruct(f, SensorRes)
-        crd = [None] * MAX_COILS
-        crh = [None] * MAX_COILS
-        # dewar coords
-        for j in range(MAX_COILS):
-            crd[j] = getstruct(f, CoilRec)
-        # head coords
-        for j in range(MAX_COILS):
-            crh[j] = getstruct(f, CoilRec)
-        sensRes[i] = (sr, crd, crh)
-
-    n = getstruct(f, NumCoeffs)[0]
-    coeffInfo = [None] * n
-    for i in range(n):
-        coeffInfo[i] = getstruct(f, CoeffInfo)
-
-    f.close()
+    chanName = [nullstrip(s) for s in getarray(f, np.dtype('S32'), M).tolist()]
 
     # Collect everything into a res4data container.
 
@@ -188,8 +250,16 @@ def read_res4_structs(res4name):
     r.runDesc = runDesc
     r.filterInfo = filterInfo
     r.chanName = chanName
-    r.sensRes = sensRes
-    r.coeffInfo = coeffInfo
+
+    read_sensor_structs(f, r)
+    if lazy:
+        r._lazy = True
+        r._res4name = res4name
+        r._coeffOffset = f.tell()
+    else:
+        read_coeff_structs(f, r)
+
+    f.close()
 
     return r
 
@@ -236,9 +306,39 @@ def fmtChanName(name):
     """Remove the -xxxx from a channel name."""
     return name.decode("utf-8").split('-')[0]
 
-# Read a .res4 file and format the info to be more usable.
-
-def readRes4(res4name):
+# Parsed headers, so that opening the same dataset again (e.g. in
+# a batch job) can skip parsing. The entries are keyed by pathname,
+# and are only used if the file's size and mtime haven't changed.
+
+RES4CACHESIZE = 32
+_res4cache = {}
+
+# The lists and dicts of strings, ints, and tuples only need a shallow
+# copy, and sensRes is remade from chanRec when it's used.
+
+_SHALLOW = ('chanName', 'chanFname', 'chanIndex', 'chanType', 'sensorRes',
+            'coeffInfo')
+
+def _copyres4(r):
+    """Return a copy of the container r that shares nothing mutable."""
+
+    c = res4data()
+    for name, v in r.__dict__.items():
+        if name == 'sensRes':
+            continue
+        if name in _SHALLOW:
+            v = copy(v)
+        elif name == 'coeff':
+            v = [ci[:ci_sensorList] + [list(ci[ci_sensorList])] + ci[ci_sensorList + 1:]
+                 for ci in v]
+        elif isinstance(v, np.ndarray):
+            v = v.copy()
+        else:
+            v = deepcopy(v)
+        c.__dict__[name] = v
+    return c
+
+def readRes4(res4name, lazy = False, cache = False):
     """Read a CTF format .res4 file. The information is made
     available in the returned container; with r = readRes4(name),
         r.numTrials     Number of trials.
@@ -256,15 +356,44 @@ def readRes4(res4name):
         r.numRefs       Number of reference channels.
         r.coeff         Re-formatted balancing coefficients.
 
+        r.numCoils      Numpy array of the number of coils per channel.
+        r.coilPos       Coil positions, (numChannels, MAX_COILS, 3),
+        r.coilNorm      and normals, in dewar coordinates.
+        r.headCoilPos   The same, in head coordinates.
+        r.headCoilNorm
+        r.coilArea      Coil areas, (numChannels, MAX_COILS).
+        r.coilTurns     Number of turns for each coil.
+
         r.genRes        raw GenRes struct
         r.runDesc       run description
         r.filterInfo    filter info
-        r.sensRes       raw SensorRes structs
+        r.chanRec       structured array of channel records
+        r.sensorRes     raw SensorRes structs
+        r.sensRes       raw SensorRes structs with coil records
         r.coeffInfo     balancing coefficients
+
+    If lazy is true, r.coeffInfo and r.coeff are not read until they
+    are first used.
+
+    If cache is true, the parsed header is saved, and later calls with
+    the same name return a copy of it for as long as the file is
+    unchanged (its size and modification time are the same).
     """
 
+    if cache:
+        st = os.stat(res4name)
+        key = os.path.abspath(res4name)
+        stamp = (st.st_size, st.st_mtime_ns)
+        ent = _res4cache.pop(key, None)
+        if ent is None or ent[0] != stamp:
+            ent = (stamp, readRes4(res4name))
+            if len(_res4cache) >= RES4CACHESIZE:
+                del _res4cache[next(iter(_res4cache))]  # the oldest
+        _res4cache[key] = ent   # now the newest
+        return _copyres4(ent[1])
+
     # Fill in raw .res4 structs.
-    r = read_res4_structs(res4name)
+    r = read_res4_structs(res4name, lazy)
 
     # Extract a few common fields.
 
@@ -277,44 +406,51 @@ def readRes4(res4name):
 
     # Format the channel names and create an index to the channel number.
 
-    r.chanFname = [None] * M
-    r.chanIndex = {}
-    for i in range(M):
-        name = fmtChanName(r.chanName[i])
-        r.chanFname[i] = name
-        r.chanIndex[name] = i
+    r.chanFname = [fmtChanName(name) for name in r.chanName]
+    r.chanIndex = {name: i for i, name in enumerate(r.chanFname)}
 
     # Channel types.
 
-    r.firstPrimary = None
-    r.numPrimaries = 0
-    r.firstRef = None
-    r.numRefs = 0
+    sr = r.chanRec['sensor']
+    typ = sr['type']
+    r.chanType = typ.tolist()
 
-    r.chanType = [None] * M
-
-    for i in range(M):
-        r.chanType[i] = r.sensRes[i][0][sr_type]
-        if r.chanType[i] == TYPE_MEG:
-            if r.firstPrimary is None:
-                r.firstPrimary = i
-            r.numPrimaries += 1
-        elif r.chanType[i] == TYPE_REF_MAG or r.chanType[i] == TYPE_REF_GRAD:
-            if r.firstRef is None:
-                r.firstRef = i
-            r.numRefs += 1
+    pri = np.flatnonzero(typ == TYPE_MEG)
+    ref = np.flatnonzero((typ == TYPE_REF_MAG) | (typ == TYPE_REF_GRAD))
+    r.numPrimaries = len(pri)
+    r.firstPrimary = int(pri[0]) if len(pri) else None
+    r.numRefs = len(ref)
+    r.firstRef = int(ref[0]) if len(ref) else None
 
     # A column array of channel gains.
 
-    r.chanGain = np.zeros((M, 1))
-    for i in range(M):
-        sr = r.sensRes[i][0]
-        r.chanGain[i] = 1. / (sr[sr_properGain] * sr[sr_qGain] * sr[sr_ioGain])
+    g = sr['properGain'] * sr['qGain'] * sr['ioGain']
+    r.chanGain = (1. / g).reshape((M, 1))
+
+    # Coil geometry.
+
+    def xyz(c, a, b, d):
+        return np.stack((c[a], c[b], c[d]), axis = -1).astype(float)
+
+    crd = r.chanRec['dewar']
+    crh = r.chanRec['head']
+    r.numCoils = sr['numCoils'].astype(int)
+    r.coilPos = xyz(crd, 'x', 'y', 'z')
+    r.coilNorm = xyz(crd, 'nx', 'ny', 'nz')
+    r.headCoilPos = xyz(crh, 'x', 'y', 'z')
+    r.headCoilNorm = xyz(crh, 'nx', 'ny', 'nz')
+    r.coilArea = crd['area'].astype(float)
+    r.coilTurns = crd['nturns'].astype(int)
 
     # Balancing coefficients. Don't bother if there are no references.
 
-    if r.numRefs == 0:
-        return r
+    if r.numRefs > 0 and not lazy:
+        fmt_coeff(r)
+
+    return r
+
+def fmt_coeff(r):
+    """Re-format the balancing coefficients into r.coeff."""
 
     n = len(r.coeffInfo)
     r.coeff = [None] * n
@@ -333,5 +469,3 @@ def readRes4(res4name):
         ci[ci_sensorList] = cl
         # ...
         #r.__dict__['G3BR'] = refvec
-
-    return r
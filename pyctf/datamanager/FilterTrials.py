@@ -22,6 +22,9 @@ class FilterTrials(object):
         filt is a pyctf.samiir filter object for use with dofilt().
         If filt is None create a default filter from the band.
 
+        The cached trials are complex64 if the dataset was opened
+        with dtype = 'float32', complex128 otherwise.
+
         cachename is the name of the file used to cache the data,
         default 'cache.h5' in the current directory. meta is a list
         if metadata that identifies the cache slot to use."""
@@ -31,6 +34,7 @@ class FilterTrials(object):
         lo, hi = band
         self.M = ds.getNumberOfPrimaries()
         self.nsamp = ds.getNumberOfSamples()
+        self.dtype = np.result_type(ds.dtype, np.complex64)
 
         # @@@ all this noise goes in a CacheManager
 
@@ -66,9 +70,8 @@ class FilterTrials(object):
         cname = 'tr{}'.format(trial)
         h = c[key, cname]
         if h is None:
-            h = np.empty((M, n), dtype = 'complex128')
-            x = ds.getPriArray(tr, start, n)
-            for m in range(M):
-                h[m, :] = dofilt(x[m], filt)
+            h = np.empty((M, n), dtype = self.dtype)
+            x = ds.getPriArray(trial, start, n)
+            h[...] = dofilt(x, filt)
             c[key, cname] = h
         return h
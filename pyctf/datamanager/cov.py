@@ -10,7 +10,7 @@ class Cov:
 
         ds = p.get('ds')
         M = ds.getNumberOfPrimaries()
-        self.C = np.zeros((M, M))
+        self.C = np.zeros((M, M), dtype = ds.dtype)
 
 
 
@@ -21,9 +21,12 @@ class Cov:
 slist, slen = get_segment_list(ds, mark, t0, t1)
 print("Marker '{}': {} segments of {} samples".format(mark, len(slist), slen))
 
-def cov(ds, slist, slen, filt):
+def cov(ds, slist, slen, filt, continuous = False):
     M = ds.getNumberOfPrimaries()
-    C = np.zeros((M, M))
+    C = np.zeros((M, M), dtype = ds.dtype)
+    S = ds.getNumberOfSamples()
+    T = ds.getNumberOfTrials()
+    pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + M)
     theTr = None
 
     if wlen < slen:
@@ -33,12 +36,19 @@ def cov(ds, slist, slen, filt):
     offset = int((wlen - slen) / 2 + .5)
     for tr, s in slist:
         a = s - offset
-        if a < 0:
+        if continuous:
+            # The window may cross trial boundaries, but not the run's.
+            a += tr * S
+            if a < 0 or a + wlen > T * S:
+                print("warning: ignoring s = {}".format(s))
+                continue
+            x = ds.readContinuous(a, wlen, pri)
+        elif a < 0:
             print("warning: ignoring s = {}".format(s))
             continue
-        x = ds.getPriArray(tr, a, wlen)
-        for m in range(M):
-            x[m, :] = dofilt(x[m], filt)
+        else:
+            x = ds.getPriArray(tr, a, wlen)
+        x = dofilt(x, filt)
         d = x[:, offset : offset + slen]
         C += d.dot(d.T)
     C /= len(slist) * slen
@@ -0,0 +1,263 @@
+"""A view of a dataset at a lower (or any rational) sample rate."""
+
+import os, shutil
+from copy import copy
+from math import gcd
+import numpy as np
+from . import ctf_res4 as ctf
+from .samiir import resample
+from .dsWriter import dsWriter
+
+# Channels whose values are codes, which are picked, not filtered.
+
+DIGITAL = (ctf.TYPE_TRIGGER, ctf.TYPE_UPPT)
+
+# Things of the dataset that give data at the original rate, and aren't
+# reimplemented here.
+
+FULLRATE = ('dsData', 'getDsRawData', 'getDsRawSegment')
+
+class decimated:
+
+    def __init__(self, ds, down, up = 1, continuous = False, ntaps = 0):
+        """d = decimated(ds, down, up = 1, continuous = False, ntaps = 0)
+        Make a view of the open dataset ds resampled by up / down (e.g.
+        ds.decimate(10) for 1/10 the sample rate) with samiir.resample(),
+        which lowpass filters the data below the new Nyquist frequency.
+        The data are read and resampled on demand, a window at a time.
+
+        The samples are placed so that the trigger (t = 0) falls on a
+        sample, so marker times are unchanged. The trials are resampled
+        independently, with the ends extended by reflection. If
+        continuous is true, the trials are taken to be back to back (as
+        in a continuous recording), and the data on either side of a
+        trial are used near its ends; then the new number of samples per
+        trial must be a whole number. Trigger and parallel port channels
+        are not filtered; the nearest sample is used.
+
+        d.r is a copy of ds.r, with the new sample rate, samples per
+        trial, and pre-trigger samples, and d has the time and data
+        access methods of ds for the new rate. d.write(dsname) writes a
+        new dataset."""
+
+        if down <= 0 or up <= 0:
+            raise ValueError("up and down must be positive")
+        g = gcd(up, down)
+        self.ds = ds
+        self.up = up // g
+        self.down = down // g
+        self.ntaps = ntaps if ntaps > 0 else 20 * max(self.up, self.down) + 1
+        self.margin = (self.ntaps + self.up - 1) // self.up + 1
+        self.continuous = continuous
+
+        # Output sample m of a trial is at input sample (m down + offset) / up,
+        # and the trigger sample is one of them.
+
+        S = ds.getNumberOfSamples()
+        pt = ds.getPreTrigSamples() * self.up
+        self.offset = pt % self.down
+        self.S = S
+        self.numSamples = ((S - 1) * self.up - self.offset) // self.down + 1
+        if continuous and S * self.up != self.numSamples * self.down:
+            raise ValueError("{} samples per trial can't be resampled by {} / {} continuously".format(S, self.up, self.down))
+
+        gr = list(ds.r.genRes)
+        gr[ctf.gr_sampleRate] = gr[ctf.gr_sampleRate] * self.up / self.down
+        gr[ctf.gr_numSamples] = self.numSamples
+        gr[ctf.gr_preTrig] = (pt - self.offset) // self.down
+        gr[ctf.gr_epochTime] = self.numSamples / gr[ctf.gr_sampleRate] * gr[ctf.gr_numTrials]
+        self.r = copy(ds.r)
+        self.r.genRes = gr
+        self.r.numSamples = self.numSamples
+
+        typ = np.array(ds.r.chanType)
+        self.digital = np.isin(typ, DIGITAL)
+
+    def __getattr__(self, name):
+        # Everything that doesn't depend on the sample rate.
+        if name in FULLRATE:
+            raise AttributeError("{} is not available at the new sample rate".format(name))
+        return getattr(self.ds, name)
+
+    def getSampleRate(self):
+        """Return the new sample rate in Hz."""
+        return self.r.genRes[ctf.gr_sampleRate]
+
+    def getNumberOfSamples(self):
+        """Return the new number of samples per trial."""
+        return self.numSamples
+
+    def getPreTrigSamples(self):
+        """Return the new number of samples in the pre-trigger interval."""
+        return self.r.genRes[ctf.gr_preTrig]
+
+    def getTimePt(self, samp):
+        """Convert a sample number within a trial to a time in seconds."""
+        return float(samp - self.getPreTrigSamples()) / self.getSampleRate()
+
+    def getSampleNo(self, t):
+        """Convert a time in seconds to a relative sample number."""
+        t += self.getPreTrig()
+        return int(np.floor(t * self.getSampleRate() + .5))
+
+    def getPreTrig(self):
+        """Return the pretrigger length in seconds."""
+        return self.getPreTrigSamples() / self.getSampleRate()
+
+    def window(self, q0, n, idx, lo, hi, read):
+        """Return output samples q0 to q0 + n of channels [idx], where
+        output sample q is at input sample (q down + offset) / up, from
+        the input samples in [lo, hi), which are read with read(s, k)."""
+
+        up, down = self.up, self.down
+        p0 = q0 * down + self.offset
+        p1 = (q0 + n - 1) * down + self.offset
+        a = max(lo, p0 // up - self.margin)
+        b = min(hi, p1 // up + self.margin + 1)
+        x = read(a, b - a)
+        y = resample(x, up, down, offset = p0 - a * up, ntaps = self.ntaps)[..., :n]
+
+        # Pick the nearest samples of the digital channels.
+
+        dig = self.digital[idx]
+        if np.any(dig):
+            s = ((np.arange(n) * down + p0 - a * up) * 2 + up) // (2 * up)
+            if y.ndim == 1:
+                y[:] = x[np.minimum(s, b - a - 1)]
+            else:
+                y[dig] = x[dig][:, np.minimum(s, b - a - 1)]
+        return y
+
+    def nsamp(self, start, n):
+        if n <= 0:
+            n = self.numSamples - start
+        if start < 0 or start + n > self.numSamples:
+            raise ValueError("segment is outside the trial")
+        return n
+
+    def finish(self, y, out, demean, dtype):
+        if demean:
+            y -= y.mean(axis = -1, keepdims = True)
+        if out is None:
+            return y.astype(dtype or self.ds.dtype, copy = False)
+        out[...] = y
+        return out
+
+    def readInto(self, tr, idx, start = 0, n = 0, out = None, demean = True,
+                 dtype = None):
+        """Read n samples starting at start from channels [idx] of trial
+        tr, at the new rate; the arguments are as for ds.readInto()."""
+
+        n = self.nsamp(start, n)
+        S = self.S
+        if self.continuous:
+            T = self.ds.getNumberOfTrials()
+            y = self.window(tr * self.numSamples + start, n, idx, 0, T * S,
+                lambda s, k: self.ds.readContinuous(s, k, idx, demean = False,
+                                                    dtype = 'float64'))
+        else:
+            y = self.window(start, n, idx, 0, S,
+                lambda s, k: self.ds.readInto(tr, idx, s, k, demean = False,
+                                              dtype = 'float64'))
+        return self.finish(y, out, demean, dtype)
+
+    def readContinuous(self, sample0, n, idx, out = None, demean = True,
+                       dtype = None):
+        """Read n samples from channels [idx], starting at sample0 of the
+        whole run at the new rate, as for ds.readContinuous(). The view
+        must have been made with continuous = True."""
+
+        if not self.continuous:
+            raise ValueError("not a continuous view")
+        T = self.ds.getNumberOfTrials()
+        y = self.window(sample0, n, idx, 0, T * self.S,
+            lambda s, k: self.ds.readContinuous(s, k, idx, demean = False,
+                                                dtype = 'float64'))
+        return self.finish(y, out, demean, dtype)
+
+    def getRefArray(self, tr, start = 0, n = 0):
+        """Return an array of data from all reference channels of trial tr."""
+        r = self.r
+        return self.readInto(tr, slice(r.firstRef, r.firstRef + r.numRefs), start, n)
+
+    def getPriArray(self, tr, start = 0, n = 0):
+        """Return an array of data from all primary channels of trial tr."""
+        r = self.r
+        return self.readInto(tr, slice(r.firstPrimary, r.firstPrimary + r.numPrimaries), start, n)
+
+    def getIdxArray(self, tr, idx, start = 0, n = 0):
+        """Return an array of data from channels [idx] of trial tr. The
+        mean is removed from each channel."""
+        return self.readInto(tr, idx, start, n)
+
+    def getDsData(self, tr, ch):
+        """Return trial tr from channel ch, the mean is removed."""
+        return self.readInto(tr, ch)
+
+    def getDsSegment(self, tr, ch, start = 0, n = 0):
+        """Return n samples starting at start from trial tr channel ch, the
+        mean is removed."""
+        return self.readInto(tr, ch, start, n)
+
+    def getEpochs(self, seglist, seglen, idx = None, out = None,
+                  demean = True, dtype = None, balance = None):
+        """Return an (nseg, nch, seglen) array of the segments in seglist
+        at the new rate; the arguments are as for ds.getEpochs(). Each
+        segment is resampled separately."""
+
+        r = self.r
+        if idx is None:
+            idx = slice(r.firstPrimary, r.firstPrimary + r.numPrimaries)
+        elif isinstance(idx, (int, np.integer)):
+            idx = [idx]
+        for i, (tr, s) in enumerate(seglist):
+            if out is None:
+                x = self.readInto(tr, idx, s, seglen, demean = demean, dtype = dtype)
+                out = np.empty((len(seglist),) + x.shape, dtype = x.dtype)
+                out[i] = x
+            else:
+                self.readInto(tr, idx, s, seglen, out[i], demean)
+        if balance is not None:
+            b = self.getBalancer(balance)
+            ref = np.empty((len(seglist), r.numRefs, seglen), dtype = out.dtype)
+            for i, (tr, s) in enumerate(seglist):
+                self.readInto(tr, b.ref, s, seglen, ref[i], demean)
+            b.apply(out, ref, idx)
+        return out
+
+    def getCov(self, seglist, seglen, idx = None, demean = True,
+               dtype = None, balance = None, block = 64):
+        """Return the covariance of channels [idx] over the segments in
+        seglist at the new rate, as for ds.getCov()."""
+
+        C = 0
+        buf = None
+        for b in range(0, len(seglist), block):
+            sl = seglist[b : b + block]
+            if buf is None:
+                buf = self.getEpochs(sl, seglen, idx, None, demean, dtype, balance)
+                x = buf
+            else:
+                x = self.getEpochs(sl, seglen, idx, buf[:len(sl)], demean,
+                                   dtype, balance)
+            C = C + np.tensordot(x, x, axes = ([0, 2], [0, 2]))
+        return C / (len(seglist) * seglen)
+
+    def write(self, dsname, step = 32):
+        """Write the resampled data as a new dataset dsname, step
+        channels at a time. The .hc file and the marks are copied."""
+
+        M = self.r.numChannels
+        with dsWriter(dsname, self.r) as w:
+            for tr in range(self.ds.getNumberOfTrials()):
+                for m in range(0, M, step):
+                    w.writeChannels(self.readInto(tr, slice(m, min(m + step, M)),
+                                                  demean = False, dtype = 'float64'))
+
+        for ext in ['.hc']:
+            name = self.ds.getDsFileNameExt(ext)
+            if os.access(name, os.F_OK):
+                shutil.copyfile(name, w.getDsFileNameExt(ext))
+        name = self.ds.getDsFileName('MarkerFile.mrk')
+        if os.access(name, os.F_OK):
+            shutil.copyfile(name, os.path.join(w.dsname, 'MarkerFile.mrk'))
@@ -0,0 +1,159 @@
+"""Write CTF datasets, a block at a time."""
+
+import os, shutil
+from copy import copy
+import numpy as np
+from . import ctf_res4 as ctf
+from .ctf_meg4 import MEG4HDR, MEG4MAX
+
+class dsWriter(object):
+
+    def __init__(self, dsname, r, maxsize = MEG4MAX):
+        """w = dsWriter(dsname, r, maxsize = MEG4MAX)
+        Create (overwrite if it exists) the dataset dsname, using the
+        .res4 container r (e.g. a modified copy of ds.r) for the header.
+        The number of channels and samples per trial come from r; the
+        number of trials is set by the data that are written.
+
+        The data are written one trial, or one block of channels of the
+        current trial, at a time, in Tesla:
+
+            w.writeTrial(x)         # x is (numChannels, numSamples)
+            w.writeChannels(x)      # x is (k, numSamples)
+            w.close()               # finish the .res4 file
+
+        Each block is quantized and written to the .meg4 file as it
+        arrives, so only one block needs to be in memory. Like CTF's
+        own datasets, the data are split into name.meg4, name.1_meg4,
+        name.2_meg4, etc., each holding as many whole trials as fit in
+        maxsize bytes (2 GB). A dsWriter can also be used in a with
+        statement, which closes it."""
+
+        dsname = os.path.expanduser(dsname)
+        if dsname[-1] == '/':
+            dsname = dsname[:-1]
+        b = os.path.basename(dsname)
+        if b[-3:] != '.ds':
+            raise ValueError("%s is not a dataset name" % dsname)
+        self.dsname = dsname
+        self.setname = b[:-3]
+
+        if os.access(dsname, os.F_OK):
+            shutil.rmtree(dsname)
+        os.mkdir(dsname)
+
+        # Keep our own copy of the header fields we change.
+
+        self.r = copy(r)
+        self.genRes = list(r.genRes)
+        self.M = self.genRes[ctf.gr_numChannels]
+        self.S = self.genRes[ctf.gr_numSamples]
+
+        # Samples (int32) = data (Tesla) * scale.
+
+        scale = np.zeros((self.M, 1))
+        for i in range(self.M):
+            sr = r.sensRes[i][0]
+            scale[i] = sr[ctf.sr_properGain] * sr[ctf.sr_qGain] * sr[ctf.sr_ioGain]
+        self.scale = scale
+
+        self.ntrials = 0
+        self.nch = 0            # channels written in the current trial
+        self.writeRes4()
+
+        self.maxsize = maxsize
+        self.trsize = self.M * self.S * 4
+        self.nfiles = 0
+        self.f = None
+        self.openMeg4()
+
+    def openMeg4(self):
+        """Start the next .meg4 file."""
+
+        if self.f is not None:
+            self.f.close()
+        ext = '.meg4'
+        if self.nfiles > 0:
+            ext = '.{}_meg4'.format(self.nfiles)
+        self.f = open(self.getDsFileNameExt(ext), 'wb')
+        self.f.write(bytes(MEG4HDR, 'ascii'))
+        self.size = len(MEG4HDR)
+        self.nfiles += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        if type is None:
+            self.close()
+        elif self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def getDsFileNameExt(self, ext):
+        """Formats a pathname for a dataset file from an extension."""
+        return os.path.join(self.dsname, self.setname + ext)
+
+    def writeRes4(self):
+        """(Re)write the .res4 file, with the current number of trials."""
+
+        gr = self.genRes
+        gr[ctf.gr_numTrials] = self.ntrials
+        gr[ctf.gr_epochTime] = self.S / gr[ctf.gr_sampleRate] * self.ntrials
+        self.r.genRes = gr
+        ctf.write_res4_structs(self.getDsFileNameExt('.res4'), self.r)
+
+    def writeChannels(self, x):
+        """Write the next k channels of the current trial, from the
+        (k, numSamples) array x. When all the channels have been
+        written, the next call starts a new trial."""
+
+        x = np.asarray(x)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        k = x.shape[0]
+        if x.shape[1] != self.S:
+            raise ValueError("expected {} samples, got {}".format(self.S, x.shape[1]))
+        if self.nch + k > self.M:
+            raise ValueError("too many channels for this trial")
+
+        # A new trial that won't fit goes in the next file.
+
+        if self.nch == 0 and self.size > len(MEG4HDR) and \
+           self.size + self.trsize > self.maxsize:
+            self.openMeg4()
+
+        # Round to the nearest integer, and write big-endian.
+
+        q = x * self.scale[self.nch : self.nch + k]
+        np.rint(q, out = q)
+        np.clip(q, -2**31, 2**31 - 1, out = q)
+        q.astype('>i4').tofile(self.f)
+        self.size += q.size * 4
+
+        self.nch += k
+        if self.nch == self.M:
+            self.nch = 0
+            self.ntrials += 1
+
+    def writeTrial(self, x):
+        """Write a whole trial, the (numChannels, numSamples) array x."""
+
+        if self.nch != 0:
+            raise ValueError("the current trial is incomplete")
+        x = np.asarray(x)
+        if x.shape[0] != self.M:
+            raise ValueError("expected {} channels, got {}".format(self.M, x.shape[0]))
+        self.writeChannels(x)
+
+    def close(self):
+        """Finish writing. The .res4 file is updated with the number
+        of trials actually written."""
+
+        if self.f is None:
+            return
+        if self.nch != 0:
+            raise ValueError("the last trial is incomplete")
+        self.f.close()
+        self.f = None
+        self.writeRes4()
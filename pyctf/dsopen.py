@@ -1,8 +1,11 @@
 """This is the main interface for the Python CTF library."""
 
 import sys, os, math
+import numpy as np
 from . import ctf_res4 as ctf
 from .ctf_meg4 import dsData
+from .balance import balancer
+from .decimate import decimated
 from .markers import markers
 from .getHC import getHC
 from .getHM import getHM
@@ -12,11 +15,32 @@ from .readcov import readcov as _readcov
 
 class dsopen:
 
-    def __init__(self, dsname):
+    def __init__(self, dsname, dtype = 'float64', sidecar = None,
+                 lazy = False, cache = False):
         """Create and return an open CTF dataset object.
         You may open many CTF datasets at once by creating many
         instances of this class. You must call close() or
-        delete the instance to release any array memory held."""
+        delete the instance to release any array memory held.
+
+        dtype is the floating point type of the arrays returned by
+        the data access methods; use 'float32' to halve the memory
+        used by large arrays.
+
+        If sidecar is True, or the name of a cache directory, the data
+        are read from a native-endian, pre-scaled float32 copy of the
+        .meg4 file, which is made the first time it's needed. Opening
+        the dataset with dtype = 'float32' as well lets the raw data
+        accessors return slices of the sidecar without any copying.
+
+        If lazy is true, only the header fields needed to describe the
+        dataset are read at first. The balancing coefficients (r.coeff),
+        the marks, the .hc file info (dewar, head), and the .meg4 memmaps
+        are all loaded on first use. This makes opening many datasets to
+        look at a few fields fast.
+
+        If cache is true, the parsed .res4 header is kept in memory, and
+        opening the same (unchanged) dataset again reuses it; see
+        ctf.readRes4()."""
 
         self.dsData = None      # set this now so __del__ won't complain
 
@@ -28,14 +52,17 @@ class dsopen:
             raise ValueError("%s is not a dataset name" % dsname)
         self.dsname = dsname
         self.setname = b[:-3]
+        self.dtype = np.dtype(dtype)
 
         # Open files. We allow the .meg4 file to be absent.
 
         meg4name = self.getDsFileNameExt('.meg4')
         res4name = self.getDsFileNameExt('.res4')
-        self.r = ctf.readRes4(res4name)
+        self.r = ctf.readRes4(res4name, lazy, cache)
         try:
-            self.dsData = dsData(self.r, meg4name)  # handle to open .meg4 file (mmap)
+            if lazy:
+                os.stat(meg4name)   # just check that it's there
+            self.dsData = dsData(self.r, meg4name, self.dtype, sidecar, lazy)  # handle to open .meg4 file (mmap)
         except FileNotFoundError as e:
             print("[pyctf] Note: {}".format(e), file = sys.stderr)
         except ValueError as e:
@@ -44,10 +71,30 @@ class dsopen:
         # A mapping from channel name to number, backwards compatible name.
 
         self.channel = self.r.chanIndex
+        self.balancers = {}
+
+        if not lazy:
+            self._getMarks()
+            self._getHC()
+
+    # In lazy mode, these are read when first used.
+
+    def __getattr__(self, name):
+        if name == 'marks':
+            self._getMarks()
+        elif name in ('dewar', 'dewar_to_head', 'head'):
+            self._getHC()
+        if name not in self.__dict__:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    def _getMarks(self):
 
         # Get the marks, if any.
 
-        self.marks = markers(dsname)
+        self.marks = markers(self.dsname)
+
+    def _getHC(self):
 
         # Get the dewar coordinates of the head from the .hc file, if any.
 
@@ -185,6 +232,99 @@ class dsopen:
 
         return self.dsData.getIdxArray(tr, idx, start, n)
 
+    def readInto(self, tr, idx, start = 0, n = 0, out = None, demean = True,
+                 dtype = None):
+        """Read n samples starting at start from channels [idx] of trial tr
+        into out, converting the raw samples to Tesla in a single pass. If
+        out is None a new array of the given dtype (default, the dataset's
+        dtype) is created. If demean is true the mean is removed from each
+        channel. Returns out."""
+
+        d = self.dsData
+        n = d.nsamp(start, n)
+        if out is None:
+            out = d.mkout(idx, n, dtype)
+        return d.readInto(tr, idx, start, n, out, demean)
+
+    def readContinuous(self, sample0, n, idx, out = None, demean = True,
+                       dtype = None):
+        """Read n samples from channels [idx], starting at sample0 of the
+        whole run, where the trials are taken to be back to back, so that
+        sample s of trial tr is sample0 = tr * getNumberOfSamples() + s.
+        The segment may cross trial boundaries. out and dtype are as for
+        readInto(). If demean is true the mean is removed from each
+        channel. Returns out."""
+
+        d = self.dsData
+        if out is None:
+            out = d.mkout(idx, n, dtype)
+        return d.readContinuous(sample0, n, idx, out, demean)
+
+    def getEpochs(self, seglist, seglen, idx = None, out = None,
+                  demean = True, dtype = None, balance = None):
+        """Return an (nseg, nch, seglen) array of the segments in seglist,
+        a list of (tr, s) pairs as returned by get_segment_list(), for the
+        channels [idx] (default, all the primary channels). The whole
+        block is read with a single conversion pass. out and dtype are as
+        for readInto(). If demean is true the mean is removed from each
+        channel of each epoch. If balance is a gradient order (0 to 3),
+        the primary channels are balanced to that order; the reference
+        channels are read as well, and applied with one matrix multiply."""
+
+        d = self.dsData
+        if idx is None:
+            idx = slice(self.r.firstPrimary, self.r.firstPrimary + self.r.numPrimaries)
+        elif isinstance(idx, (int, np.integer)):
+            idx = [idx]
+        if out is None:
+            x = d.mkout(idx, seglen, dtype)
+            out = np.empty((len(seglist),) + x.shape, dtype = x.dtype)
+        d.getEpochs(seglist, seglen, idx, out, demean)
+        if balance is not None:
+            b = self.getBalancer(balance)
+            ref = np.empty((len(seglist), self.r.numRefs, seglen), dtype = out.dtype)
+            d.getEpochs(seglist, seglen, b.ref, ref, demean)
+            b.apply(out, ref, idx)
+        return out
+
+    def getCov(self, seglist, seglen, idx = None, demean = True,
+               dtype = None, balance = None, block = 64):
+        """Return the covariance of channels [idx] (default, all the
+        primary channels) over the segments in seglist, that is, the sum
+        of x x^T over all the epochs divided by the total number of
+        samples. The epochs are read, and balanced if balance is not
+        None, block segments at a time using getEpochs(), and each block
+        is added with a single matrix multiply."""
+
+        C = 0
+        buf = None
+        for b in range(0, len(seglist), block):
+            sl = seglist[b : b + block]
+            if buf is None:
+                buf = self.getEpochs(sl, seglen, idx, None, demean, dtype, balance)
+                x = buf
+            else:
+                x = self.getEpochs(sl, seglen, idx, buf[:len(sl)], demean,
+                                   dtype, balance)
+            C = C + np.tensordot(x, x, axes = ([0, 2], [0, 2]))
+        return C / (len(seglist) * seglen)
+
+    def getBalancer(self, order):
+        """Return the balancer for the given gradient order. They are
+        made once per order, when first needed."""
+
+        b = self.balancers.get(order)
+        if b is None:
+            b = balancer(self.r, order)
+            self.balancers[order] = b
+        return b
+
+    def decimate(self, down, up = 1, continuous = False, ntaps = 0):
+        """Return a view of the dataset resampled by up / down; see
+        decimate.decimated."""
+
+        return decimated(self, down, up, continuous, ntaps)
+
     def getDsRawData(self, tr, ch):
         """Return trial tr from channel ch as a numpy array."""
 
@@ -57,6 +57,8 @@ covariance (TRUE|FALSE, default TRUE), and an
 optional name for the covariance file (default,
 the marker name). This option may be repeated.""")
     p.mkDesc('SegFile', None)
+    p.mkDesc('Continuous', None, Bool(),
+                help = "the trials are one continuous recording, so\nsegments may cross trial boundaries")
     p.mkDesc('DataSegment', None, TimeWin(),
                 arghelp = "T0 T1", help = "expanded time window relative to marker\nto use for analysis")
     p.mkDesc('Baseline', None, TimeWin(),
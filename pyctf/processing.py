@@ -8,6 +8,9 @@ Usage:
     proc = processing.read(f)
     flist = processing.mkfilt(ds, proc)
 
+    pipe = processing.Pipeline(ds, proc)
+    x = pipe.getIdxArray(tr, idx)
+
     f = open("processing.cfg", "w")
     processing.write(proc, f)
 
@@ -15,9 +18,9 @@ Usage:
 
 import datetime
 import numpy as np
-from pyctf import mkiir, mkfft
+from pyctf import mkiir, mkfft, getfft
 
-__all__ = ['read', 'write', 'mkfilt']
+__all__ = ['read', 'write', 'mkfilt', 'Pipeline']
 
 def read(f):
     """Read processing parameters from the open file f,
@@ -154,4 +157,168 @@ def mkfilt(ds, proc):
         bandreject: [[enable, filterOrder, fc1, fc2], ...]
             (Note: bandreject is a list of filter parameters)
         offset: [enable, baselineSelection, startPt, endPt]
+
+    Returns a list of FFT filters for whole trials, to be applied in
+    order with dofilt(). The filterOrder fields are not used; the
+    samiir filters have a fixed order.
     """
+
+    return [mkfft(lo, hi, ds.getSampleRate(), ds.getNumberOfSamples())
+            for lo, hi in filtbands(proc)]
+
+def filtbands(proc):
+    """Return the (lo, hi) arguments for mkfft() for each of the
+    enabled filters in proc."""
+
+    l = []
+    p = proc.get('highpass')
+    if p and p[0]:
+        l.append((p[2], 0.))
+    p = proc.get('lowpass')
+    if p and p[0]:
+        l.append((0., p[2]))
+    p = proc.get('bandpass')
+    if p and p[0]:
+        l.append((p[2], p[3]))
+    for p in proc.get('bandreject', []):
+        if p[0]:
+            l.append((p[3], p[2]))      # lo > hi means bandreject
+    return l
+
+class Pipeline:
+
+    def __init__(self, ds, proc = None):
+        """pipe = Pipeline(ds, proc)
+        Make all the processing in the proc dict (default, the dataset's
+        own processing.cfg) into one operation on (nch, n) blocks of data
+        from the dataset ds. The stages are applied in this order:
+
+            balance         the gradient order, applied with one
+                            matrix multiply
+            offset          baseline and trend removal, for all the
+                            channels at once
+            filters         the high, low, band, and bandreject filters;
+                            their gains are multiplied together, so the
+                            whole block gets one forward and one inverse
+                            real FFT
+
+        The filters give the same results as applying the mkfilt() filters
+        one at a time with dofilt(). The combined gains are made once for
+        each block length.
+
+            x = pipe.getIdxArray(tr, idx, start, n)
+            x = pipe(x)                 # x has all the channels
+            x = pipe(x, ref, idx)       # x has channels [idx], ref has
+                                        # all the references
+            x = pipe(x, start = s)      # x starts at sample s of a trial
+        """
+
+        if proc is None:
+            with open(ds.getDsFileName('processing.cfg')) as f:
+                proc = read(f)
+        self.ds = ds
+        self.proc = proc
+
+        # Balancing to order 0 undoes any balancing saved with the data,
+        # so it's only skipped if there are no references to use.
+
+        self.bal = None
+        p = proc.get('balance')
+        if p and (p[0] > 0 or ds.r.numRefs > 0):
+            b = ds.getBalancer(p[0])
+            if b.W.any():
+                self.bal = b
+
+        self.offset = None
+        p = proc.get('offset')
+        if p and p[0]:
+            baseline, start, end = p[1:]
+            trend = baseline >= 10
+            if trend:
+                baseline -= 10
+            if baseline == 0:
+                start, end = 0, ds.getPreTrigSamples()
+            elif baseline == 2:
+                start, end = 0, None
+            self.offset = (start, end, trend)
+
+        self.bands = filtbands(proc)
+        self.gains = {}
+
+    def getGain(self, n):
+        """Return the combined gain of all the filters, for the real FFT
+        of an n point block, or None if there are no filters."""
+
+        if len(self.bands) == 0:
+            return None
+        g = self.gains.get(n)
+        if g is None:
+            srate = self.ds.getSampleRate()
+            g = np.ones(n // 2 + 1)
+            k = np.arange(n // 2 + 1)
+            for lo, hi in self.bands:
+                G = getfft(mkfft(lo, hi, srate, n))
+                if n % 2:
+                    G[n // 2] = 1.  # FFTfilter doesn't touch this bin
+                # The real part of FFTfilter's result sees the average
+                # of the gains at each frequency's +/- bins.
+                g *= (G[k] + G[-k % n]) / 2.
+            self.gains[n] = g
+        return g
+
+    def __call__(self, x, ref = None, idx = None, start = None):
+        """Process the (nch, n) array x in place, and return it. If the
+        processing includes balancing, x should either contain all the
+        channels, or else channels [idx] with the references in ref, as
+        for balancer.apply().
+
+        The offset baseline is given in samples of a trial. If start is
+        given, x is part of a trial starting at that sample, and the
+        baseline (and for trend removal, the whole trial) must be in x;
+        otherwise the baseline is taken relative to the start of x."""
+
+        if self.bal:
+            self.bal.apply(x, ref, idx)
+
+        if self.offset:
+            b0, b1, trend = self.offset
+            if start is not None:
+                n = x.shape[-1]
+                S = self.ds.getNumberOfSamples()
+                if b1 is None:
+                    b1 = S
+                b0 -= start
+                b1 -= start
+                if b0 < 0 or b1 > n:
+                    raise ValueError("the offset baseline is outside samples {} to {}".format(start, start + n))
+                if trend and (start != 0 or n != S):
+                    raise ValueError("trend removal needs whole trials")
+            x -= x[..., b0 : b1].mean(axis = -1, keepdims = True)
+            if trend:
+                n = x.shape[-1]
+                m = (x[..., -1:] - x[..., :1]) / (n - 1)
+                x -= m * np.arange(n)
+
+        n = x.shape[-1]
+        g = self.getGain(n)
+        if g is not None:
+            X = np.fft.rfft(x, axis = -1)
+            X *= g
+            x[...] = np.fft.irfft(X, n, axis = -1)
+
+        return x
+
+    def getIdxArray(self, tr, idx, start = 0, n = 0):
+        """Read n samples starting at start from channels [idx] of trial tr
+        (default, the whole trial), and process them. Like
+        ds.getIdxArray(), the mean of each channel is removed, unless
+        there's an offset stage, which removes its own baseline instead.
+        (Removing the mean before balancing is the same as after.)"""
+
+        ds = self.ds
+        demean = self.offset is None
+        x = ds.readInto(tr, idx, start, n, demean = demean)
+        ref = None
+        if self.bal:
+            ref = ds.readInto(tr, self.bal.ref, start, n, demean = demean)
+        return self(x, ref, idx, start)
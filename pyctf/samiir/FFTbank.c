@@ -0,0 +1,142 @@
+// FFTbank() -- filter data through a bank of FFT filters. The forward
+//  fft of the data is done once, and each band's gain is applied to
+//  it, followed by an inverse fft per band. The gains are the per-bin
+//  factors that FFTfilter() or FHilbert() would apply to bins 0 to
+//  len/2 of a real fft, so the results are the same as theirs.
+//
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include <fftw3.h>
+#include "fftplan.h"
+#include "filters.h"
+
+// p1 is an FFTPLAN_R2C plan, and p2 is either an FFTPLAN_C2R plan
+// (real output) or an FFTPLAN_BACKWARD plan (analytic output). Band
+// b's output goes to result + b * bstride. Returns -1 if the work
+// buffers can't be allocated.
+
+int FFTbank(
+    double              *data,          // data[N] -- input data
+    double              *result,        // output data (filtered), one row per band
+    double              *gains,         // gains[nband][N/2+1] -- per-bin gains
+    int                 nband,          // number of bands
+    int                 len,            // number of samples
+    long                bstride,        // doubles between bands in result
+    int                 analytic,       // 1 for complex (analytic) output
+    fftw_plan           p1,             // forward r2c fft plan
+    fftw_plan           p2              // reverse fft plan
+) {
+    double              *x;             // real data
+    fftw_complex        *X;             // spectrum, len/2+1 bins
+    fftw_complex        *Y;             // filtered spectrum
+    fftw_complex        *y;             // complex result
+    double              *g;             // gains for this band
+    double              *p;             // result pointer
+    int                 nbins;          // len/2+1
+    int                 b;              // band index
+    int                 i;              // frequency or time index
+
+    nbins = len / 2 + 1;
+    x = fftplan_buf(0, sizeof(double) * len);
+    X = fftplan_buf(1, sizeof(fftw_complex) * nbins);
+    Y = fftplan_buf(2, sizeof(fftw_complex) * len);
+    y = fftplan_buf(3, sizeof(fftw_complex) * len);
+    if (x == NULL || X == NULL || Y == NULL || y == NULL)
+        return -1;
+
+    // FFT, once.
+    memcpy(x, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p1, x, X);     // x -> X
+
+    for (b=0; b<nband; b++) {
+        g = gains + b * nbins;
+        p = result + b * bstride;
+
+        for (i=0; i<nbins; i++) {
+            Y[i][0] = X[i][0] * g[i];
+            Y[i][1] = X[i][1] * g[i];
+        }
+
+        if (analytic) {
+            // The negative frequencies are zero.
+            for (i=nbins; i<len; i++) {
+                Y[i][0] = 0.;
+                Y[i][1] = 0.;
+            }
+            fftw_execute_dft(p2, Y, y);         // Y -> y
+            for (i=0; i<len; i++) {
+                *p++ = y[i][0] / (double)len;
+                *p++ = y[i][1] / (double)len;
+            }
+        } else {
+            fftw_execute_dft_c2r(p2, Y, x);     // Y -> x
+            for (i=0; i<len; i++)
+                *p++ = x[i] / (double)len;
+        }
+    }
+
+    return 0;
+}
+
+// The same, in single precision, with fftplan_getf() plans. bstride
+// is in floats.
+
+int FFTbankf(
+    float               *data,          // data[N] -- input data
+    float               *result,        // output data (filtered), one row per band
+    double              *gains,         // gains[nband][N/2+1] -- per-bin gains
+    int                 nband,          // number of bands
+    int                 len,            // number of samples
+    long                bstride,        // floats between bands in result
+    int                 analytic,       // 1 for complex (analytic) output
+    fftwf_plan          p1,             // forward r2c fft plan
+    fftwf_plan          p2              // reverse fft plan
+) {
+    float               *x;             // real data
+    fftwf_complex       *X;             // spectrum, len/2+1 bins
+    fftwf_complex       *Y;             // filtered spectrum
+    fftwf_complex       *y;             // complex result
+    double              *g;             // gains for this band
+    float               s;              // gain, with the 1 / len
+    int                 nbins;          // len/2+1
+    int                 b;              // band index
+    int                 i;              // frequency index
+
+    nbins = len / 2 + 1;
+    x = fftplan_buf(0, sizeof(float) * len);
+    X = fftplan_buf(1, sizeof(fftwf_complex) * nbins);
+    Y = fftplan_buf(2, sizeof(fftwf_complex) * len);
+    y = fftplan_buf(3, sizeof(fftwf_complex) * len);
+    if (x == NULL || X == NULL || Y == NULL || y == NULL)
+        return -1;
+
+    memcpy(x, data, sizeof(float) * len);
+    fftwf_execute_dft_r2c(p1, x, X);    // x -> X
+
+    for (b=0; b<nband; b++) {
+        g = gains + b * nbins;
+
+        for (i=0; i<nbins; i++) {
+            s = fabs(g[i]) < FGAINMIN ? 0. : g[i] / len;
+            Y[i][0] = X[i][0] * s;
+            Y[i][1] = X[i][1] * s;
+        }
+
+        if (analytic) {
+            for (i=nbins; i<len; i++) {
+                Y[i][0] = 0.;
+                Y[i][1] = 0.;
+            }
+            fftwf_execute_dft(p2, Y, y);        // Y -> y
+            memcpy(result + b * bstride, y, sizeof(fftwf_complex) * len);
+        } else {
+            fftwf_execute_dft_c2r(p2, Y, x);    // Y -> x
+            memcpy(result + b * bstride, x, sizeof(float) * len);
+        }
+    }
+
+    return 0;
+}
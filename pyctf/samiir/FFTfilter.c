@@ -16,92 +16,97 @@
 #include <string.h>
 #include <math.h>
 #include <fftw3.h>
+#include "fftplan.h"
+#include "filters.h"
 
-char *Wisfile = NULL;
-char *Wistemplate = "%s/.fftwis";
-#define WISLEN 8
+// The data are real, so only the non-negative frequencies are
+// transformed: p1 is an FFTPLAN_R2C plan and p2 is an FFTPLAN_C2R
+// plan, both from fftplan_get(). Bin i is multiplied by gain[i] and
+// mirror bin len-i by gain[len-i]; since the result is real, that is
+// the same as multiplying bin i by the average of the two. For odd
+// len, the middle bin isn't filtered (its gain is 1), as before.
+// Returns -1 if the work buffers can't be allocated.
 
-void set_wisfile(void)
+double FFTbingain(double *gain, int k, int len)
 {
-    char *home;
-
-    if (Wisfile) return;
-    home = getenv("HOME");
-    Wisfile = (char *)malloc(strlen(home) + WISLEN + 1);
-    sprintf(Wisfile, Wistemplate, home);
+    if (len % 2 == 1 && k == len / 2)
+        return 1.;
+    return gain[k];
 }
 
-void FFTfilter(
+int FFTfilter(
     double              *data,          // data[N] -- input data
     double              *result,        // result[N] -- output data (filtered)
     double              *gain,          // gain[N] -- filter coefficients
-    int                 len             // number of samples
+    int                 len,            // number of samples
+    fftw_plan           p1,             // forward r2c fft plan
+    fftw_plan           p2              // reverse c2r fft plan
 ) {
-    static fftw_plan    p1;             // forward fft plan
-    static fftw_plan    p2;             // reverse fft plan
-    static fftw_complex *x;             // real data -- x[i][0]
-    static fftw_complex *X;             // complex data
-    double              *p;             // result pointer
-    int                 i;              // i-index (positive freqs)
-    int                 j;              // j-index (negative freqs)
-    static int          planlen = 0;    // initialization
-    FILE                *wisdom;        // wisdom file pointer
-
-    // Keep the arrays and plans around from last time, since this
-    // is a very common case. Reallocate them if they change.
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p1);
-        fftw_destroy_plan(p2);
-        fftw_free(x);
-        fftw_free(X);
-        planlen = 0;
-    }
-    if (planlen == 0) {
-        planlen = len;
-        x = fftw_malloc(sizeof(fftw_complex) * len);
-        X = fftw_malloc(sizeof(fftw_complex) * len);
-
-        // Get any accumulated wisdom.
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if(wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
-        }
-
-        // Set up the fftw plans.
-        fftw_set_timelimit(5);          // for large len
-        p1 = fftw_plan_dft_1d(len, x, X, FFTW_FORWARD, FFTW_MEASURE);
-        p2 = fftw_plan_dft_1d(len, X, x, FFTW_BACKWARD, FFTW_MEASURE);
-
-        // Save the wisdom.
-        wisdom = fopen(Wisfile, "w");
-        if(wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
-    }
+    double              *x;             // real data
+    fftw_complex        *X;             // complex data, len/2+1 bins
+    double              g;              // effective gain
+    int                 i;              // frequency index
 
-    // Convert the input to complex.
-    memset(x, 0, sizeof(fftw_complex) * len);
-    for(i=0; i<len; i++)
-        x[i][0] = data[i];
+    // Use this thread's work buffers.
+    x = fftplan_buf(0, sizeof(double) * len);
+    X = fftplan_buf(1, sizeof(fftw_complex) * (len / 2 + 1));
+    if (x == NULL || X == NULL)
+        return -1;
 
     // FFT.
-    fftw_execute(p1);   // x -> X
-
-    // multiply spectral coefficients by filter gain -- careful to include positive & negative frequencies!
-    for(i=0, j=len-1; i<len/2; i++, j--) {
-        X[i][0] *= gain[i];     // positive frequency real
-        X[i][1] *= gain[i];     // positive frequency imaginary
-        X[j][0] *= gain[j];     // negative frequency real
-        X[j][1] *= gain[j];     // negative frequency imaginary
+    memcpy(x, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p1, x, X);     // x -> X
+
+    // multiply spectral coefficients by filter gain -- the negative
+    // frequencies are implied by symmetry
+    for(i=0; i<=len/2; i++) {
+        g = .5 * (FFTbingain(gain, i, len) + FFTbingain(gain, (len - i) % len, len));
+        X[i][0] *= g;
+        X[i][1] *= g;
     }
 
     // Inverse FFT.
-    fftw_execute(p2);   // X -> x
+    fftw_execute_dft_c2r(p2, X, x);     // X -> x
+
+    // Fill in the result.
+    for(i=0; i<len; i++)
+        result[i] = x[i] / (double)len;
+
+    return 0;
+}
+
+// The same, in single precision, with fftplan_getf() plans.
+
+int FFTfilterf(
+    float               *data,          // data[N] -- input data
+    float               *result,        // result[N] -- output data (filtered)
+    double              *gain,          // gain[N] -- filter coefficients
+    int                 len,            // number of samples
+    fftwf_plan          p1,             // forward r2c fft plan
+    fftwf_plan          p2              // reverse c2r fft plan
+) {
+    float               *x;             // real data
+    fftwf_complex       *X;             // complex data, len/2+1 bins
+    float               g;              // effective gain
+    int                 i;              // frequency index
+
+    x = fftplan_buf(0, sizeof(float) * len);
+    X = fftplan_buf(1, sizeof(fftwf_complex) * (len / 2 + 1));
+    if (x == NULL || X == NULL)
+        return -1;
+
+    memcpy(x, data, sizeof(float) * len);
+    fftwf_execute_dft_r2c(p1, x, X);    // x -> X
+
+    for(i=0; i<=len/2; i++) {
+        g = .5 * (FFTbingain(gain, i, len) + FFTbingain(gain, (len - i) % len, len));
+        g = fabs(g) < FGAINMIN ? 0. : g / len;
+        X[i][0] *= g;
+        X[i][1] *= g;
+    }
+
+    fftwf_execute_dft_c2r(p2, X, x);    // X -> x
+    memcpy(result, x, sizeof(float) * len);
 
-    // Fill in the result, just the real part.
-    for(i=0, p=result; i<len; i++)
-        *p++ = x[i][0] / (double)len;
+    return 0;
 }
@@ -17,88 +17,110 @@
 #include <string.h>
 #include <math.h>
 #include <fftw3.h>
+#include "fftplan.h"
+#include "filters.h"
 
-extern void set_wisfile(void);
-extern char *Wisfile;
+// The data are real, so p1 is an FFTPLAN_R2C plan; all of the
+// negative frequencies are zeroed, so the spectrum is filled in from
+// the non-negative ones and transformed back with the FFTPLAN_BACKWARD
+// plan p2. Both come from fftplan_get(). Returns -1 if the work buffers
+// can't be allocated.
 
-void FHilbert(
+int FHilbert(
     double              *data,          // data[N] -- input data
     double              *result,        // complex result[N] -- output data (filtered)
     double              *gain,          // gain[N] -- filter coefficients
-    int                 len             // number of samples
+    int                 len,            // number of samples
+    fftw_plan           p1,             // forward r2c fft plan
+    fftw_plan           p2              // reverse fft plan
 ) {
-    static fftw_plan    p1;             // forward fft plan
-    static fftw_plan    p2;             // reverse fft plan
-    static fftw_complex *x;             // real data -- x[i][0]
-    static fftw_complex *X;             // complex data
+    double              *x;             // real data
+    fftw_complex        *X;             // complex data
+    fftw_complex        *y;             // complex result
     double              *p;             // result pointer
-    int                 i;              // i-index (positive freqs)
-    int                 j;              // j-index (negative freqs)
-    static int          planlen = 0;    // initialization
-    FILE                *wisdom;        // wisdom file pointer
-
-    // Keep the arrays and plans around from last time, since this
-    // is a very common case. Reallocate them if they change.
-
-    // @@@ This is terrible and should go away.
-
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p1);
-        fftw_destroy_plan(p2);
-        fftw_free(x);
-        fftw_free(X);
-        planlen = 0;
-    }
-    if (planlen == 0) {
-        planlen = len;
-        x = fftw_malloc(sizeof(fftw_complex) * len);
-        X = fftw_malloc(sizeof(fftw_complex) * len);
-
-        // Get any accumulated wisdom.
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
-        }
-
-        // Set up the fftw plans.
-        fftw_set_timelimit(5);          // for large len
-        p1 = fftw_plan_dft_1d(len, x, X, FFTW_FORWARD, FFTW_MEASURE);
-        p2 = fftw_plan_dft_1d(len, X, x, FFTW_BACKWARD, FFTW_MEASURE);
-
-        // Save the wisdom.
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
-    }
+    int                 i;              // frequency index
 
-    // Convert the input to complex.
-    memset(x, 0, sizeof(fftw_complex) * len);
-    for (i=0; i<len; i++)
-        x[i][0] = data[i];
+    // Use this thread's work buffers.
+    x = fftplan_buf(0, sizeof(double) * len);
+    X = fftplan_buf(1, sizeof(fftw_complex) * len);
+    y = fftplan_buf(2, sizeof(fftw_complex) * len);
+    if (x == NULL || X == NULL || y == NULL)
+        return -1;
 
-    // FFT.
-    fftw_execute(p1);   // x -> X
+    // FFT. This fills in bins 0 to len/2 of X.
+    memcpy(x, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p1, x, X);     // x -> X
 
     // Multiply spectral coefficients by filter gain. Also do the
     // Hilbert transform: the upper half-circle gets multiplied by
-    // 2, and the lower half-circle gets set to zero.
-    for (i=0, j=len-1; i<len/2; i++, j--) {
+    // 2, and the lower half-circle gets set to zero. For odd len
+    // the middle bin is left alone.
+    for (i=0; i<len/2; i++) {
         X[i][0] *= 2. * gain[i];    // positive frequency real
         X[i][1] *= 2. * gain[i];    // positive frequency imaginary
-        X[j][0] = 0.;               // negative frequency real
-        X[j][1] = 0.;               // negative frequency imaginary
+    }
+    i = len % 2 == 1 ? len / 2 + 1 : len / 2;
+    for (; i<len; i++) {
+        X[i][0] = 0.;               // negative frequency real
+        X[i][1] = 0.;               // negative frequency imaginary
     }
 
     // Inverse FFT.
-    fftw_execute(p2);   // X -> x
+    fftw_execute_dft(p2, X, y);         // X -> y
 
     // Fill in the complex result.
     for (i=0, p=result; i<len; i++) {
-        *p++ = x[i][0] / (double)len;
-        *p++ = x[i][1] / (double)len;
+        *p++ = y[i][0] / (double)len;
+        *p++ = y[i][1] / (double)len;
     }
+
+    return 0;
+}
+
+// The same, in single precision, with fftplan_getf() plans. The
+// result is complex float.
+
+int FHilbertf(
+    float               *data,          // data[N] -- input data
+    float               *result,        // complex result[N] -- output data (filtered)
+    double              *gain,          // gain[N] -- filter coefficients
+    int                 len,            // number of samples
+    fftwf_plan          p1,             // forward r2c fft plan
+    fftwf_plan          p2              // reverse fft plan
+) {
+    float               *x;             // real data
+    fftwf_complex       *X;             // complex data
+    fftwf_complex       *y;             // complex result
+    float               g;              // gain, with the 1 / len
+    int                 i;              // frequency index
+
+    x = fftplan_buf(0, sizeof(float) * len);
+    X = fftplan_buf(1, sizeof(fftwf_complex) * len);
+    y = fftplan_buf(2, sizeof(fftwf_complex) * len);
+    if (x == NULL || X == NULL || y == NULL)
+        return -1;
+
+    memcpy(x, data, sizeof(float) * len);
+    fftwf_execute_dft_r2c(p1, x, X);    // x -> X
+
+    // The 1 / len scaling is done here too.
+    for (i=0; i<len/2; i++) {
+        g = fabs(gain[i]) < FGAINMIN ? 0. : 2. * gain[i] / len;
+        X[i][0] *= g;
+        X[i][1] *= g;
+    }
+    if (len % 2 == 1) {
+        X[i][0] /= len;
+        X[i][1] /= len;
+        i++;
+    }
+    for (; i<len; i++) {
+        X[i][0] = 0.;
+        X[i][1] = 0.;
+    }
+
+    fftwf_execute_dft(p2, X, y);        // X -> y
+    memcpy(result, y, sizeof(fftwf_complex) * len);
+
+    return 0;
 }
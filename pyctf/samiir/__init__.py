@@ -1,2 +1,5 @@
 from .samiir import dofilt, getfft, getiir, mkfft, mkiir, mkfhilb
-__all__ = ['dofilt', 'getfft', 'getiir', 'mkfft', 'mkiir', 'mkfhilb']
+from .samiir import warmup, setwisdom, savewisdom, getzpk, sosfilt
+from .samiir import mkbank, resample
+__all__ = ['dofilt', 'getfft', 'getiir', 'mkfft', 'mkiir', 'mkfhilb', 'mkbank', 'resample']
+from .stream import firstream, iirstream, zpk2sos
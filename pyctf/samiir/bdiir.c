@@ -9,37 +9,34 @@
 //
 
 #include <stdlib.h>
+#include <string.h>
 #include "filters.h"
 
+// Tmp[T] is scratch space, supplied by the caller so that several
+// threads can filter at once.
+
 int bdiir(double *In,           // input data array
 	  double *Out,          // output data array
 	  int T,                // number of points in data array
-	  IIRSPEC *Filter       // iir filter structure pointer
+	  IIRSPEC *Filter,      // iir filter structure pointer
+	  double *Tmp           // temporary time-series
 ) {
-    static double *Tmp;         // temporary time-series
     double offset;              // value of 0th data point
+    double den[MAXORDER];       // denominator, with the 1st term zero
     register double x;          // input sample value;
     register double y;          // output sample value;
     register int t;             // time-index
     register int i;             // coefficient-index
     register int j;             // offset index
-    static int mem = 0;
 
-    // if req'd, allocate or modify intermediate array
-    if (mem != T) {
-	if (mem != 0)
-	    free((void *)Tmp);
-	if ((Tmp = (double *)malloc((size_t) (T * sizeof(double)))) == NULL)
-	    return -1;
-	mem = T;
-    }
     // filter is not enabled, move data to output
     if (Filter->enable == 0) {
 	for (t = 0; t < T; t++)
 	    Out[t] = In[t];
 	return 0;
     }
-    Filter->den[0] = 0.;        // set 1st term of denominator to zero
+    memcpy(den, Filter->den, sizeof(den));
+    den[0] = 0.;                // set 1st term of denominator to zero
     offset = In[0];             // get starting value to offset series
     for (t = 0; t < T; t++)
 	for (i = 0, Tmp[t] = 0.; i < Filter->NC; i++) {
@@ -50,7 +47,7 @@ int bdiir(double *In,           // input data array
 		x = In[j] - offset;
 		y = Tmp[j];
 	    }
-	    Tmp[t] += Filter->num[i] * x - Filter->den[i] * y;
+	    Tmp[t] += Filter->num[i] * x - den[i] * y;
 	}
     offset = Tmp[T - 1];        // get ending value to offset series
     for (t = (T - 1); t >= 0; t--)
@@ -62,7 +59,28 @@ int bdiir(double *In,           // input data array
 		x = Tmp[j] - offset;
 		y = Out[j];
 	    }
-	    Out[t] += Filter->num[i] * x - Filter->den[i] * y;
+	    Out[t] += Filter->num[i] * x - den[i] * y;
 	}
     return 0;
 }
+
+// The same, for single precision data. The recursion is done in
+// double precision (in Tmp, which must have room for 2 * T values),
+// since narrow filters need it to stay accurate.
+
+int bdiirf(float *In,           // input data array
+	   float *Out,          // output data array
+	   int T,               // number of points in data array
+	   IIRSPEC *Filter,     // iir filter structure pointer
+	   double *Tmp          // temporary time-series
+) {
+    register int t;             // time-index
+    double *x = Tmp + T;
+
+    for (t = 0; t < T; t++)
+	x[t] = In[t];
+    bdiir(x, x, T, Filter, Tmp);
+    for (t = 0; t < T; t++)
+	Out[t] = x[t];
+    return 0;
+}
@@ -0,0 +1,447 @@
+// fftplan -- a cache of FFTW plans, keyed by length and kind.
+//
+//  The FFTW planner isn't thread safe, so fftplan_get() and
+//  fftplan_release() must only be called by one thread at a time;
+//  the Python wrappers call them with the GIL held. The plans are
+//  used with the new-array execute functions, on per-thread work
+//  buffers from fftplan_buf(), so any number of threads can use
+//  them at once.
+//
+//  Plans are reference counted. Up to NKEEP unused plans are kept,
+//  so alternating between a few lengths doesn't replan; beyond that
+//  the least recently used unused plan is destroyed.
+//
+//  Wisdom is read from the wisdom file once, when the first plan
+//  is made, and written back once, at exit, merged with whatever
+//  other processes have written there in the meantime. The file is
+//  locked while it is read or written. The file is given by the
+//  PYCTF_FFTW_WISDOM environment variable (default $HOME/.fftwis,
+//  and an empty value means don't use a file), or by
+//  fftplan_setwisdom(). The planning effort is given by
+//  PYCTF_FFTW_PLANNER, one of ESTIMATE, MEASURE (the default),
+//  PATIENT, or EXHAUSTIVE.
+//
+//  Single precision (fftwf) plans are kept in the same cache, and
+//  their wisdom goes in a second file, named by appending an f to
+//  the name of the double precision one.
+//
+//  The samiir module exports these functions to the st module,
+//  so there is just one cache, and one wisdom file, per process.
+//
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <strings.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/file.h>
+#include <pthread.h>
+#include <fftw3.h>
+#include "fftplan.h"
+
+#define NKEEP 16
+
+typedef struct {
+    int n;                      // length
+    int kind;                   // FFTPLAN_xxx, maybe | FFTPLAN_FLOAT
+    int refs;                   // number of users
+    unsigned long lastuse;      // for LRU
+    void *plan;                 // fftw_plan or fftwf_plan
+} PLANENT;
+
+static PLANENT *Plans = NULL;
+static int Nplans = 0;          // number of entries in use
+static int Maxplans = 0;        // number allocated
+static unsigned long Clock = 0;
+
+// Wisdom.
+
+static char *Wisfile = NULL;    // NULL or "" means no file
+static char *Wisfilef = NULL;   // the single precision one, or NULL
+static int Wisinit = 0;         // read the environment yet?
+static int Wisdirty = 0;        // new wisdom since the last save?
+static int Wisdirtyf = 0;       // the same, for single precision
+static unsigned Planner = FFTW_MEASURE;
+
+static struct {
+    char *name;
+    unsigned flag;
+} Planners[] = {
+    { "ESTIMATE", FFTW_ESTIMATE },
+    { "MEASURE", FFTW_MEASURE },
+    { "PATIENT", FFTW_PATIENT },
+    { "EXHAUSTIVE", FFTW_EXHAUSTIVE },
+    { NULL, 0 }
+};
+
+static void readfile(const char *name, int (*import)(FILE *))
+{
+    int fd;
+    FILE *f;
+
+    if (name == NULL || *name == '\0') return;
+    fd = open(name, O_RDONLY);
+    if (fd < 0) return;
+    flock(fd, LOCK_SH);
+    f = fdopen(fd, "r");
+    if (f == NULL) {
+        close(fd);
+        return;
+    }
+    import(f);
+    fclose(f);                  // also unlocks
+}
+
+// Merge the wisdom from the wisdom files, if any.
+
+static void readwisdom(void)
+{
+    readfile(Wisfile, fftw_import_wisdom_from_file);
+    readfile(Wisfilef, fftwf_import_wisdom_from_file);
+}
+
+static void savewisdom(void)
+{
+    fftplan_savewisdom();
+}
+
+// Set the names of both wisdom files. They're only changed with the
+// GIL held, like the plans.
+
+static void setpath(const char *path)
+{
+    free(Wisfile);
+    free(Wisfilef);
+    Wisfile = NULL;
+    Wisfilef = NULL;
+    if (path) {
+        Wisfile = strdup(path);
+    }
+    if (path && *path) {
+        Wisfilef = (char *)malloc(strlen(path) + 2);
+        if (Wisfilef) {
+            sprintf(Wisfilef, "%sf", path);
+        }
+    }
+}
+
+static void wisinit(void)
+{
+    int i;
+    char *s, *home, *path;
+
+    if (Wisinit) return;
+    Wisinit = 1;
+
+    s = getenv("PYCTF_FFTW_PLANNER");
+    if (s) {
+        for (i = 0; Planners[i].name; i++) {
+            if (strcasecmp(s, Planners[i].name) == 0) {
+                Planner = Planners[i].flag;
+                break;
+            }
+        }
+        if (Planners[i].name == NULL) {
+            fprintf(stderr, "fftplan: unknown PYCTF_FFTW_PLANNER %s, using MEASURE\n", s);
+        }
+    }
+
+    if (Wisfile == NULL) {
+        s = getenv("PYCTF_FFTW_WISDOM");
+        if (s) {
+            setpath(s);
+        } else {
+            home = getenv("HOME");
+            if (home == NULL) home = ".";
+            path = (char *)malloc(strlen(home) + strlen("/.fftwis") + 1);
+            if (path) {
+                sprintf(path, "%s/.fftwis", home);
+                setpath(path);
+                free(path);
+            }
+        }
+    }
+
+    readwisdom();
+    atexit(savewisdom);
+}
+
+// Use path as the wisdom file (NULL means don't use one). Any new
+// wisdom is saved to the old file first, then the new one is read.
+
+void fftplan_setwisdom(const char *path)
+{
+    wisinit();
+    fftplan_savewisdom();
+    setpath(path);
+    readwisdom();
+}
+
+static int savefile(const char *name, int (*import)(FILE *), void (*export)(FILE *))
+{
+    int fd;
+    FILE *f;
+
+    fd = open(name, O_RDWR | O_CREAT, 0644);
+    if (fd < 0) return -1;
+    flock(fd, LOCK_EX);
+    f = fdopen(fd, "r+");
+    if (f == NULL) {
+        close(fd);
+        return -1;
+    }
+    import(f);
+    rewind(f);
+    if (ftruncate(fd, 0) < 0) {
+        fclose(f);
+        return -1;
+    }
+    export(f);
+    fflush(f);
+    fclose(f);
+    return 0;
+}
+
+// Write the wisdom now, merged with what is already in the files.
+// Returns -1 if a file can't be written.
+
+int fftplan_savewisdom(void)
+{
+    int err = 0;
+
+    if (Wisfile == NULL || *Wisfile == '\0') return 0;
+    if (Wisdirty) {
+        if (savefile(Wisfile, fftw_import_wisdom_from_file, fftw_export_wisdom_to_file) < 0) {
+            err = -1;
+        } else {
+            Wisdirty = 0;
+        }
+    }
+    if (Wisdirtyf && Wisfilef) {
+        if (savefile(Wisfilef, fftwf_import_wisdom_from_file, fftwf_export_wisdom_to_file) < 0) {
+            err = -1;
+        } else {
+            Wisdirtyf = 0;
+        }
+    }
+    return err;
+}
+
+static void *mkplan(int n, int kind)
+{
+    fftw_complex *x, *X;
+    void *p = NULL;
+
+    // The arrays are only used for planning.
+    x = fftw_malloc(sizeof(fftw_complex) * n);
+    X = fftw_malloc(sizeof(fftw_complex) * n);
+    if (x == NULL || X == NULL) {
+        fftw_free(x);
+        fftw_free(X);
+        return NULL;
+    }
+
+    wisinit();
+    if (Planner == FFTW_PATIENT || Planner == FFTW_EXHAUSTIVE) {
+        fftw_set_timelimit(FFTW_NO_TIMELIMIT);  // asked for it
+        fftwf_set_timelimit(FFTW_NO_TIMELIMIT);
+    } else {
+        fftw_set_timelimit(5);      // for large n
+        fftwf_set_timelimit(5);
+    }
+    switch (kind) {
+    case FFTPLAN_FORWARD:
+        p = fftw_plan_dft_1d(n, x, X, FFTW_FORWARD, Planner);
+        break;
+    case FFTPLAN_BACKWARD:
+        p = fftw_plan_dft_1d(n, x, X, FFTW_BACKWARD, Planner);
+        break;
+    case FFTPLAN_R2C:
+        p = fftw_plan_dft_r2c_1d(n, (double *)x, X, Planner);
+        break;
+    case FFTPLAN_C2R:
+        p = fftw_plan_dft_c2r_1d(n, X, (double *)x, Planner);
+        break;
+    case FFTPLAN_FORWARD | FFTPLAN_FLOAT:
+        p = fftwf_plan_dft_1d(n, (fftwf_complex *)x, (fftwf_complex *)X, FFTW_FORWARD, Planner);
+        break;
+    case FFTPLAN_BACKWARD | FFTPLAN_FLOAT:
+        p = fftwf_plan_dft_1d(n, (fftwf_complex *)x, (fftwf_complex *)X, FFTW_BACKWARD, Planner);
+        break;
+    case FFTPLAN_R2C | FFTPLAN_FLOAT:
+        p = fftwf_plan_dft_r2c_1d(n, (float *)x, (fftwf_complex *)X, Planner);
+        break;
+    case FFTPLAN_C2R | FFTPLAN_FLOAT:
+        p = fftwf_plan_dft_c2r_1d(n, (fftwf_complex *)X, (float *)x, Planner);
+        break;
+    }
+
+    if (p && Planner != FFTW_ESTIMATE) {
+        if (kind & FFTPLAN_FLOAT) {
+            Wisdirtyf = 1;
+        } else {
+            Wisdirty = 1;
+        }
+    }
+
+    fftw_free(x);
+    fftw_free(X);
+    return p;
+}
+
+static void destroyplan(PLANENT *e)
+{
+    if (e->kind & FFTPLAN_FLOAT) {
+        fftwf_destroy_plan((fftwf_plan)e->plan);
+    } else {
+        fftw_destroy_plan((fftw_plan)e->plan);
+    }
+}
+
+// Return a plan for an n point transform of the given kind, making
+// it if necessary. Returns NULL if it can't be made.
+
+static void *getplan(int n, int kind)
+{
+    int i, lru;
+    PLANENT *e;
+
+    Clock++;
+    for (i = 0; i < Nplans; i++) {
+        e = &Plans[i];
+        if (e->n == n && e->kind == kind) {
+            e->refs++;
+            e->lastuse = Clock;
+            return e->plan;
+        }
+    }
+
+    // Not found. Reuse the least recently used free slot if the
+    // cache is full, otherwise add an entry.
+
+    lru = -1;
+    if (Nplans >= NKEEP) {
+        for (i = 0; i < Nplans; i++) {
+            if (Plans[i].refs == 0 && (lru < 0 || Plans[i].lastuse < Plans[lru].lastuse)) {
+                lru = i;
+            }
+        }
+    }
+    if (lru >= 0) {
+        e = &Plans[lru];
+        destroyplan(e);
+    } else {
+        if (Nplans == Maxplans) {
+            e = realloc(Plans, (Maxplans + NKEEP) * sizeof(PLANENT));
+            if (e == NULL) {
+                return NULL;
+            }
+            Plans = e;
+            Maxplans += NKEEP;
+        }
+        e = &Plans[Nplans++];
+    }
+
+    e->n = n;
+    e->kind = kind;
+    e->plan = mkplan(n, kind);
+    if (e->plan == NULL) {
+        *e = Plans[--Nplans];   // remove the entry
+        return NULL;
+    }
+    e->refs = 1;
+    e->lastuse = Clock;
+    return e->plan;
+}
+
+fftw_plan fftplan_get(int n, int kind)
+{
+    return (fftw_plan)getplan(n, kind);
+}
+
+// The same, for a single precision plan.
+
+fftwf_plan fftplan_getf(int n, int kind)
+{
+    return (fftwf_plan)getplan(n, kind | FFTPLAN_FLOAT);
+}
+
+// Done with a plan from fftplan_get() or fftplan_getf().
+
+static void releaseplan(void *p)
+{
+    int i;
+
+    for (i = 0; i < Nplans; i++) {
+        if (Plans[i].plan == p) {
+            Plans[i].refs--;
+            return;
+        }
+    }
+}
+
+void fftplan_release(fftw_plan p)
+{
+    releaseplan(p);
+}
+
+void fftplan_releasef(fftwf_plan p)
+{
+    releaseplan(p);
+}
+
+// Per-thread work buffers, aligned for FFTW's SIMD code. They're
+// kept for the life of the thread, and grown as needed.
+
+typedef struct {
+    void *buf[FFTPLAN_NBUFS];
+    size_t size[FFTPLAN_NBUFS];
+} BUFS;
+
+static pthread_key_t Bufkey;
+static pthread_once_t Bufonce = PTHREAD_ONCE_INIT;
+
+static void freebufs(void *p)
+{
+    int i;
+    BUFS *b = (BUFS *)p;
+
+    for (i = 0; i < FFTPLAN_NBUFS; i++) {
+        free(b->buf[i]);
+    }
+    free(b);
+}
+
+static void mkkey(void)
+{
+    pthread_key_create(&Bufkey, freebufs);
+}
+
+// Return the calling thread's work buffer i, of at least size bytes,
+// or NULL if it can't be allocated.
+
+void *fftplan_buf(int i, size_t size)
+{
+    BUFS *b;
+
+    pthread_once(&Bufonce, mkkey);
+    b = (BUFS *)pthread_getspecific(Bufkey);
+    if (b == NULL) {
+        b = (BUFS *)calloc(1, sizeof(BUFS));
+        if (b == NULL) {
+            return NULL;
+        }
+        pthread_setspecific(Bufkey, b);
+    }
+    if (b->size[i] < size) {
+        free(b->buf[i]);
+        b->size[i] = 0;
+        if (posix_memalign(&b->buf[i], 64, size) != 0) {
+            b->buf[i] = NULL;
+            return NULL;
+        }
+        b->size[i] = size;
+    }
+    return b->buf[i];
+}
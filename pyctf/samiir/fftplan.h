@@ -0,0 +1,38 @@
+#ifndef H_FFTPLAN
+#define H_FFTPLAN
+
+#include <stddef.h>
+#include <fftw3.h>
+
+/* kinds of plans */
+#define FFTPLAN_FORWARD     0   /* complex to complex, forward */
+#define FFTPLAN_BACKWARD    1   /* complex to complex, backward */
+#define FFTPLAN_R2C         2   /* real to complex (n/2+1 bins), forward */
+#define FFTPLAN_C2R         3   /* complex (n/2+1 bins) to real, backward */
+
+/* or'd with a kind, for a single precision plan, from fftplan_getf() */
+#define FFTPLAN_FLOAT       4
+
+/* number of per-thread work buffers */
+#define FFTPLAN_NBUFS       4
+
+extern fftw_plan fftplan_get(int, int);
+extern void fftplan_release(fftw_plan);
+extern fftwf_plan fftplan_getf(int, int);
+extern void fftplan_releasef(fftwf_plan);
+extern void *fftplan_buf(int, size_t);
+extern void fftplan_setwisdom(const char *);
+extern int fftplan_savewisdom(void);
+
+/* The samiir module exports these to other extension modules in a
+capsule, samiir._fftplan, so the whole process shares one cache. */
+
+typedef struct {
+    fftw_plan (*get)(int, int);
+    void (*release)(fftw_plan);
+    void *(*buf)(int, size_t);
+} FFTPLAN_API;
+
+#define FFTPLAN_CAPSULE "pyctf.samiir.samiir._fftplan"
+
+#endif  // H_FFTPLAN
@@ -1,6 +1,8 @@
 #ifndef H_FILTERS
 #define H_FILTERS
 
+#include <fftw3.h>
+
 #define MAXORDER    20
 #define ENABLE      1
 #define DISABLE     0
@@ -22,13 +24,39 @@ typedef struct iirspec {
     int NC;                 /* number of coefficient pairs */
     double num[MAXORDER];   /* numerator iir coefficients */
     double den[MAXORDER];   /* denominator iir coefficients */
+    int NP;                 /* number of z-plane zeroes & poles */
+    double zre[MAXORDER];   /* zeroes, real & imaginary parts */
+    double zim[MAXORDER];
+    double pre[MAXORDER];   /* poles, real & imaginary parts */
+    double pim[MAXORDER];
+    double gain;            /* overall gain */
 } IIRSPEC;
 
 extern int mkiir(IIRSPEC *);
-extern int bdiir(double *, double *, int, IIRSPEC *);
+extern int bdiir(double *, double *, int, IIRSPEC *, double *);
+extern void sosfilt(double *, int, double *, double *, int, double *, int);
 extern double response(IIRSPEC *, double, double);
 extern void Butterworth(double *, int, double, double, double, int, int, double *);
-extern void FFTfilter(double *, double *, double *, int);
-extern void FHilbert(double *, double *, double *, int);
+extern int FFTfilter(double *, double *, double *, int, fftw_plan, fftw_plan);
+extern int FHilbert(double *, double *, double *, int, fftw_plan, fftw_plan);
+extern double FFTbingain(double *, int, int);
+extern int FFTbank(double *, double *, double *, int, int, long, int, fftw_plan, fftw_plan);
+
+/* single precision versions; gains smaller than FGAINMIN are taken as 0,
+as the products would be denormal floats, which are very slow */
+
+#define FGAINMIN 1e-20
+
+extern int bdiirf(float *, float *, int, IIRSPEC *, double *);
+extern int FFTfilterf(float *, float *, double *, int, fftwf_plan, fftwf_plan);
+extern int FHilbertf(float *, float *, double *, int, fftwf_plan, fftwf_plan);
+extern int FFTbankf(float *, float *, double *, int, int, long, int, fftwf_plan, fftwf_plan);
+
+/* number of taps per phase of a polyphase resampling filter */
+#define NPHASE(ntaps, up) (((ntaps) + (up) - 1) / (up))
+
+extern double *mkresample(int, int, int, double);
+extern int resamplelen(int, int, int, int);
+extern void resample(double *, int, double *, int, double *, int, int, int, int, double *);
 
 #endif  // H_FILTERS
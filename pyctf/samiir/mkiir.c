@@ -185,5 +185,15 @@ int mkiir(IIRSPEC *fp           // pointer to iir filter
         fp->den[i - 1] = creal(zdpoly[i]);
     }
 
+    // also keep the zeroes, poles, and gain, for second-order sections
+    fp->NP = npole;
+    for (i = 1; i <= npole; i++) {
+        fp->zre[i - 1] = creal(zzero[i]);
+        fp->zim[i - 1] = cimag(zzero[i]);
+        fp->pre[i - 1] = creal(zpole[i]);
+        fp->pim[i - 1] = cimag(zpole[i]);
+    }
+    fp->gain = gain;
+
     return 0;
 }
@@ -0,0 +1,133 @@
+// resample() -- change the sample rate by up / down, by polyphase filtering
+//
+//      The data are (conceptually) upsampled by inserting up - 1 zeroes
+//      between samples, lowpass filtered at the lower of the two Nyquist
+//      frequencies, and every down'th sample is kept. Only the products
+//      that contribute to the kept samples are computed: output sample m
+//      uses just one phase of the filter, ntaps / up taps long.
+//
+//      The filter is a Kaiser windowed sinc, centered, so there is no
+//      delay. The ends of the data are extended by odd reflection about
+//      the end samples, which avoids a step transient at each edge.
+//
+
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#include "filters.h"
+
+// Modified Bessel function of the first kind, order 0.
+
+static double besseli0(double x)
+{
+    double s, t, k;
+
+    s = t = 1.;
+    x = x * x / 4.;
+    for (k = 1.; t > 1e-17 * s; k += 1.) {
+        t *= x / (k * k);
+        s += t;
+    }
+    return s;
+}
+
+// Make the polyphase filter table for resampling by up / down, with an
+// ntaps tap filter (made odd) and Kaiser window parameter beta. Each
+// phase has NPHASE(ntaps, up) taps, stored in reverse order so that
+// each output is a forward dot product with the input. Returns NULL if
+// out of memory.
+
+double *mkresample(int up, int down, int ntaps, double beta)
+{
+    int k, p, i, L, D, lp;
+    double fc, t, w, s;
+    double *h, *poly;
+
+    L = ntaps | 1;
+    D = (L - 1) / 2;
+    lp = NPHASE(L, up);
+    fc = 1. / (up > down ? up : down);
+
+    h = (double *)malloc(L * sizeof(double));
+    poly = (double *)calloc(up * lp, sizeof(double));
+    if (h == NULL || poly == NULL) {
+        free(h);
+        free(poly);
+        return NULL;
+    }
+
+    for (k = 0; k < L; k++) {
+        t = fc * (k - D);
+        h[k] = t == 0. ? fc : sin(M_PI * t) / (M_PI * (k - D));
+        t = D > 0 ? (double)(k - D) / D : 0.;
+        w = besseli0(beta * sqrt(1. - t * t)) / besseli0(beta);
+        h[k] *= w;
+    }
+
+    // Each phase is scaled to a gain of 1 at DC, which makes up for
+    // the inserted zeroes, and passes constants exactly.
+    for (p = 0; p < up; p++) {
+        s = 0.;
+        for (i = 0; p + up * i < L; i++) {
+            s += h[p + up * i];
+        }
+        for (i = 0; p + up * i < L; i++) {
+            poly[p * lp + lp - 1 - i] = h[p + up * i] / s;
+        }
+    }
+    free(h);
+    return poly;
+}
+
+// Return the number of output samples for n input samples.
+
+int resamplelen(int n, int up, int down, int offset)
+{
+    if (n <= 0 || offset > (n - 1) * up) {
+        return 0;
+    }
+    return ((n - 1) * up - offset) / down + 1;
+}
+
+// Output sample m is at input sample (m * down + offset) / up. The
+// work array must have room for n + 2 * NPHASE(ntaps, up) samples.
+
+void resample(
+    double      *x,             // x[n] -- input data
+    int         n,              // number of input samples
+    double      *y,             // y[ny] -- output data
+    int         ny,             // number of output samples
+    double      *poly,          // the filter, from mkresample()
+    int         ntaps,          // as given to mkresample()
+    int         up,             // interpolation factor
+    int         down,           // decimation factor
+    int         offset,         // position of the first output
+    double      *work           // scratch
+) {
+    int m, i, t, J, D, lp;
+    double s, *h, *xp;
+
+    lp = NPHASE(ntaps | 1, up);
+    D = (ntaps | 1) / 2;            // the delay of the filter
+
+    // Extend the ends by lp samples.
+    xp = work + lp;
+    memcpy(xp, x, n * sizeof(double));
+    for (t = 1; t <= lp; t++) {
+        i = t < n ? t : n - 1;
+        xp[-t] = 2. * x[0] - x[i];
+        i = n - 1 - i;
+        xp[n - 1 + t] = 2. * x[n - 1] - x[i];
+    }
+
+    for (m = 0; m < ny; m++) {
+        J = m * down + offset + D;
+        h = poly + (J % up) * lp;
+        xp = work + lp + J / up - lp + 1;
+        s = 0.;
+        for (i = 0; i < lp; i++) {
+            s += h[i] * xp[i];
+        }
+        y[m] = s;
+    }
+}
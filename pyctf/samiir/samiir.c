@@ -2,20 +2,25 @@
 
 #include <Python.h>
 #include <arrayobject.h>
+#include <omp.h>
 #include "filters.h"
+#include "fftplan.h"
 
 #define SIG_ORDER 4
 
 typedef struct {
     int type;
     IIRSPEC iirspec;            // used for type IIR
-    double *gain;               // used for type FFT
-    int n;                      // length of gain array
+    double *gain;               // used for types FFT, FHILB, and BANK
+    int n;                      // length of gain array (the data length)
+    int nband;                  // used for type BANK
+    int analytic;               // used for type BANK
 } FILTER;
 
 #define FILTER_TYPE_IIR 1
 #define FILTER_TYPE_FFT 2
 #define FILTER_TYPE_FHILB 3
+#define FILTER_TYPE_BANK 4
 
 #if PY_MAJOR_VERSION >= 3
 static void free_filter(PyObject *filter)
@@ -27,7 +32,7 @@ static void free_filter(void *filter)
     FILTER *f = (FILTER *)filter;
 #endif
 
-    if (f->type == FILTER_TYPE_FFT) {
+    if (f->type != FILTER_TYPE_IIR) {
         free(f->gain);
     }
     free(f);
@@ -116,6 +121,28 @@ static PyObject *mkiir_wrap(PyObject *self, PyObject *args)
     return o;
 }
 
+// Make the Butterworth gains for the band spec lo, hi, as for mkfft().
+
+static void bandgain(double *gain, int len, double lo, double hi, double srate)
+{
+    int type = BANDPASS;
+    double bwfreq, t;
+
+    if (hi > 0. && lo > 0. && lo < hi) {
+        type = BANDPASS;
+    } else if (hi > 0. && lo > 0. && lo > hi) {
+        type = BANDREJECT;
+        t = lo;
+        lo = hi;
+        hi = t;
+    } else if (lo > 0. && hi == 0.) {
+        type = HIGHPASS;
+    } else if (lo == 0. && hi > 0.) {
+        type = LOWPASS;
+    }
+    Butterworth(gain, len, lo, hi, srate, type, MAXORDER, &bwfreq);
+}
+
 static char Doc_mkfft[] =
 "filter = mkfft(lo, hi, srate, N) returns filter parameters (an opaque object)\n\
 for an N-point FFT filter with the specified parameters. lo, hi, and srate are\n\
@@ -125,8 +152,8 @@ to hi Hz, and if 0 < hi < lo, make a band-reject filter.";
 
 static PyObject *mkfft_wrap(PyObject *self, PyObject *args)
 {
-    int type, len;
-    double lo, hi, srate, bwfreq, t;
+    int len;
+    double lo, hi, srate;
     PyObject *o;
     FILTER *handle;
     double *filter;
@@ -144,19 +171,7 @@ static PyObject *mkfft_wrap(PyObject *self, PyObject *args)
     handle->gain = filter;
     handle->n = len;
 
-    if (hi > 0. && lo > 0. && lo < hi) {
-        type = BANDPASS;
-    } else if (hi > 0. && lo > 0. && lo > hi) {
-        type = BANDREJECT;
-        t = lo;
-        lo = hi;
-        hi = t;
-    } else if (lo > 0. && hi == 0.) {
-        type = HIGHPASS;
-    } else if (lo == 0. && hi > 0.) {
-        type = LOWPASS;
-    }
-    Butterworth(handle->gain, len, lo, hi, srate, type, MAXORDER, &bwfreq);
+    bandgain(handle->gain, len, lo, hi, srate);
 
 #if PY_MAJOR_VERSION >= 3
     o = PyCapsule_New(handle, NULL, free_filter);
@@ -175,8 +190,8 @@ to hi Hz, and if 0 < hi < lo, make a band-reject filter.";
 
 static PyObject *mkfhilb_wrap(PyObject *self, PyObject *args)
 {
-    int type, len;
-    double lo, hi, srate, bwfreq, t;
+    int len;
+    double lo, hi, srate;
     PyObject *o;
     FILTER *handle;
     double *filter;
@@ -194,19 +209,7 @@ static PyObject *mkfhilb_wrap(PyObject *self, PyObject *args)
     handle->gain = filter;
     handle->n = len;
 
-    if (hi > 0. && lo > 0. && lo < hi) {
-        type = BANDPASS;
-    } else if (hi > 0. && lo > 0. && lo > hi) {
-        type = BANDREJECT;
-        t = lo;
-        lo = hi;
-        hi = t;
-    } else if (lo > 0. && hi == 0.) {
-        type = HIGHPASS;
-    } else if (lo == 0. && hi > 0.) {
-        type = LOWPASS;
-    }
-    Butterworth(handle->gain, len, lo, hi, srate, type, MAXORDER, &bwfreq);
+    bandgain(handle->gain, len, lo, hi, srate);
 
 #if PY_MAJOR_VERSION >= 3
     o = PyCapsule_New(handle, NULL, free_filter);
@@ -216,20 +219,117 @@ static PyObject *mkfhilb_wrap(PyObject *self, PyObject *args)
     return o;
 }
 
-static char Doc_dofilt[] =
-"out = dofilt(in, filter) returns a filtered version of the array in.\n\
-filter should be the opaque object returned by mkiir() or mkfft().";
+static char Doc_mkbank[] =
+"bank = mkbank(bands, srate, N, analytic = False) returns a bank of N-point\n\
+FFT filters (an opaque object), one for each (lo, hi) pair in the sequence\n\
+bands, with the same meaning as for mkfft(). dofilt(x, bank) returns an\n\
+array of shape (nband,) + x.shape, the same as dofilt(x, mkfft(lo, hi,\n\
+srate, N)) for each band, or if analytic is true, the complex result of\n\
+mkfhilb() filters. Each row of x is transformed only once.";
 
-static PyObject *dofilt_wrap(PyObject *self, PyObject *args)
+static PyObject *mkbank_wrap(PyObject *self, PyObject *args, PyObject *kw)
 {
-    int n;
-    npy_intp dim[1];
-    PyObject *ao, *fo;
+    static char *kwlist[] = { "bands", "srate", "N", "analytic", NULL };
+    int b, i, len, nband, nbins, analytic = 0;
+    double lo, hi, srate;
+    double *gain, *g;
+    PyObject *o, *seq;
+    FILTER *handle;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "Odi|i:mkbank", kwlist,
+                                     &o, &srate, &len, &analytic)) {
+        return NULL;
+    }
+    if (len <= 0) {
+        PyErr_SetString(PyExc_ValueError, "N must be positive");
+        return NULL;
+    }
+
+    seq = PySequence_Fast(o, "bands must be a sequence of (lo, hi) pairs");
+    if (seq == NULL) {
+        return NULL;
+    }
+    nband = PySequence_Fast_GET_SIZE(seq);
+    nbins = len / 2 + 1;
+
+    handle = (FILTER *)malloc(sizeof(FILTER));
+    gain = (double *)malloc(len * sizeof(double));
+    g = (double *)malloc(nband * nbins * sizeof(double) + 1);
+    if (handle == NULL || gain == NULL || g == NULL) {
+        free(handle);
+        free(gain);
+        free(g);
+        Py_DECREF(seq);
+        return PyErr_NoMemory();
+    }
+    handle->type = FILTER_TYPE_BANK;
+    handle->gain = g;
+    handle->n = len;
+    handle->nband = nband;
+    handle->analytic = analytic != 0;
+
+    // Work out the per-bin gains that FFTfilter() or FHilbert()
+    // would apply to the non-negative frequencies.
+
+    for (b = 0; b < nband; b++, g += nbins) {
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, b), "dd", &lo, &hi)) {
+            free(handle->gain);
+            free(handle);
+            free(gain);
+            Py_DECREF(seq);
+            return NULL;
+        }
+        bandgain(gain, len, lo, hi, srate);
+        for (i = 0; i < nbins; i++) {
+            if (analytic) {
+                if (i < len / 2) {
+                    g[i] = 2. * gain[i];
+                } else {
+                    g[i] = len % 2 == 1 ? 1. : 0.;
+                }
+            } else {
+                g[i] = .5 * (FFTbingain(gain, i, len) + FFTbingain(gain, (len - i) % len, len));
+            }
+        }
+    }
+    free(gain);
+    Py_DECREF(seq);
+
+#if PY_MAJOR_VERSION >= 3
+    return PyCapsule_New(handle, NULL, free_filter);
+#else
+    return PyCObject_FromVoidPtr(handle, free_filter);
+#endif
+}
+
+static char Doc_dofilt[] =
+"out = dofilt(in, filter, out = None, nthreads = 1) returns a filtered version\n\
+of the array in, which is either 1D, or 2D with one time-series per row.\n\
+filter should be the opaque object returned by mkiir(), mkfft(), mkfhilb(),\n\
+or mkbank() (which adds a leading band axis to the result). If out is given,\n\
+the result is stored there; it must be a contiguous array with the shape of\n\
+the result, of type double (complex for mkfhilb() and analytic mkbank()).\n\
+If in is a float32 array, the filtering is done in single precision, and the\n\
+result is float32 (complex64). The rows are filtered with the GIL released,\n\
+using nthreads OpenMP threads across the rows (0 means use all of the\n\
+available cores).";
+
+static PyObject *dofilt_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "in", "filter", "out", "nthreads", NULL };
+    int n, nrows, ndim, ondim, otype, single, nthreads = 1, err = 0;
+    npy_intp ostride, odims[3];
+    double *in = NULL, *out = NULL;
+    float *inf = NULL, *outf = NULL;
+    PyObject *ao, *fo, *oo = NULL;
     PyArrayObject *a, *r;
     FILTER *handle;
     IIRSPEC *filter;
+    fftw_plan p1 = NULL, p2 = NULL;
+    fftwf_plan q1 = NULL, q2 = NULL;
 
-    if (!PyArg_ParseTuple(args, "OO:dofilt", &ao, &fo)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "OO|Oi:dofilt", kwlist,
+                                     &ao, &fo, &oo, &nthreads)) {
         return NULL;
     }
 
@@ -247,51 +347,166 @@ static PyObject *dofilt_wrap(PyObject *self, PyObject *args)
     handle = (FILTER *)PyCObject_AsVoidPtr(fo);
 #endif
 
-    a = (PyArrayObject *)PyArray_ContiguousFromAny(ao, NPY_DOUBLE, 1, 1);
+    // Single precision data are filtered in single precision.
+    single = PyArray_Check(ao) && PyArray_TYPE((PyArrayObject *)ao) == NPY_FLOAT32;
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(ao, single ? NPY_FLOAT32 : NPY_DOUBLE, 1, 2);
     if (a == NULL) {
         return NULL;
     }
-    n = PyArray_DIM(a, 0);
+    ndim = PyArray_NDIM(a);
+    n = PyArray_DIM(a, ndim - 1);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
 
-    dim[0] = n;
-    if (handle->type == FILTER_TYPE_FHILB) {
-        r = (PyArrayObject *)PyArray_SimpleNew(1, dim, NPY_COMPLEX128);
+    // sanity check -- len must match filter
+    if (handle->type != FILTER_TYPE_IIR && n != handle->n) {
+        PyErr_SetString(PyExc_RuntimeError, "filter length mismatch");
+        Py_DECREF(a);
+        return NULL;
+    }
+
+    // A filter bank's result has a leading band axis.
+    otype = single ? NPY_FLOAT32 : NPY_DOUBLE;
+    if (handle->type == FILTER_TYPE_FHILB ||
+        (handle->type == FILTER_TYPE_BANK && handle->analytic)) {
+        otype = single ? NPY_COMPLEX64 : NPY_COMPLEX128;
+    }
+    ondim = 0;
+    if (handle->type == FILTER_TYPE_BANK) {
+        odims[ondim++] = handle->nband;
+    }
+    memcpy(odims + ondim, PyArray_DIMS(a), ndim * sizeof(npy_intp));
+    ondim += ndim;
+
+    if (oo == NULL || oo == Py_None) {
+        r = (PyArrayObject *)PyArray_SimpleNew(ondim, odims, otype);
         if (r == NULL) {
             Py_DECREF(a);
             return NULL;
         }
     } else {
-        r = (PyArrayObject *)PyArray_SimpleNew(1, dim, NPY_DOUBLE);
-        if (r == NULL) {
+        r = (PyArrayObject *)oo;
+        if (!PyArray_Check(oo) || PyArray_TYPE(r) != otype ||
+            !PyArray_IS_C_CONTIGUOUS(r) || !PyArray_ISWRITEABLE(r) ||
+            !PyArray_CompareLists(PyArray_DIMS(r), odims, ondim) ||
+            PyArray_NDIM(r) != ondim) {
+            PyErr_SetString(PyExc_ValueError, "out must be a contiguous array of the right type and shape");
             Py_DECREF(a);
             return NULL;
         }
+        Py_INCREF(r);
     }
 
-    if (handle->type == FILTER_TYPE_IIR) {
-        filter = (IIRSPEC *)&handle->iirspec;
-        if (bdiir((double *)PyArray_DATA(a), (double *)PyArray_DATA(r), n, filter) < 0) {
-            PyErr_SetString(PyExc_RuntimeError, "bdiir() failed");  // because it allocates memory,
-            Py_DECREF(a);                                           // which it shouldn't
-            Py_DECREF(r);
-            return NULL;
-        }
+    if (single) {
+        inf = (float *)PyArray_DATA(a);
+        outf = (float *)PyArray_DATA(r);
     } else {
-        // sanity check -- len must match filter
-        if (n != handle->n) {
-            PyErr_SetString(PyExc_RuntimeError, "filter length mismatch");
-            Py_DECREF(a);
-            Py_DECREF(r);
-            return NULL;
-        }
-        if (handle->type == FILTER_TYPE_FHILB) {
-            FHilbert((double *)PyArray_DATA(a), (double *)PyArray_DATA(r), handle->gain, n);
+        in = (double *)PyArray_DATA(a);
+        out = (double *)PyArray_DATA(r);
+    }
+    ostride = PyTypeNum_ISCOMPLEX(otype) ? 2 * n : n;
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+
+    // The plans have to be made with the GIL held.
+    filter = (IIRSPEC *)&handle->iirspec;
+    if (handle->type != FILTER_TYPE_IIR) {
+        int kind = PyTypeNum_ISCOMPLEX(otype) ? FFTPLAN_BACKWARD : FFTPLAN_C2R;
+        if (single) {
+            q1 = fftplan_getf(n, FFTPLAN_R2C);
+            q2 = fftplan_getf(n, kind);
+            if (q1 == NULL || q2 == NULL) {
+                err = 1;
+            }
         } else {
-            FFTfilter((double *)PyArray_DATA(a), (double *)PyArray_DATA(r), handle->gain, n);
+            p1 = fftplan_get(n, FFTPLAN_R2C);
+            p2 = fftplan_get(n, kind);
+            if (p1 == NULL || p2 == NULL) {
+                err = 1;
+            }
+        }
+        if (err) {
+            nrows = 0;
         }
     }
 
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    {
+        int j;
+        double *tmp = NULL;
+
+        // Each thread has its own scratch array.
+        if (handle->type == FILTER_TYPE_IIR) {
+            tmp = (double *)malloc((single ? 2 : 1) * n * sizeof(double));
+            if (tmp == NULL) {
+                err = 1;
+            }
+        }
+#pragma omp for
+        for (j = 0; j < nrows; j++) {
+            if (single) {
+                if (handle->type == FILTER_TYPE_IIR) {
+                    if (tmp) {
+                        bdiirf(inf + (npy_intp)j * n, outf + (npy_intp)j * ostride, n, filter, tmp);
+                    }
+                } else if (handle->type == FILTER_TYPE_BANK) {
+                    if (FFTbankf(inf + (npy_intp)j * n, outf + (npy_intp)j * ostride, handle->gain, handle->nband, n,
+                                 (long)nrows * ostride, handle->analytic, q1, q2) < 0) {
+                        err = 1;
+                    }
+                } else if (handle->type == FILTER_TYPE_FHILB) {
+                    if (FHilbertf(inf + (npy_intp)j * n, outf + (npy_intp)j * ostride, handle->gain, n, q1, q2) < 0) {
+                        err = 1;
+                    }
+                } else {
+                    if (FFTfilterf(inf + (npy_intp)j * n, outf + (npy_intp)j * ostride, handle->gain, n, q1, q2) < 0) {
+                        err = 1;
+                    }
+                }
+            } else if (handle->type == FILTER_TYPE_IIR) {
+                if (tmp) {
+                    bdiir(in + (npy_intp)j * n, out + (npy_intp)j * ostride, n, filter, tmp);
+                }
+            } else if (handle->type == FILTER_TYPE_BANK) {
+                if (FFTbank(in + (npy_intp)j * n, out + (npy_intp)j * ostride, handle->gain, handle->nband, n,
+                            (long)nrows * ostride, handle->analytic, p1, p2) < 0) {
+                    err = 1;
+                }
+            } else if (handle->type == FILTER_TYPE_FHILB) {
+                if (FHilbert(in + (npy_intp)j * n, out + (npy_intp)j * ostride, handle->gain, n, p1, p2) < 0) {
+                    err = 1;
+                }
+            } else {
+                if (FFTfilter(in + (npy_intp)j * n, out + (npy_intp)j * ostride, handle->gain, n, p1, p2) < 0) {
+                    err = 1;
+                }
+            }
+        }
+        free(tmp);
+    }
+
+    Py_END_ALLOW_THREADS
+
+    if (p1) {
+        fftplan_release(p1);
+    }
+    if (p2) {
+        fftplan_release(p2);
+    }
+    if (q1) {
+        fftplan_releasef(q1);
+    }
+    if (q2) {
+        fftplan_releasef(q2);
+    }
+
     Py_DECREF(a);
+    if (err) {
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
     return PyArray_Return(r);
 }
 
@@ -363,6 +578,295 @@ static PyObject *getiir_wrap(PyObject *self, PyObject *args)
     return tup;
 }
 
+static char Doc_getzpk[] =
+"z, p, k = getzpk(filter) returns the zeroes, poles, and gain of an IIR\n\
+filter, in the z-plane.\n";
+
+static PyObject *getzpk_wrap(PyObject *self, PyObject *args)
+{
+    int i;
+    char *errs;
+    double *x, *y;
+    npy_intp dim[1];
+    PyObject *fo;
+    PyArrayObject *a, *b;
+    FILTER *handle;
+    IIRSPEC *filter;
+
+    if (!PyArg_ParseTuple(args, "O:getzpk", &fo)) {
+        return NULL;
+    }
+
+    errs = "argument must be a filter object from mkiir()";
+#if PY_MAJOR_VERSION >= 3
+    if (!PyCapsule_CheckExact(fo)) {
+#else
+    if (!PyCObject_Check(fo)) {
+#endif
+        PyErr_SetString(PyExc_TypeError, errs);
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    handle = (FILTER *)PyCapsule_GetPointer(fo, NULL);
+#else
+    handle = (FILTER *)PyCObject_AsVoidPtr(fo);
+#endif
+    if (handle->type != FILTER_TYPE_IIR) {
+        PyErr_SetString(PyExc_TypeError, errs);
+        return NULL;
+    }
+    filter = &handle->iirspec;
+
+    // create return arrays
+
+    dim[0] = filter->NP;
+    a = (PyArrayObject *)PyArray_SimpleNew(1, dim, NPY_CDOUBLE);
+    if (a == NULL) {
+        return NULL;
+    }
+    b = (PyArrayObject *)PyArray_SimpleNew(1, dim, NPY_CDOUBLE);
+    if (b == NULL) {
+        Py_DECREF(a);
+        return NULL;
+    }
+
+    x = (double *)PyArray_DATA(a);
+    y = (double *)PyArray_DATA(b);
+    for (i = 0; i < filter->NP; i++) {
+        *x++ = filter->zre[i];
+        *x++ = filter->zim[i];
+        *y++ = filter->pre[i];
+        *y++ = filter->pim[i];
+    }
+
+    return Py_BuildValue("NNd", a, b, filter->gain);
+}
+
+static char Doc_sosfilt[] =
+"out = sosfilt(sos, in, zi, out = None, reverse = False, nthreads = 1) filters\n\
+the array in, which is either 1D, or 2D with one time-series per row, with\n\
+the cascade of second-order sections sos, an (nsec, 6) array of rows\n\
+b0, b1, b2, 1, a1, a2. zi is the state, a contiguous double array of\n\
+nrows * nsec * 2 elements (e.g. shape (nrows, nsec, 2)); it is updated in\n\
+place, so the next block carries on where this one left off. out may be\n\
+in. If reverse is true, the rows are filtered from end to beginning.\n\
+The rows are filtered with the GIL released, using nthreads OpenMP threads.";
+
+static PyObject *sosfilt_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "sos", "in", "zi", "out", "reverse", "nthreads", NULL };
+    int j, n, nrows, nsec, ndim, reverse = 0, nthreads = 1;
+    double *sos, *in, *out, *zi;
+    PyObject *so, *ao, *zo, *oo = NULL;
+    PyArrayObject *s, *a, *z, *r;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "OOO|Oii:sosfilt", kwlist,
+                                     &so, &ao, &zo, &oo, &reverse, &nthreads)) {
+        return NULL;
+    }
+
+    s = (PyArrayObject *)PyArray_ContiguousFromAny(so, NPY_DOUBLE, 2, 2);
+    if (s == NULL) {
+        return NULL;
+    }
+    if (PyArray_DIM(s, 1) != 6) {
+        PyErr_SetString(PyExc_ValueError, "sos must have 6 columns");
+        Py_DECREF(s);
+        return NULL;
+    }
+    nsec = PyArray_DIM(s, 0);
+
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(ao, NPY_DOUBLE, 1, 2);
+    if (a == NULL) {
+        Py_DECREF(s);
+        return NULL;
+    }
+    ndim = PyArray_NDIM(a);
+    n = PyArray_DIM(a, ndim - 1);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
+
+    z = (PyArrayObject *)zo;
+    if (!PyArray_Check(zo) || PyArray_TYPE(z) != NPY_DOUBLE ||
+        !PyArray_IS_C_CONTIGUOUS(z) || !PyArray_ISWRITEABLE(z) ||
+        PyArray_SIZE(z) != (npy_intp)nrows * nsec * 2) {
+        PyErr_SetString(PyExc_ValueError, "zi must be a contiguous double array of nrows * nsec * 2 elements");
+        Py_DECREF(s);
+        Py_DECREF(a);
+        return NULL;
+    }
+
+    if (oo == NULL || oo == Py_None) {
+        r = (PyArrayObject *)PyArray_SimpleNew(ndim, PyArray_DIMS(a), NPY_DOUBLE);
+        if (r == NULL) {
+            Py_DECREF(s);
+            Py_DECREF(a);
+            return NULL;
+        }
+    } else {
+        r = (PyArrayObject *)oo;
+        if (!PyArray_Check(oo) || PyArray_TYPE(r) != NPY_DOUBLE ||
+            !PyArray_IS_C_CONTIGUOUS(r) || !PyArray_ISWRITEABLE(r) ||
+            !PyArray_SAMESHAPE(a, r)) {
+            PyErr_SetString(PyExc_ValueError, "out must be a contiguous double array with the same shape as in");
+            Py_DECREF(s);
+            Py_DECREF(a);
+            return NULL;
+        }
+        Py_INCREF(r);
+    }
+
+    sos = (double *)PyArray_DATA(s);
+    in = (double *)PyArray_DATA(a);
+    out = (double *)PyArray_DATA(r);
+    zi = (double *)PyArray_DATA(z);
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel for num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    for (j = 0; j < nrows; j++) {
+        sosfilt(sos, nsec, in + (npy_intp)j * n, out + (npy_intp)j * n, n, zi + (npy_intp)j * nsec * 2, reverse);
+    }
+
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(s);
+    Py_DECREF(a);
+    return PyArray_Return(r);
+}
+
+static char Doc_resample[] =
+"out = resample(in, up, down, out = None, offset = 0, ntaps = 0, beta = 5.,\n\
+nthreads = 1) changes the sample rate of the array in, which is either 1D,\n\
+or 2D with one time-series per row, by the factor up / down (which is\n\
+reduced to lowest terms first). The data are lowpass filtered below the\n\
+lower of the two Nyquist frequencies by a polyphase ntaps-tap (default,\n\
+20 * max(up, down) + 1) zero-delay Kaiser windowed sinc filter with\n\
+parameter beta, and the ends are extended by odd reflection. Output\n\
+sample m is at input sample (m * down + offset) / up, so an N sample row\n\
+gives ((N - 1) * up - offset) / down + 1 samples (offset >= 0). If\n\
+out is given, the result is stored there; it must be a contiguous double\n\
+array of the right shape. The rows are done with the GIL released, using\n\
+nthreads OpenMP threads (0 means use all of the available cores).";
+
+static PyObject *resample_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "in", "up", "down", "out", "offset", "ntaps",
+                              "beta", "nthreads", NULL };
+    int n, ny, nrows, ndim, up, down, g, t, offset = 0, ntaps = 0;
+    int nthreads = 1, err = 0;
+    double beta = 5.;
+    double *in, *out, *poly;
+    npy_intp odims[2];
+    PyObject *ao, *oo = NULL;
+    PyArrayObject *a, *r;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "Oii|Oiidi:resample", kwlist,
+                                     &ao, &up, &down, &oo, &offset, &ntaps,
+                                     &beta, &nthreads)) {
+        return NULL;
+    }
+    if (up <= 0 || down <= 0) {
+        PyErr_SetString(PyExc_ValueError, "up and down must be positive");
+        return NULL;
+    }
+    for (g = up, t = down; t; ) {
+        n = g % t;
+        g = t;
+        t = n;
+    }
+    up /= g;
+    down /= g;
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "offset must be >= 0");
+        return NULL;
+    }
+    if (ntaps <= 0) {
+        ntaps = 20 * (up > down ? up : down) + 1;
+    }
+
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(ao, NPY_DOUBLE, 1, 2);
+    if (a == NULL) {
+        return NULL;
+    }
+    ndim = PyArray_NDIM(a);
+    n = PyArray_DIM(a, ndim - 1);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
+    ny = resamplelen(n, up, down, offset);
+    if (ndim == 2) {
+        odims[0] = nrows;
+    }
+    odims[ndim - 1] = ny;
+
+    if (oo == NULL || oo == Py_None) {
+        r = (PyArrayObject *)PyArray_SimpleNew(ndim, odims, NPY_DOUBLE);
+        if (r == NULL) {
+            Py_DECREF(a);
+            return NULL;
+        }
+    } else {
+        r = (PyArrayObject *)oo;
+        if (!PyArray_Check(oo) || PyArray_TYPE(r) != NPY_DOUBLE ||
+            !PyArray_IS_C_CONTIGUOUS(r) || !PyArray_ISWRITEABLE(r) ||
+            PyArray_NDIM(r) != ndim ||
+            !PyArray_CompareLists(PyArray_DIMS(r), odims, ndim)) {
+            PyErr_SetString(PyExc_ValueError, "out must be a contiguous double array of the right shape");
+            Py_DECREF(a);
+            return NULL;
+        }
+        Py_INCREF(r);
+    }
+
+    poly = mkresample(up, down, ntaps, beta);
+    if (poly == NULL) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
+    in = (double *)PyArray_DATA(a);
+    out = (double *)PyArray_DATA(r);
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+    if (ny == 0) {
+        nrows = 0;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    {
+        int j;
+        double *tmp;
+
+        // Each thread has its own scratch array.
+        tmp = (double *)malloc((n + 2 * NPHASE(ntaps | 1, up)) * sizeof(double));
+        if (tmp == NULL) {
+            err = 1;
+        }
+#pragma omp for
+        for (j = 0; j < nrows; j++) {
+            if (tmp) {
+                resample(in + (long)j * n, n, out + (long)j * ny, ny, poly, ntaps,
+                         up, down, offset, tmp);
+            }
+        }
+        free(tmp);
+    }
+
+    Py_END_ALLOW_THREADS
+
+    free(poly);
+    Py_DECREF(a);
+    if (err) {
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
+    return PyArray_Return(r);
+}
+
 static char Doc_getfft[] =
 "gain = getfft(filter) returns the FFT filter gains.\n";
 
@@ -421,18 +925,106 @@ static PyObject *getfft_wrap(PyObject *self, PyObject *args)
     return PyArray_Return(a);
 }
 
+static char Doc_warmup[] =
+"warmup(lengths) makes the FFT plans for each length in the sequence lengths\n\
+ahead of time, so their wisdom is available to later jobs. The plans are\n\
+cached and shared with the st module.";
+
+static PyObject *warmup_wrap(PyObject *self, PyObject *args)
+{
+    int i, j, n, len;
+    static int kinds[] = { FFTPLAN_R2C, FFTPLAN_C2R, FFTPLAN_BACKWARD };
+    fftw_plan p;
+    PyObject *o, *seq;
+
+    if (!PyArg_ParseTuple(args, "O:warmup", &o)) {
+        return NULL;
+    }
+
+    seq = PySequence_Fast(o, "lengths must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+    n = PySequence_Fast_GET_SIZE(seq);
+    for (i = 0; i < n; i++) {
+        len = PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+        if (len <= 0) {
+            if (!PyErr_Occurred()) {
+                PyErr_SetString(PyExc_ValueError, "lengths must be positive");
+            }
+            Py_DECREF(seq);
+            return NULL;
+        }
+        for (j = 0; j < (int)(sizeof(kinds) / sizeof(int)); j++) {
+            p = fftplan_get(len, kinds[j]);
+            if (p == NULL) {
+                Py_DECREF(seq);
+                return PyErr_NoMemory();
+            }
+            fftplan_release(p);
+        }
+    }
+    Py_DECREF(seq);
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static char Doc_setwisdom[] =
+"setwisdom(path) uses path as the FFTW wisdom file, instead of the one\n\
+given by $PYCTF_FFTW_WISDOM (default ~/.fftwis). None means don't use a\n\
+file. Any new wisdom is saved to the old file first. The wisdom file is\n\
+read once, and written once at exit, with the file locked.";
+
+static PyObject *setwisdom_wrap(PyObject *self, PyObject *args)
+{
+    char *path = NULL;
+
+    if (!PyArg_ParseTuple(args, "z:setwisdom", &path)) {
+        return NULL;
+    }
+    fftplan_setwisdom(path);
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static char Doc_savewisdom[] =
+"savewisdom() writes any new FFTW wisdom to the wisdom file now, rather\n\
+than waiting until exit.";
+
+static PyObject *savewisdom_wrap(PyObject *self, PyObject *args)
+{
+    if (fftplan_savewisdom() < 0) {
+        PyErr_SetString(PyExc_IOError, "can't write the wisdom file");
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+static FFTPLAN_API Fftplan_api = { fftplan_get, fftplan_release, fftplan_buf };
+
 static char Doc_samiir[] =
 "Time-series filters. First call either mkfft() or mkiir() to create\n\
 an FFT-based filter or an IIR filter respectively, then use dofilt()\n\
-to filter a 1D array of data.";
+to filter a 1D array of data, or each row of a 2D array.";
 
 static PyMethodDef Methods[] = {
     { "mkiir", mkiir_wrap, METH_VARARGS, Doc_mkiir },
     { "mkfft", mkfft_wrap, METH_VARARGS, Doc_mkfft },
     { "mkfhilb", mkfhilb_wrap, METH_VARARGS, Doc_mkfhilb },
-    { "dofilt", dofilt_wrap, METH_VARARGS, Doc_dofilt },
+    { "mkbank", (PyCFunction)mkbank_wrap, METH_VARARGS | METH_KEYWORDS, Doc_mkbank },
+    { "dofilt", (PyCFunction)dofilt_wrap, METH_VARARGS | METH_KEYWORDS, Doc_dofilt },
     { "getiir", getiir_wrap, METH_VARARGS, Doc_getiir },
     { "getfft", getfft_wrap, METH_VARARGS, Doc_getfft },
+    { "getzpk", getzpk_wrap, METH_VARARGS, Doc_getzpk },
+    { "sosfilt", (PyCFunction)sosfilt_wrap, METH_VARARGS | METH_KEYWORDS, Doc_sosfilt },
+    { "resample", (PyCFunction)resample_wrap, METH_VARARGS | METH_KEYWORDS, Doc_resample },
+    { "warmup", warmup_wrap, METH_VARARGS, Doc_warmup },
+    { "setwisdom", setwisdom_wrap, METH_VARARGS, Doc_setwisdom },
+    { "savewisdom", savewisdom_wrap, METH_NOARGS, Doc_savewisdom },
     { NULL, NULL, 0, NULL }
 };
 
@@ -458,6 +1050,9 @@ PyMODINIT_FUNC PyInit_samiir(void)
 
     import_array();
 
+    // Share the plan cache with the st module.
+    PyModule_AddObject(m, "_fftplan", PyCapsule_New(&Fftplan_api, FFTPLAN_CAPSULE, NULL));
+
     return m;
 }
 
@@ -465,8 +1060,11 @@ PyMODINIT_FUNC PyInit_samiir(void)
 
 PyMODINIT_FUNC initsamiir(void)
 {
-    Py_InitModule3("samiir", Methods, Doc_samiir);
+    PyObject *m;
+
+    m = Py_InitModule3("samiir", Methods, Doc_samiir);
     import_array();
+    PyModule_AddObject(m, "_fftplan", PyCapsule_New(&Fftplan_api, FFTPLAN_CAPSULE, NULL));
 }
 
 #endif
@@ -0,0 +1,40 @@
+// sosfilt() - causal iir filter, as a cascade of second-order sections
+//
+//      Each section is b0, b1, b2, a0, a1, a2 (a0 == 1), applied in
+//      transposed direct form II. The state Z[2 * nsec] is carried
+//      from one call to the next, so a long series can be filtered
+//      a block at a time. If reverse is set, the block is filtered
+//      from the end to the beginning (for forward-backward filtering).
+//
+
+#include "filters.h"
+
+void sosfilt(double *sos,       // sos[6 * nsec] -- the sections
+	     int nsec,          // number of sections
+	     double *In,        // input data array
+	     double *Out,       // output data array (may be In)
+	     int T,             // number of points in data array
+	     double *Z,         // state, Z[2 * nsec]
+	     int reverse        // filter backwards
+) {
+    register double x;          // section input
+    register double y;          // section output
+    register double *s;         // current section
+    register double *z;         // its state
+    int t;                      // time-index
+    int i;                      // section-index
+    int t0, dt;                 // first sample and direction
+
+    t0 = reverse ? T - 1 : 0;
+    dt = reverse ? -1 : 1;
+    for (t = t0; t >= 0 && t < T; t += dt) {
+	x = In[t];
+	for (i = 0, s = sos, z = Z; i < nsec; i++, s += 6, z += 2) {
+	    y = s[0] * x + z[0];
+	    z[0] = s[1] * x - s[4] * y + z[1];
+	    z[1] = s[2] * x - s[5] * y;
+	    x = y;
+	}
+	Out[t] = x;
+    }
+}
@@ -0,0 +1,319 @@
+"""Filters for continuous data of any length, applied a block at a time.
+
+    f = firstream(lo, hi, srate)            # overlap-save FIR
+    f = iirstream(mkiir(lo, hi, srate))     # IIR, as second-order sections
+    for s, y in f.stream(ds, idx):
+        ...                     # y is (len(idx), k), starting at sample s
+
+    y = f.filter(x)             # or feed it chunks yourself
+    y = f.flush()               # zero-phase mode: the last f.delay samples
+"""
+
+import numpy as np
+from .samiir import mkfft, getfft, getzpk, sosfilt
+
+__all__ = ['firstream', 'iirstream', 'zpk2sos']
+
+def fastlen(n):
+    """Return the smallest power of two >= n."""
+    return 1 << max(n - 1, 0).bit_length()
+
+def defaultTaps(lo, hi, srate):
+    """Choose the number of taps for a band spec: enough for about 4
+    cycles of the narrowest feature (an edge frequency, or the width of
+    a band), so that it is resolved."""
+
+    df = [f for f in (lo, hi) if f > 0]
+    if lo > 0 and hi > 0:
+        df.append(abs(hi - lo))
+    return 2 * int(np.ceil(2. * srate / min(df))) + 1
+
+class blockfilter:
+    """The part common to the stream filters, which define filter(),
+    flush(), reset(), and step, the default chunk size."""
+
+    def stream(self, ds, idx, chunk = 0, start = 0, n = 0):
+        """Generate (s, y) for the filtered data from channels [idx] of
+        the dataset ds, read chunk samples at a time (default, self.step)
+        with ds.readContinuous(), where the trials are taken to be back
+        to back. y is (nch, k), and starts at sample s of the run. By
+        default the whole run is filtered; start and n select part of it.
+        In zero-phase mode, the output starts at start and ends at
+        start + n just like the input."""
+
+        if chunk <= 0:
+            chunk = self.step
+        if n <= 0:
+            n = ds.getNumberOfTrials() * ds.getNumberOfSamples() - start
+        self.reset()
+        buf = None
+        s = start
+        t = start
+        while t < start + n:
+            k = min(chunk, start + n - t)
+            if buf is None or buf.shape[-1] != k:
+                buf = ds.readContinuous(t, k, idx, demean = False)
+            else:
+                ds.readContinuous(t, k, idx, buf, demean = False)
+            y = self.filter(buf)
+            t += k
+            if y.shape[-1]:
+                yield s, y
+                s += y.shape[-1]
+        y = self.flush()
+        if y.shape[-1]:
+            yield s, y
+
+class firstream(blockfilter):
+
+    def __init__(self, lo, hi, srate, ntaps = 0, block = 0, zerophase = False):
+        """f = firstream(lo, hi, srate, ntaps = 0, block = 0, zerophase = False)
+        Make a linear-phase FIR filter with the band spec of mkfft() (lo,
+        hi, and srate in Hz), and apply it to a stream of data by
+        overlap-save, so data of any length can be filtered with constant
+        memory.
+
+        The taps are designed by sampling the same Butterworth gain that
+        mkfft() uses, and windowing (Hamming) to ntaps taps (made odd).
+        If ntaps is 0, it is chosen from the band spec. block is the
+        number of new samples per FFT (default, 3 * ntaps); the FFT length
+        is a power of two >= block + ntaps - 1.
+
+        The output is delayed by f.delay = (ntaps - 1) / 2 samples. If
+        zerophase is true the delay is removed: filter() returns the
+        output aligned with its input, so at first it returns f.delay
+        fewer samples than it is given, and flush() returns the rest."""
+
+        if ntaps <= 0:
+            ntaps = defaultTaps(lo, hi, srate)
+        ntaps |= 1
+        self.lo, self.hi, self.srate = lo, hi, srate
+        self.ntaps = ntaps
+        self.delay = (ntaps - 1) // 2
+        self.zerophase = zerophase
+
+        self.h = self.design(ntaps)
+        if block <= 0:
+            block = 3 * ntaps
+        self.nfft = fastlen(block + ntaps - 1)
+        self.step = self.nfft - ntaps + 1
+        self.H = np.fft.rfft(self.h, self.nfft)
+        self.reset()
+
+    def design(self, ntaps):
+        """Return the ntaps (odd) filter taps."""
+
+        # Sample the gain finely, and take the impulse response, which
+        # is symmetric about 0; center it and window it.
+
+        L = fastlen(8 * ntaps)
+        g = getfft(mkfft(self.lo, self.hi, self.srate, L))[: L // 2 + 1]
+        h = np.fft.irfft(g, L)
+        D = (ntaps - 1) // 2
+        h = np.roll(h, D)[:ntaps]
+        return h * np.hamming(ntaps)
+
+    def reset(self):
+        """Start a new stream."""
+
+        self.hist = None        # the last ntaps - 1 input samples
+        self.skip = self.delay if self.zerophase else 0
+
+    def filter(self, x):
+        """Filter the next chunk x, a 1D array or a 2D array with one
+        channel per row. Returns the filtered chunk (see zerophase)."""
+
+        x = np.asarray(x, dtype = float)
+        self.oned = x.ndim == 1
+        x = np.atleast_2d(x)
+        nch, k = x.shape
+        m = self.ntaps - 1
+        if self.hist is None:
+            self.hist = np.zeros((nch, m))
+        elif self.hist.shape[0] != nch:
+            raise ValueError("expected {} channels, got {}".format(self.hist.shape[0], nch))
+
+        buf = np.concatenate((self.hist, x), axis = 1)
+        y = np.empty((nch, k))
+        for s in range(0, k, self.step):
+            n = min(self.step, k - s)
+            Y = np.fft.irfft(np.fft.rfft(buf[:, s : s + n + m], self.nfft) * self.H, self.nfft)
+            y[:, s : s + n] = Y[:, m : m + n]
+        self.hist = buf[:, k:].copy()
+
+        if self.skip:
+            d = min(self.skip, k)
+            y = y[:, d:]
+            self.skip -= d
+        return y[0] if self.oned else y
+
+    def flush(self):
+        """End the stream. In zero-phase mode, return the last delay
+        samples of output (the data are taken to be 0 after the end);
+        otherwise there is nothing left, and an empty array is returned."""
+
+        if self.hist is None:
+            return np.zeros((0,))
+        nch = self.hist.shape[0]
+        z = np.zeros((nch, self.delay if self.zerophase else 0))
+        y = self.filter(z[0] if self.oned else z)
+        self.reset()
+        return y
+
+def pairs(r, tol = 1e-10):
+    """Split the roots r into conjugate pairs, and pairs of real roots
+    (with a single one left over if need be)."""
+
+    r = np.asarray(r, dtype = complex)
+    real = abs(r.imag) <= tol * np.maximum(abs(r), 1.)
+    pr = [(c, c.conjugate()) for c in r[~real & (r.imag > 0)]]
+    x = sorted(r[real].real)
+    pr.extend(tuple(x[i : i + 2]) for i in range(0, len(x), 2))
+    return pr
+
+def zpk2sos(z, p, k):
+    """Return the (nsec, 6) array of second-order sections, rows of
+    b0, b1, b2, 1, a1, a2, for the filter with z-plane zeroes z, poles p,
+    and gain k (e.g. from getzpk()). Each pair of poles gets the nearest
+    pair of zeroes, the sections are ordered so that the poles nearest
+    the unit circle come last, and the gain goes in the first section."""
+
+    pp = sorted(pairs(p), key = lambda q: max(abs(np.array(q))))
+    zp = pairs(z)
+    if len(zp) > len(pp):
+        raise ValueError("more zeroes than poles")
+
+    sos = np.zeros((len(pp), 6))
+    for i, q in enumerate(pp):
+        b = np.ones(1)
+        if zp:
+            j = min(range(len(zp)), key = lambda j: abs(zp[j][0] - q[0]))
+            b = np.poly(zp.pop(j)).real
+        a = np.poly(q).real
+        sos[i, : len(b)] = b        # in powers of 1/z
+        sos[i, 3 : 3 + len(a)] = a
+    sos[0, :3] *= k
+    return sos
+
+def steadyState(sos):
+    """Return the (nsec, 2) state of the sections after a long run of
+    unit input, so that filtering can start without a transient."""
+
+    zi = np.zeros((len(sos), 2))
+    g = 1.
+    for i, (b0, b1, b2, a0, a1, a2) in enumerate(sos):
+        G = (b0 + b1 + b2) / (1. + a1 + a2)
+        zi[i] = g * (b1 + b2 - (a1 + a2) * G), g * (b2 - a2 * G)
+        g *= G
+    return zi
+
+def decayLength(sos, tol = 1e-12, maxlen = 1 << 22):
+    """Return the number of samples after which all but tol of the
+    energy of the impulse response has arrived."""
+
+    n = 1024
+    while True:
+        x = np.zeros(n)
+        x[0] = 1.
+        h = sosfilt(sos, x, np.zeros((len(sos), 2)))
+        e = np.cumsum(h * h)
+        if e[-1] - e[n // 2] <= tol * e[-1] or n >= maxlen:
+            break
+        n *= 2
+    return int(np.searchsorted(e, e[-1] * (1. - tol))) + 1
+
+class iirstream(blockfilter):
+
+    def __init__(self, filter, zerophase = False, lookahead = 0, steady = True,
+                 nthreads = 1):
+        """f = iirstream(filter, zerophase = False, lookahead = 0, steady = True)
+        Apply the IIR filter from mkiir() to a stream of data, as a
+        cascade of second-order sections (f.sos) with the state carried
+        from one chunk to the next, so the result doesn't depend on how
+        the data are chunked.
+
+        Without zerophase, the filter is causal, like the first pass of
+        dofilt(). With zerophase, it is filtered forward and then backward
+        like dofilt(), but the backward pass of each chunk only looks
+        lookahead samples past its end (default, long enough for the
+        impulse response to decay to 1e-12 of its energy), so filter()
+        returns output lookahead samples (f.delay) behind its input, and
+        flush() returns the rest.
+
+        If steady is true, the state starts out as if the first sample
+        had been there forever (and likewise at the end of the backward
+        passes), which avoids a start-up transient. Unlike dofilt(), no
+        offset is subtracted, so filters that pass DC keep it. nthreads
+        is as for dofilt()."""
+
+        z, p, k = getzpk(filter)
+        self.sos = zpk2sos(z, p, k)
+        self.zss = steadyState(self.sos)
+        self.zerophase = zerophase
+        self.steady = steady
+        self.nthreads = nthreads
+        if zerophase and lookahead <= 0:
+            lookahead = decayLength(self.sos)
+        self.delay = lookahead if zerophase else 0
+        self.step = max(self.delay, 4096)
+        self.reset()
+
+    def reset(self):
+        """Start a new stream."""
+
+        self.zi = None          # forward state, (nch, nsec, 2)
+        self.buf = None         # zero-phase: forward output not yet returned
+
+    def initState(self, x0):
+        """Return the starting state for rows whose first sample is x0."""
+
+        zi = np.zeros((len(x0),) + self.zss.shape)
+        if self.steady:
+            zi += self.zss * x0.reshape(-1, 1, 1)
+        return zi
+
+    def filter(self, x):
+        """Filter the next chunk x, a 1D array or a 2D array with one
+        channel per row. Returns the filtered chunk (see zerophase)."""
+
+        x = np.ascontiguousarray(x, dtype = float)
+        self.oned = x.ndim == 1
+        x = np.atleast_2d(x)
+        if self.zi is None:
+            self.zi = self.initState(x[:, 0])
+        elif self.zi.shape[0] != x.shape[0]:
+            raise ValueError("expected {} channels, got {}".format(self.zi.shape[0], x.shape[0]))
+        y = sosfilt(self.sos, x, self.zi, nthreads = self.nthreads)
+
+        if self.zerophase:
+            if self.buf is not None:
+                y = np.concatenate((self.buf, y), axis = 1)
+            k = y.shape[1] - self.delay
+            if k <= 0:
+                self.buf = y
+                y = y[:, :0]
+            else:
+                self.buf = y[:, k:].copy()
+                y = self.backward(y)[:, :k]
+        return y[0] if self.oned else y
+
+    def backward(self, y):
+        """The backward pass, over the block y, in place."""
+
+        zb = self.initState(y[:, -1])
+        return sosfilt(self.sos, y, zb, y, reverse = True, nthreads = self.nthreads)
+
+    def flush(self):
+        """End the stream. In zero-phase mode, return the last delay
+        samples of output; otherwise there is nothing left, and an empty
+        array is returned."""
+
+        if self.zi is None:
+            return np.zeros((0,))
+        y = self.buf
+        if y is None or y.shape[1] == 0:
+            y = np.zeros((self.zi.shape[0], 0))
+        else:
+            y = self.backward(y)
+        self.reset()
+        return y[0] if self.oned else y
@@ -14,3 +14,55 @@ x = dofilt(range(1000), f)
 print("del")
 del x
 
+
+print("dofilt 2D")
+import numpy as np
+x = np.random.randn(10, 1000)
+f = mkiir(10, 20, 600)
+y = dofilt(x, f, nthreads = 0)
+for i in range(10):
+    assert (y[i] == dofilt(x[i], f)).all()
+f = mkfft(10, 20, 600, 1000)
+dofilt(x, f, out = y)
+for i in range(10):
+    assert (y[i] == dofilt(x[i], f)).all()
+del x, y
+
+print("firstream")
+from samiir.stream import firstream
+x = np.random.randn(3, 5000)
+f = firstream(1, 40, 600, zerophase = True)
+y = np.concatenate([f.filter(x[:, :1234]), f.filter(x[:, 1234:]), f.flush()], axis = 1)
+z = np.array([np.convolve(r, f.h)[f.delay : f.delay + 5000] for r in x])
+assert abs(y - z).max() < 1e-12
+
+print("iirstream")
+from samiir.stream import iirstream
+f = mkiir(1, 40, 600)
+x = np.random.randn(3, 5000)
+g = iirstream(f)
+y = np.concatenate([g.filter(x[:, :1234]), g.filter(x[:, 1234:])], axis = 1)
+z = iirstream(f).filter(x)
+assert abs(y - z).max() < 1e-12
+
+print("mkbank")
+from samiir import mkbank
+bands = [(1, 4), (4, 8), (8, 13), (13, 30)]
+x = np.random.randn(3, 1000)
+y = dofilt(x, mkbank(bands, 600, 1000, analytic = True))
+for b, (lo, hi) in enumerate(bands):
+    assert abs(y[b] - dofilt(x, mkfhilb(lo, hi, 600, 1000))).max() < 1e-12
+
+print("resample")
+x = np.random.randn(3, 1000)
+y = resample(x, 2, 5)
+assert y.shape == (3, 400)
+assert abs(resample(np.ones(1000), 2, 5) - 1).max() < 1e-12
+
+print("float32")
+x = np.random.randn(3, 1000)
+for f in [mkfft(10, 20, 600, 1000), mkfhilb(10, 20, 600, 1000), mkiir(10, 20, 600)]:
+    y = dofilt(x, f)
+    z = dofilt(x.astype(np.float32), f)
+    assert z.dtype == (np.complex64 if y.dtype == np.complex128 else np.float32)
+    assert abs(z - y).max() < 1e-5 * abs(y).max()
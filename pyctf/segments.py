@@ -12,12 +12,21 @@ except:
                 return mycmp(self.obj, other.obj) == 0
         return K
 
-def get_segment_list(ds, mlist, t0, t1):
+def get_segment_list(ds, mlist, t0, t1, continuous = False):
     """Create a list of segments of a dataset. A segment is specified
     using times in seconds relative to marks of the dataset, and
     generates a list of (tr, s) pairs, where each segment starts at
     sample s of trial tr, and ends at sample s + seglen - 1.
-    This function returns (seglist, seglen)."""
+    This function returns (seglist, seglen).
+
+    Normally segments that cross a trial boundary are dropped. If
+    continuous is true, the trials are taken to be consecutive pieces
+    of one continuous recording, and only segments that fall outside
+    the whole run are dropped. A segment may then end in a later trial
+    than it starts in, and should be read with
+
+        ds.readContinuous(tr * ds.getNumberOfSamples() + s, seglen, idx)
+    """
 
     # Check the marks in mlist. Convert a string to a list of length 1.
 
@@ -45,21 +54,28 @@ def get_segment_list(ds, mlist, t0, t1):
     for m in mlist:
         seglist.extend(marks[m])
 
-    # Bounds check, make sure we are always inside trial boundaries.
+    # Bounds check, make sure we are always inside trial boundaries,
+    # or for continuous data, inside the run.
 
     T0 = ds.getTimePt(0)
     T1 = ds.getTimePt(nsamples - 1)
+    D = 0.
+    if continuous:
+        D = nsamples / srate            # trial duration
+        T1 += (ds.getNumberOfTrials() - 1) * D
     def bck(t):
-        if T0 <= t[1] + t0 and t[1] + t1 <= T1:
+        tm = t[0] * D + t[1]            # time relative to trial 0
+        if T0 <= tm + t0 and tm + t1 <= T1:
             return True
         warn("mark at trial %d, time %g, out of bounds" % t)
         return False
     seglist = filter(bck, seglist)
 
-    # Convert t0 + marker time (t[1]) to samples.
+    # Convert t0 + marker time (t[1]) to samples. A continuous segment
+    # that starts before its mark's trial starts in an earlier trial.
 
     def cvt2s(t):
-        return (t[0], ds.getSampleNo(t[1] + t0))
+        return divmod(t[0] * nsamples + ds.getSampleNo(t[1] + t0), nsamples)
     seglist = list(map(cvt2s, seglist))
 
     # Sort by trial (a) and time (b).
@@ -5,20 +5,12 @@
 #include <math.h>
 #include <fftw3.h>
 #include <arrayobject.h>
+#include <omp.h>
+#include "fftplan.h"
 
-static char *Wisfile = NULL;
-static char *Wistemplate = "%s/.fftwis";
-#define WISLEN 8
+/* The FFTW plans and work buffers come from the samiir module's cache. */
 
-static void set_wisfile(void)
-{
-    char *home;
-
-    if (Wisfile) return;
-    home = getenv("HOME");
-    Wisfile = (char *)malloc(strlen(home) + WISLEN + 1);
-    sprintf(Wisfile, Wistemplate, home);
-}
+static FFTPLAN_API *Fftplan;
 
 /* Convert frequencies in Hz into rows of the ST, given sampling rate and length. */
 
@@ -37,86 +29,216 @@ static double gauss(int n, int m)
     return exp(-2. * M_PI * M_PI * m * m / (n * n));
 }
 
-/* Stockwell transform of the real array data. The len argument is the
-number of time points, and it need not be a power of two. The lo and hi
-arguments specify the range of frequencies to return, in Hz. If they are
-both zero, they default to lo = 0 and hi = len / 2. The result is
-returned in the complex array result, which must be preallocated, with
-n rows and len columns, where n is hi - lo + 1. For the default values of
-lo and hi, n is len / 2 + 1. */
+/* The gaussians depend only on the length and the row, so tables of
+them are kept, for rows lo to hi of a transform of length len. Row n of
+a table holds gauss(n, i) for i = 0 to width (the gaussians are even).
+The tables are made and released with the GIL held, like the plans, so
+no lock is needed. The least recently used ones that aren't in use are
+freed when the total would be more than Wintabmax bytes (which can be
+set, in megabytes, with PYCTF_ST_CACHE). A table bigger than that isn't
+made at all; it has g == NULL, and each row is computed when it's used,
+by windowrow(). */
+
+typedef struct wintab {
+    int len, lo, hi, width;
+    int refs;                   /* number of users */
+    int cached;                 /* in the list */
+    size_t size;                /* bytes */
+    double *g;
+    struct wintab *next;        /* most recently used first */
+} WINTAB;
+
+static WINTAB *Wintabs;
+static size_t Wintabsize;
+static size_t Wintabmax = (size_t)64 << 20;
+static int Wintabinit;
+
+/* Return row n of the table w. If there's no table, the row is put in
+buf, which holds w->width + 1 doubles. */
+
+static double *windowrow(WINTAB *w, int n, double *buf)
+{
+    int i;
+
+    if (w->g) {
+        return w->g + (size_t)(n - w->lo) * (w->width + 1);
+    }
+    for (i = 0; i <= w->width; i++) {
+        buf[i] = n == 0 ? 0. : gauss(n, i);
+    }
+    return buf;
+}
 
-static void st(int len, int lo, int hi, double *data, double *result)
+static void freewindows(WINTAB *t)
 {
-    int i, k, n, l2;
-    double s, *p;
-    FILE *wisdom;
-    static int planlen = 0;
-    static double *g;
-    static fftw_plan p1, p2;
-    static fftw_complex *h, *H, *G;
+    free(t->g);
+    free(t);
+}
 
-    /* Check for frequency defaults. */
+/* Free unused tables, oldest first, until there's room for size more
+bytes. */
 
-    if (lo == 0 && hi == 0) {
-        hi = len / 2;
+static void evictwindows(size_t size)
+{
+    WINTAB **tp, **last, *t;
+
+    while (Wintabsize + size > Wintabmax) {
+        last = NULL;
+        for (tp = &Wintabs; *tp; tp = &(*tp)->next) {
+            if ((*tp)->refs == 0) {
+                last = tp;
+            }
+        }
+        if (last == NULL) {
+            return;
+        }
+        t = *last;
+        *last = t->next;
+        Wintabsize -= t->size;
+        freewindows(t);
     }
+}
 
-    /* Keep the arrays and plans around from last time, since this
-    is a very common case. Reallocate them if they change. */
+static WINTAB *getwindows(int len, int lo, int hi, int width)
+{
+    int i, n;
+    char *s;
+    double *g;
+    WINTAB *t, **tp;
+
+    if (!Wintabinit) {
+        Wintabinit = 1;
+        s = getenv("PYCTF_ST_CACHE");
+        if (s) {
+            Wintabmax = (size_t)(atof(s) * (1 << 20));
+        }
+    }
 
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p1);
-        fftw_destroy_plan(p2);
-        fftw_free(h);
-        fftw_free(H);
-        fftw_free(G);
-        free(g);
-        planlen = 0;
+    for (tp = &Wintabs; *tp; tp = &(*tp)->next) {
+        t = *tp;
+        if (t->len == len && t->lo == lo && t->hi == hi && t->width == width) {
+            *tp = t->next;          /* move it to the front */
+            t->next = Wintabs;
+            Wintabs = t;
+            t->refs++;
+            return t;
+        }
     }
 
-    if (planlen == 0) {
-        planlen = len;
-        h = fftw_malloc(sizeof(fftw_complex) * len);
-        H = fftw_malloc(sizeof(fftw_complex) * len);
-        G = fftw_malloc(sizeof(fftw_complex) * len);
-        g = (double *)malloc(sizeof(double) * len);
+    t = (WINTAB *)malloc(sizeof(WINTAB));
+    if (t == NULL) {
+        return NULL;
+    }
+    t->len = len;
+    t->lo = lo;
+    t->hi = hi;
+    t->width = width;
+    t->size = sizeof(double) * (size_t)(hi - lo + 1) * (width + 1);
+    t->refs = 1;
+    t->cached = 0;
+    t->next = NULL;
+    if (t->size > Wintabmax) {
+        t->size = 0;
+        t->g = NULL;
+        return t;
+    }
+    t->g = (double *)malloc(t->size);
+    if (t->g == NULL) {
+        free(t);
+        return NULL;
+    }
+    g = t->g;
+    for (n = lo; n <= hi; n++) {
+        for (i = 0; i <= width; i++) {
+            *g++ = n == 0 ? 0. : gauss(n, i);
+        }
+    }
 
-        /* Get any accumulated wisdom. */
+    evictwindows(t->size);
+    if (Wintabsize + t->size <= Wintabmax) {
+        t->cached = 1;
+        t->next = Wintabs;
+        Wintabs = t;
+        Wintabsize += t->size;
+    }
+    return t;
+}
 
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
-        }
+static void releasewindows(WINTAB *t)
+{
+    t->refs--;
+    if (t->refs == 0 && !t->cached) {
+        freewindows(t);
+    }
+}
+
+/* What st() does with each row: store it, store its squared magnitude,
+or add its squared magnitude (and maybe the row itself) into sums. */
+
+#define ST_COMPLEX      0
+#define ST_POWER        1
+#define ST_ACCUMULATE   2
 
-        /* Set up the fftw plans. */
+typedef struct {
+    int mode;                   /* ST_xxx */
+    double weight;              /* ST_ACCUMULATE: weight of this row */
+    double *csum;               /* ST_ACCUMULATE: complex sums, or NULL */
+} STOUT;
 
-        p1 = fftw_plan_dft_1d(len, h, H, FFTW_FORWARD, FFTW_MEASURE);
-        p2 = fftw_plan_dft_1d(len, G, h, FFTW_BACKWARD, FFTW_MEASURE);
+/* Output len points of a row, h[i] / d, at p (and c, the row of csum),
+as given by out. */
 
-        /* Save the wisdom. */
+static void putrow(fftw_complex *h, double d, int len, double *p,
+                   double *c, STOUT *out)
+{
+    int i;
+    double a, b, w;
 
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
+    w = out->weight;
+    for (i = 0; i < len; i++) {
+        a = h[i][0] / d;
+        b = h[i][1] / d;
+        switch (out->mode) {
+        case ST_COMPLEX:
+            *p++ = a;
+            *p++ = b;
+            break;
+        case ST_POWER:
+            *p++ = a * a + b * b;
+            break;
+        case ST_ACCUMULATE:
+            *p++ += w * (a * a + b * b);
+            if (c) {
+                *c++ += w * a;
+                *c++ += w * b;
+            }
+            break;
         }
     }
+}
+
+/* Put the one-sided (analytic) spectrum of the real array data in H,
+using h as scratch, and return the mean. The plan p1 is FFTPLAN_R2C. */
+
+static double spectrum(int len, double *data, fftw_complex *h,
+                       fftw_complex *H, fftw_plan p1)
+{
+    int i, l2;
+    double s;
 
-    /* Convert the input to complex. Also compute the mean. */
+    /* Compute the mean. */
 
     s = 0.;
-    memset(h, 0, sizeof(fftw_complex) * len);
     for (i = 0; i < len; i++) {
-        h[i][0] = data[i];
         s += data[i];
     }
     s /= len;
 
-    /* FFT. */
+    /* FFT. The input is real, so this only fills in bins 0 to len / 2,
+    which are all the Hilbert transform needs. */
 
-    fftw_execute(p1); /* h -> H */
+    memcpy(h, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p1, (double *)h, H); /* h -> H */
 
     /* Hilbert transform. The upper half-circle gets multiplied by
     two, and the lower half-circle gets set to zero.  The real axis
@@ -133,18 +255,66 @@ static void st(int len, int lo, int hi, double *data, double *result)
         H[i][1] = 0.;
     }
 
+    return s;
+}
+
+/* Stockwell transform of the real array data. The len argument is the
+number of time points, and it need not be a power of two. The lo and hi
+arguments specify the range of frequencies to return, in Hz. If they are
+both zero, they default to lo = 0 and hi = len / 2. The result is
+returned in the complex array result, which must be preallocated, with
+n rows and len columns, where n is hi - lo + 1. For the default values of
+lo and hi, n is len / 2 + 1. For ST_POWER and ST_ACCUMULATE, result is
+real, and gets the squared magnitude of each point instead; the complex
+sums, if any, are the same shape as the complex result. The gaussians
+come from the table w, from getwindows(len, lo, hi, len / 2). */
+
+static int st(int len, int lo, int hi, double *data, double *result,
+              STOUT *out, WINTAB *w, fftw_plan p1, fftw_plan p2)
+{
+    int i, k, n, step;
+    double s, *p, *c;
+    double *g, *gbuf;
+    fftw_complex *h, *H, *G;
+
+    /* Check for frequency defaults. */
+
+    if (lo == 0 && hi == 0) {
+        hi = len / 2;
+    }
+
+    /* Get this thread's work arrays. The plans p1 (FFTPLAN_R2C) and
+    p2 (FFTPLAN_BACKWARD) come from the plan cache. h holds the real
+    input, and later the complex rows. gbuf holds a row of gaussians,
+    if they aren't in a table. */
+
+    h = Fftplan->buf(0, sizeof(fftw_complex) * len);
+    H = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    G = Fftplan->buf(2, sizeof(fftw_complex) * len);
+    gbuf = w->g ? NULL : Fftplan->buf(3, sizeof(double) * (w->width + 1));
+    if (h == NULL || H == NULL || G == NULL || (w->g == NULL && gbuf == NULL)) {
+        return -1;
+    }
+
+    s = spectrum(len, data, h, H, p1);
+
     /* Fill in rows of the result. */
 
     p = result;
+    c = out->csum;
+    step = out->mode == ST_COMPLEX ? 2 * len : len;
 
     /* The row for lo == 0 contains the mean. */
 
     n = lo;
     if (n == 0) {
         for (i = 0; i < len; i++) {
-            *p++ = s;
-            *p++ = 0.;
+            h[i][0] = s;
+            h[i][1] = 0.;
         }
+        putrow(h, 1., len, p, c, out);
+        p += step;
+        if (c) c += 2 * len;
         n++;
     }
 
@@ -156,14 +326,9 @@ static void st(int len, int lo, int hi, double *data, double *result)
         /* Scale the FFT of the gaussian. Negative frequencies
         wrap around. */
 
-        g[0] = gauss(n, 0);
-        l2 = len / 2 + 1;
-        for (i = 1; i < l2; i++) {
-            g[i] = g[len - i] = gauss(n, i);
-        }
-
+        g = windowrow(w, n, gbuf);
         for (i = 0; i < len; i++) {
-            s = g[i];
+            s = g[i <= len / 2 ? i : len - i];
             k = n + i;
             if (k >= len) k -= len;
             G[i][0] = H[k][0] * s;
@@ -172,70 +337,137 @@ static void st(int len, int lo, int hi, double *data, double *result)
 
         /* Inverse FFT the result to get the next row. */
 
-        fftw_execute(p2); /* G -> h */
-        for (i = 0; i < len; i++) {
-            *p++ = h[i][0] / len;
-            *p++ = h[i][1] / len;
-        }
+        fftw_execute_dft(p2, G, h); /* G -> h */
+        putrow(h, (double)len, len, p, c, out);
+        p += step;
+        if (c) c += 2 * len;
 
         /* Go to the next row. */
 
         n++;
     }
-}
 
-/* Inverse Stockwell transform. */
+    return 0;
+}
 
-static void ist(int len, int lo, int hi, double *data, double *result)
+/* The fast Stockwell transform. Row n's gaussian is below tol beyond
+M = halfwidth(n) bins of n, so only those 2M + 1 bins of the shifted
+spectrum are used, and they are inverse transformed with a length L
+FFT, which gives the row at the L times k * len / L, exactly (up to the
+truncation) when L >= 2M + 1. If the gaussian is wider than the whole
+spectrum (halfwidth() < 0), the row is done as in st(), so L must be
+len. The plan p2 is an FFTPLAN_BACKWARD plan of length L <= len. The
+gaussians come from the table w, from getwindows(len, lo, hi, W), where
+W is halfwidth(hi), or len / 2 if that's < 0. The result has n rows and
+L columns, and is otherwise as for st(). */
+
+static int halfwidth(int n, double tol, int len)
 {
-    int i, n, l2;
-    double *p;
-    FILE *wisdom;
-    static int planlen = 0;
-    static fftw_plan p2;
-    static fftw_complex *h, *H;
+    int M;
 
-    /* Check for frequency defaults. */
+    M = n * sqrt(log(1. / tol) / (2. * M_PI * M_PI));
+    return 2 * M + 1 < len ? M : -1;
+}
+
+static int fst(int len, int lo, int hi, double tol, int L, double *data,
+               double *result, STOUT *out, WINTAB *w, fftw_plan p1,
+               fftw_plan p2)
+{
+    int i, j, k, n, M, step;
+    double s, e, *p, *c, *g, *gbuf;
+    fftw_complex *h, *H, *G;
 
     if (lo == 0 && hi == 0) {
         hi = len / 2;
     }
 
-    /* Keep the arrays and plans around from last time, since this
-    is a very common case. Reallocate them if they change. */
-
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p2);
-        fftw_free(h);
-        fftw_free(H);
-        planlen = 0;
+    h = Fftplan->buf(0, sizeof(fftw_complex) * len);
+    H = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    G = Fftplan->buf(2, sizeof(fftw_complex) * len);
+    gbuf = w->g ? NULL : Fftplan->buf(3, sizeof(double) * (w->width + 1));
+    if (h == NULL || H == NULL || G == NULL || (w->g == NULL && gbuf == NULL)) {
+        return -1;
     }
 
-    if (planlen == 0) {
-        planlen = len;
-        h = fftw_malloc(sizeof(fftw_complex) * len);
-        H = fftw_malloc(sizeof(fftw_complex) * len);
+    s = spectrum(len, data, h, H, p1);
 
-        /* Get any accumulated wisdom. */
+    p = result;
+    c = out->csum;
+    step = out->mode == ST_COMPLEX ? 2 * L : L;
+
+    n = lo;
+    if (n == 0) {
+        for (i = 0; i < L; i++) {
+            h[i][0] = s;
+            h[i][1] = 0.;
+        }
+        putrow(h, 1., L, p, c, out);
+        p += step;
+        if (c) c += 2 * L;
+        n++;
+    }
 
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
+    while (n <= hi) {
+        M = halfwidth(n, tol, len);
+        g = windowrow(w, n, gbuf);
+        if (M < 0) {
+
+            /* The whole spectrum. Negative frequencies wrap around. */
+
+            for (i = 0; i < len; i++) {
+                e = g[i <= len / 2 ? i : len - i];
+                k = n + i;
+                if (k >= len) k -= len;
+                G[i][0] = H[k][0] * e;
+                G[i][1] = H[k][1] * e;
+            }
+        } else {
+
+            /* Bins -M to M of the shifted spectrum go in G, with the
+            negative ones wrapped around to the end. */
+
+            memset(G, 0, sizeof(fftw_complex) * L);
+            for (i = -M; i <= M; i++) {
+                e = g[i < 0 ? -i : i];
+                k = (n + i) % len;
+                if (k < 0) k += len;
+                j = i < 0 ? i + L : i;
+                G[j][0] = H[k][0] * e;
+                G[j][1] = H[k][1] * e;
+            }
         }
 
-        /* Set up the fftw plans. */
+        fftw_execute_dft(p2, G, h); /* G -> h */
+        putrow(h, (double)len, L, p, c, out);
+        p += step;
+        if (c) c += 2 * L;
+        n++;
+    }
 
-        p2 = fftw_plan_dft_1d(len, H, h, FFTW_BACKWARD, FFTW_MEASURE);
+    return 0;
+}
 
-        /* Save the wisdom. */
+/* Inverse Stockwell transform. */
 
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
+static int ist(int len, int lo, int hi, double *data, double *result,
+               fftw_plan p2)
+{
+    int i, n, l2;
+    double *p, *h;
+    fftw_complex *H;
+
+    /* Check for frequency defaults. */
+
+    if (lo == 0 && hi == 0) {
+        hi = len / 2;
+    }
+
+    /* The plan p2 is FFTPLAN_C2R. */
+
+    h = Fftplan->buf(0, sizeof(double) * len);
+    H = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    if (h == NULL || H == NULL) {
+        return -1;
     }
 
     /* Sum the complex array across time. */
@@ -249,88 +481,47 @@ static void ist(int len, int lo, int hi, double *data, double *result)
         }
     }
 
-    /* Invert the Hilbert transform. */
+    /* Invert the Hilbert transform. The negative frequencies are
+    the complex conjugates of the positive ones, since the result is
+    real, so only bins 0 to len / 2 are needed. */
 
     l2 = (len + 1) / 2;
     for (i = 1; i < l2; i++) {
         H[i][0] /= 2.;
         H[i][1] /= 2.;
     }
-    l2 = len / 2 + 1;
-    for (i = l2; i < len; i++) {
-        H[i][0] = H[len - i][0];
-        H[i][1] = -H[len - i][1];
-    }
 
     /* Inverse FFT. */
 
-    fftw_execute(p2); /* H -> h */
+    fftw_execute_dft_c2r(p2, H, h); /* H -> h */
     p = result;
     for (i = 0; i < len; i++) {
-        *p++ = h[i][0] / len;
+        *p++ = h[i] / len;
     }
+
+    return 0;
 }
 
 /* This does just the Hilbert transform. */
 
-static void hilbert(int len, double *data, double *result)
+static int hilbert(int len, double *data, double *result,
+                   fftw_plan p1, fftw_plan p2)
 {
     int i, l2;
     double *p;
-    FILE *wisdom;
-    static int planlen = 0;
-    static fftw_plan p1, p2;
-    static fftw_complex *h, *H;
-
-    /* Keep the arrays and plans around from last time, since this
-    is a very common case. Reallocate them if they change. */
-
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p1);
-        fftw_destroy_plan(p2);
-        fftw_free(h);
-        fftw_free(H);
-        planlen = 0;
-    }
-
-    if (planlen == 0) {
-        planlen = len;
-        h = fftw_malloc(sizeof(fftw_complex) * len);
-        H = fftw_malloc(sizeof(fftw_complex) * len);
-
-        /* Get any accumulated wisdom. */
-
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
-        }
-
-        /* Set up the fftw plans. */
+    fftw_complex *h, *H;
 
-        p1 = fftw_plan_dft_1d(len, h, H, FFTW_FORWARD, FFTW_MEASURE);
-        p2 = fftw_plan_dft_1d(len, H, h, FFTW_BACKWARD, FFTW_MEASURE);
-
-        /* Save the wisdom. */
-
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
+    h = Fftplan->buf(0, sizeof(fftw_complex) * len);
+    H = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    if (h == NULL || H == NULL) {
+        return -1;
     }
 
-    /* Convert the input to complex. */
+    /* FFT. The plan p1 is FFTPLAN_R2C, so this only fills in bins 0
+    to len / 2, and p2 is FFTPLAN_BACKWARD. */
 
-    memset(h, 0, sizeof(fftw_complex) * len);
-    for (i = 0; i < len; i++) {
-        h[i][0] = data[i];
-    }
-
-    /* FFT. */
-
-    fftw_execute(p1); /* h -> H */
+    memcpy(h, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p1, (double *)h, H); /* h -> H */
 
     /* Hilbert transform. The upper half-circle gets multiplied by
     two, and the lower half-circle gets set to zero.  The real axis
@@ -349,7 +540,7 @@ static void hilbert(int len, double *data, double *result)
 
     /* Inverse FFT. */
 
-    fftw_execute(p2); /* H -> h */
+    fftw_execute_dft(p2, H, h); /* H -> h */
 
     /* Fill in the rows of the result. */
 
@@ -358,187 +549,507 @@ static void hilbert(int len, double *data, double *result)
         *p++ = h[i][0] / len;
         *p++ = h[i][1] / len;
     }
+
+    return 0;
 }
 
 /* Plain old FFT. */
 
-static void fft(int len, double *data, double *result)
+static int fft(int len, double *data, double *result, fftw_plan p)
 {
     int i;
     double *d;
-    FILE *wisdom;
-    static int planlen = 0;
-    static fftw_plan p;
-    static fftw_complex *x, *X;
+    fftw_complex *x, *X;
 
-    /* Keep the arrays and plan around from last time, since this
-    is a very common case. Reallocate them if they change. */
-
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p);
-        fftw_free(x);
-        fftw_free(X);
-        planlen = 0;
+    x = Fftplan->buf(0, sizeof(fftw_complex) * len);
+    X = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    if (x == NULL || X == NULL) {
+        return -1;
     }
 
-    if (planlen == 0) {
-        planlen = len;
-        x = fftw_malloc(sizeof(fftw_complex) * len);
-        X = fftw_malloc(sizeof(fftw_complex) * len);
+    /* FFT. The plan p is FFTPLAN_R2C, so this only fills in bins 0
+    to len / 2. */
 
-        /* Get any accumulated wisdom. */
+    memcpy(x, data, sizeof(double) * len);
+    fftw_execute_dft_r2c(p, (double *)x, X); /* x -> X */
 
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
-        }
+    /* Return the complex result. The negative frequencies are the
+    complex conjugates of the positive ones. */
+
+    d = result;
+    for (i = 0; i <= len / 2; i++) {
+        *d++ = X[i][0];
+        *d++ = X[i][1];
+    }
+    for (; i < len; i++) {
+        *d++ = X[len - i][0];
+        *d++ = -X[len - i][1];
+    }
 
-        /* Set up the fftw plan. */
+    return 0;
+}
 
-        p = fftw_plan_dft_1d(len, x, X, FFTW_FORWARD, FFTW_MEASURE);
+/* Plain old inverse FFT. */
 
-        /* Save the wisdom. */
+static int ifft(int len, double *data, double *result, fftw_plan p)
+{
+    int i;
+    double *d;
+    fftw_complex *x, *X;
 
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
+    x = Fftplan->buf(0, sizeof(fftw_complex) * len);
+    X = Fftplan->buf(1, sizeof(fftw_complex) * len);
+    if (x == NULL || X == NULL) {
+        return -1;
     }
 
-    /* Convert the input to complex. */
+    /* Copy the input. */
 
-    memset(x, 0, sizeof(fftw_complex) * len);
+    d = data;
     for (i = 0; i < len; i++) {
-        x[i][0] = data[i];
+        X[i][0] = *d++;
+        X[i][1] = *d++;
     }
 
-    /* FFT. */
+    /* Inverse FFT. */
 
-    fftw_execute(p); /* x -> X */
+    fftw_execute_dft(p, X, x); /* X -> x */
 
     /* Return the complex result. */
 
     d = result;
     for (i = 0; i < len; i++) {
-        *d++ = X[i][0];
-        *d++ = X[i][1];
+        *d++ = x[i][0];
+        *d++ = x[i][1];
     }
+
+    return 0;
 }
 
-/* Plain old inverse FFT. */
+/* Python wrapper code. The plans are made and released with the GIL
+held, since the FFTW planner isn't thread safe, and the transforms are
+done with it released. kind2 is -1 if only one plan is needed. */
 
-static void ifft(int len, double *data, double *result)
+static int getplans(int n, int kind1, fftw_plan *p1, int kind2, fftw_plan *p2)
 {
-    int i;
-    double *d;
-    FILE *wisdom;
-    static int planlen = 0;
-    static fftw_plan p;
-    static fftw_complex *x, *X;
+    *p1 = Fftplan->get(n, kind1);
+    *p2 = kind2 < 0 ? NULL : Fftplan->get(n, kind2);
+    if (*p1 == NULL || (kind2 >= 0 && *p2 == NULL)) {
+        if (*p1) Fftplan->release(*p1);
+        if (*p2) Fftplan->release(*p2);
+        PyErr_SetString(PyExc_MemoryError, "can't make fftw plan");
+        return -1;
+    }
+    return 0;
+}
 
-    /* Keep the arrays and plan around from last time, since this
-    is a very common case. Reallocate them if they change. */
+static PyObject *finish(PyArrayObject *a, PyArrayObject *r, int err,
+                        fftw_plan p1, fftw_plan p2)
+{
+    Fftplan->release(p1);
+    if (p2) Fftplan->release(p2);
+    Py_DECREF(a);
+    if (err < 0) {
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
+    return PyArray_Return(r);
+}
 
-    if (len != planlen && planlen > 0) {
-        fftw_destroy_plan(p);
-        fftw_free(x);
-        fftw_free(X);
-        planlen = 0;
+static char Doc_st[] =
+"st(x, lo = 0, hi = 0, power = False, nthreads = 1) returns the 2d, complex\n\
+Stockwell transform of the real array x. If lo and hi are specified, only\n\
+those frequencies (rows) are returned; lo and hi default to 0 and n/2, resp.,\n\
+where n is the length of x. If x is 2d, each row is transformed, and the\n\
+result is (nrows, hi - lo + 1, n). If power is true, the result is real,\n\
+|st|**2. The rows are done with the GIL released, using nthreads OpenMP\n\
+threads (0 means use all of the available cores).";
+
+static PyObject *st_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "x", "lo", "hi", "power", "nthreads", NULL };
+    int j, n, nrows, ndim;
+    int lo = 0;
+    int hi = 0;
+    int power = 0;
+    int nthreads = 1;
+    long rstride;
+    npy_intp dim[3];
+    int err = 0;
+    double *in, *res;
+    STOUT out;
+    PyObject *o;
+    PyArrayObject *a, *r;
+    WINTAB *w;
+    fftw_plan p1, p2;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "O|iiii", kwlist,
+                                     &o, &lo, &hi, &power, &nthreads)) {
+        return NULL;
+    }
+
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_DOUBLE, 1, 2);
+    if (a == NULL) {
+        return NULL;
     }
+    ndim = PyArray_NDIM(a);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
+    n = PyArray_DIM(a, ndim - 1);
 
-    if (planlen == 0) {
-        planlen = len;
-        x = fftw_malloc(sizeof(fftw_complex) * len);
-        X = fftw_malloc(sizeof(fftw_complex) * len);
+    if (lo == 0 && hi == 0) {
+        hi = n / 2;
+    }
+    if (lo < 0 || hi < lo || hi >= n) {
+        PyErr_SetString(PyExc_ValueError, "bad frequency range in st()");
+        Py_DECREF(a);
+        return NULL;
+    }
+
+    /* The result has a leading row axis if x is 2d. */
+
+    dim[0] = nrows;
+    dim[ndim - 1] = hi - lo + 1;
+    dim[ndim] = n;
+    r = (PyArrayObject *)PyArray_SimpleNew(ndim + 1, dim, power ? NPY_DOUBLE : NPY_CDOUBLE);
+    if (r == NULL) {
+        Py_DECREF(a);
+        return NULL;
+    }
+    rstride = (long)(hi - lo + 1) * n * (power ? 1 : 2);
 
-        /* Get any accumulated wisdom. */
+    w = getwindows(n, lo, hi, n / 2);
+    if (w == NULL) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
+    if (getplans(n, FFTPLAN_R2C, &p1, FFTPLAN_BACKWARD, &p2) < 0) {
+        releasewindows(w);
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
 
-        set_wisfile();
-        wisdom = fopen(Wisfile, "r");
-        if (wisdom) {
-            fftw_import_wisdom_from_file(wisdom);
-            fclose(wisdom);
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+    in = (double *)PyArray_DATA(a);
+    res = (double *)PyArray_DATA(r);
+    out.mode = power ? ST_POWER : ST_COMPLEX;
+    out.weight = 1.;
+    out.csum = NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel for num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    for (j = 0; j < nrows; j++) {
+        if (st(n, lo, hi, in + (long)j * n, res + j * rstride, &out, w, p1, p2) < 0) {
+            err = -1;
         }
+    }
+
+    Py_END_ALLOW_THREADS
 
-        /* Set up the fftw plan. */
+    releasewindows(w);
+    return finish(a, r, err, p1, p2);
+}
 
-        p = fftw_plan_dft_1d(len, X, x, FFTW_BACKWARD, FFTW_MEASURE);
+static char Doc_st_accumulate[] =
+"st_accumulate(acc, x, lo = 0, hi = 0, weight = 1., csum = None, nthreads = 1)\n\
+adds weight * |st(x, lo, hi)|**2 into acc, a contiguous float64 array of shape\n\
+(hi - lo + 1, n), without making the transform. If x is 2d, the sum over its\n\
+rows is added. If csum is given (complex128, the same shape), weight * st()\n\
+is added into it as well, e.g. for phase locking. The rows are done with the\n\
+GIL released, using nthreads OpenMP threads (0 means use all of the available\n\
+cores); each extra thread needs its own copy of the sums.";
 
-        /* Save the wisdom. */
+/* Check that o is a contiguous, writeable array of type t and shape
+dim[2]. */
 
-        wisdom = fopen(Wisfile, "w");
-        if (wisdom) {
-            fftw_export_wisdom_to_file(wisdom);
-            fclose(wisdom);
-        }
+static int checksum(PyObject *o, int t, npy_intp *dim, char *name)
+{
+    PyArrayObject *a = (PyArrayObject *)o;
+
+    if (!PyArray_Check(o) || !PyArray_ISCARRAY(a) || PyArray_TYPE(a) != t ||
+        PyArray_NDIM(a) != 2 || !PyArray_CompareLists(PyArray_DIMS(a), dim, 2)) {
+        PyErr_Format(PyExc_ValueError, "%s must be a contiguous array of the right type and shape", name);
+        return -1;
     }
+    return 0;
+}
 
-    /* Copy the input. */
+static PyObject *st_accumulate_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "acc", "x", "lo", "hi", "weight", "csum", "nthreads", NULL };
+    int j, n, nrows, ndim;
+    int lo = 0;
+    int hi = 0;
+    int nthreads = 1;
+    double weight = 1.;
+    long size;
+    npy_intp dim[2];
+    int err = 0;
+    double *in, *acc, *csum;
+    PyObject *ao, *o, *co = Py_None;
+    PyArrayObject *a;
+    WINTAB *w;
+    fftw_plan p1, p2;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "OO|iidOi", kwlist,
+                                     &ao, &o, &lo, &hi, &weight, &co, &nthreads)) {
+        return NULL;
+    }
 
-    d = data;
-    for (i = 0; i < len; i++) {
-        X[i][0] = *d++;
-        X[i][1] = *d++;
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_DOUBLE, 1, 2);
+    if (a == NULL) {
+        return NULL;
     }
+    ndim = PyArray_NDIM(a);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
+    n = PyArray_DIM(a, ndim - 1);
 
-    /* Inverse FFT. */
+    if (lo == 0 && hi == 0) {
+        hi = n / 2;
+    }
+    if (lo < 0 || hi < lo || hi >= n) {
+        PyErr_SetString(PyExc_ValueError, "bad frequency range in st_accumulate()");
+        Py_DECREF(a);
+        return NULL;
+    }
 
-    fftw_execute(p); /* X -> x */
+    dim[0] = hi - lo + 1;
+    dim[1] = n;
+    if (checksum(ao, NPY_DOUBLE, dim, "acc") < 0 ||
+        (co != Py_None && checksum(co, NPY_CDOUBLE, dim, "csum") < 0)) {
+        Py_DECREF(a);
+        return NULL;
+    }
+    size = (long)dim[0] * n;
 
-    /* Return the complex result. */
+    w = getwindows(n, lo, hi, n / 2);
+    if (w == NULL) {
+        Py_DECREF(a);
+        return PyErr_NoMemory();
+    }
+    if (getplans(n, FFTPLAN_R2C, &p1, FFTPLAN_BACKWARD, &p2) < 0) {
+        releasewindows(w);
+        Py_DECREF(a);
+        return NULL;
+    }
 
-    d = result;
-    for (i = 0; i < len; i++) {
-        *d++ = x[i][0];
-        *d++ = x[i][1];
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+    in = (double *)PyArray_DATA(a);
+    acc = (double *)PyArray_DATA((PyArrayObject *)ao);
+    csum = co == Py_None ? NULL : (double *)PyArray_DATA((PyArrayObject *)co);
+
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    {
+        long i;
+        STOUT out;
+        double *tacc = acc;
+
+        /* With more than one thread, each one sums into its own
+        arrays, and they are added up at the end. */
+
+        out.mode = ST_ACCUMULATE;
+        out.weight = weight;
+        out.csum = csum;
+        if (omp_get_num_threads() > 1) {
+            tacc = (double *)calloc(size, sizeof(double));
+            out.csum = csum ? (double *)calloc(2 * size, sizeof(double)) : NULL;
+            if (tacc == NULL || (csum && out.csum == NULL)) {
+                free(tacc);
+                free(out.csum);
+                tacc = NULL;
+                err = -1;
+            }
+        }
+
+#pragma omp for
+        for (j = 0; j < nrows; j++) {
+            if (tacc && st(n, lo, hi, in + (long)j * n, tacc, &out, w, p1, p2) < 0) {
+                err = -1;
+            }
+        }
+
+        if (tacc && tacc != acc) {
+#pragma omp critical
+            {
+                for (i = 0; i < size; i++) {
+                    acc[i] += tacc[i];
+                }
+                if (csum) {
+                    for (i = 0; i < 2 * size; i++) {
+                        csum[i] += out.csum[i];
+                    }
+                }
+            }
+            free(tacc);
+            free(out.csum);
+        }
+    }
+
+    Py_END_ALLOW_THREADS
+
+    releasewindows(w);
+    Fftplan->release(p1);
+    Fftplan->release(p2);
+    Py_DECREF(a);
+    if (err < 0) {
+        return PyErr_NoMemory();
     }
+    Py_RETURN_NONE;
 }
 
-/* Python wrapper code. */
+static char Doc_fst[] =
+"fst(x, lo = 0, hi = 0, tol = 1e-6, L = 0, power = False, nthreads = 1) is a\n\
+fast version of st(). The gaussian window of each row is cut off where it\n\
+falls below tol, and only that part of the spectrum is inverse transformed,\n\
+with a length L FFT, so the result is (hi - lo + 1, L), and column k is the\n\
+transform at sample k * n / L. By default L is the smallest FFT friendly\n\
+length that holds the widest (highest) row; it can't be less than that, or\n\
+more than n. The other arguments, and 2d x, are as for st().";
 
-static char Doc_st[] =
-"st(x[, lo, hi]) returns the 2d, complex Stockwell transform of the real\n\
-array x. If lo and hi are specified, only those frequencies (rows) are\n\
-returned; lo and hi default to 0 and n/2, resp., where n is the length of x.";
+/* The smallest length >= n with no prime factors larger than 5. */
 
-static PyObject *st_wrap(PyObject *self, PyObject *args)
+static int fastlen(int n)
 {
-    int n;
+    int m;
+
+    for (;; n++) {
+        m = n;
+        while (m % 2 == 0) m /= 2;
+        while (m % 3 == 0) m /= 3;
+        while (m % 5 == 0) m /= 5;
+        if (m == 1) {
+            return n;
+        }
+    }
+}
+
+static PyObject *fst_wrap(PyObject *self, PyObject *args, PyObject *kw)
+{
+    static char *kwlist[] = { "x", "lo", "hi", "tol", "L", "power", "nthreads", NULL };
+    int j, n, nrows, ndim, M, Lmin;
     int lo = 0;
     int hi = 0;
-    npy_intp dim[2];
+    int L = 0;
+    int power = 0;
+    int nthreads = 1;
+    double tol = 1e-6;
+    long rstride;
+    npy_intp dim[3];
+    int err = 0;
+    double *in, *res;
+    STOUT out;
     PyObject *o;
     PyArrayObject *a, *r;
+    WINTAB *w;
+    fftw_plan p1, p2;
 
-    if (!PyArg_ParseTuple(args, "O|ii", &o, &lo, &hi)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kw, "O|iidiii", kwlist,
+                                     &o, &lo, &hi, &tol, &L, &power, &nthreads)) {
+        return NULL;
+    }
+    if (tol <= 0. || tol >= 1.) {
+        PyErr_SetString(PyExc_ValueError, "tol must be between 0 and 1");
         return NULL;
     }
 
-    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_DOUBLE, 1, 1);
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_DOUBLE, 1, 2);
     if (a == NULL) {
         return NULL;
     }
-    n = PyArray_DIM(a, 0);
+    ndim = PyArray_NDIM(a);
+    nrows = ndim == 2 ? PyArray_DIM(a, 0) : 1;
+    n = PyArray_DIM(a, ndim - 1);
 
     if (lo == 0 && hi == 0) {
         hi = n / 2;
     }
+    if (lo < 0 || hi < lo || hi >= n) {
+        PyErr_SetString(PyExc_ValueError, "bad frequency range in fst()");
+        Py_DECREF(a);
+        return NULL;
+    }
 
-    dim[0] = hi - lo + 1;
-    dim[1] = n;
-    r = (PyArrayObject *)PyArray_SimpleNew(2, dim, NPY_CDOUBLE);
+    /* The top row is the widest. */
+
+    M = halfwidth(hi, tol, n);
+    Lmin = M < 0 ? n : 2 * M + 1;
+    if (L <= 0) {
+        L = fastlen(Lmin);
+        if (L > n) {
+            L = n;
+        }
+    }
+    if (L < Lmin || L > n) {
+        PyErr_Format(PyExc_ValueError, "L must be from %d to %d", Lmin, n);
+        Py_DECREF(a);
+        return NULL;
+    }
+
+    dim[0] = nrows;
+    dim[ndim - 1] = hi - lo + 1;
+    dim[ndim] = L;
+    r = (PyArrayObject *)PyArray_SimpleNew(ndim + 1, dim, power ? NPY_DOUBLE : NPY_CDOUBLE);
     if (r == NULL) {
         Py_DECREF(a);
         return NULL;
     }
+    rstride = (long)(hi - lo + 1) * L * (power ? 1 : 2);
 
-    st(n, lo, hi, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r));
+    w = getwindows(n, lo, hi, M < 0 ? n / 2 : M);
+    if (w == NULL) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return PyErr_NoMemory();
+    }
 
-    Py_DECREF(a);
-    return PyArray_Return(r);
+    /* The inverse transforms are length L. */
+
+    if (getplans(n, FFTPLAN_R2C, &p1, -1, &p2) < 0) {
+        releasewindows(w);
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
+    p2 = Fftplan->get(L, FFTPLAN_BACKWARD);
+    if (p2 == NULL) {
+        releasewindows(w);
+        Fftplan->release(p1);
+        Py_DECREF(a);
+        Py_DECREF(r);
+        PyErr_SetString(PyExc_MemoryError, "can't make fftw plan");
+        return NULL;
+    }
+
+    if (nthreads <= 0) {
+        nthreads = omp_get_max_threads();
+    }
+    in = (double *)PyArray_DATA(a);
+    res = (double *)PyArray_DATA(r);
+    out.mode = power ? ST_POWER : ST_COMPLEX;
+    out.weight = 1.;
+    out.csum = NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+
+#pragma omp parallel for num_threads(nthreads) if (nthreads > 1 && nrows > 1)
+    for (j = 0; j < nrows; j++) {
+        if (fst(n, lo, hi, tol, L, in + (long)j * n, res + j * rstride, &out, w, p1, p2) < 0) {
+            err = -1;
+        }
+    }
+
+    Py_END_ALLOW_THREADS
+
+    releasewindows(w);
+    return finish(a, r, err, p1, p2);
 }
 
 static char Doc_ist[] =
@@ -551,8 +1062,10 @@ static PyObject *ist_wrap(PyObject *self, PyObject *args)
     int lo = 0;
     int hi = 0;
     npy_intp dim[1];
+    int err;
     PyObject *o;
     PyArrayObject *a, *r;
+    fftw_plan p1, p2;
 
     if (!PyArg_ParseTuple(args, "O|ii", &o, &lo, &hi)) {
         return NULL;
@@ -581,10 +1094,17 @@ static PyObject *ist_wrap(PyObject *self, PyObject *args)
         return NULL;
     }
 
-    ist(m, lo, hi, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r));
+    if (getplans(m, FFTPLAN_C2R, &p1, -1, &p2) < 0) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    err = ist(m, lo, hi, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r), p1);
+    Py_END_ALLOW_THREADS
 
-    Py_DECREF(a);
-    return PyArray_Return(r);
+    return finish(a, r, err, p1, p2);
 }
 
 static char Doc_hilbert[] =
@@ -594,8 +1114,10 @@ static PyObject *hilbert_wrap(PyObject *self, PyObject *args)
 {
     int n;
     npy_intp dim[1];
+    int err;
     PyObject *o;
     PyArrayObject *a, *r;
+    fftw_plan p1, p2;
 
     if (!PyArg_ParseTuple(args, "O", &o)) {
         return NULL;
@@ -614,10 +1136,17 @@ static PyObject *hilbert_wrap(PyObject *self, PyObject *args)
         return NULL;
     }
 
-    hilbert(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r));
+    if (getplans(n, FFTPLAN_R2C, &p1, FFTPLAN_BACKWARD, &p2) < 0) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    err = hilbert(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r), p1, p2);
+    Py_END_ALLOW_THREADS
 
-    Py_DECREF(a);
-    return PyArray_Return(r);
+    return finish(a, r, err, p1, p2);
 }
 
 static char Doc_fft[] =
@@ -627,8 +1156,10 @@ static PyObject *fft_wrap(PyObject *self, PyObject *args)
 {
     int n;
     npy_intp dim[1];
+    int err;
     PyObject *o;
     PyArrayObject *a, *r;
+    fftw_plan p1, p2;
 
     if (!PyArg_ParseTuple(args, "O", &o)) {
         return NULL;
@@ -647,27 +1178,37 @@ static PyObject *fft_wrap(PyObject *self, PyObject *args)
         return NULL;
     }
 
-    fft(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r));
+    if (getplans(n, FFTPLAN_R2C, &p1, -1, &p2) < 0) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
 
-    Py_DECREF(a);
-    return PyArray_Return(r);
+    Py_BEGIN_ALLOW_THREADS
+    err = fft(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r), p1);
+    Py_END_ALLOW_THREADS
+
+    return finish(a, r, err, p1, p2);
 }
 
 static char Doc_ifft[] =
-"ifft(x) returns the complex inverse Fourier transform of the real array x.";
+"ifft(x) returns the complex inverse Fourier transform of the complex array x.\n\
+As with FFTW, the result is not normalized.";
 
 static PyObject *ifft_wrap(PyObject *self, PyObject *args)
 {
     int n;
     npy_intp dim[1];
+    int err;
     PyObject *o;
     PyArrayObject *a, *r;
+    fftw_plan p1, p2;
 
     if (!PyArg_ParseTuple(args, "O", &o)) {
         return NULL;
     }
 
-    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_DOUBLE, 1, 1);
+    a = (PyArrayObject *)PyArray_ContiguousFromAny(o, NPY_CDOUBLE, 1, 1);
     if (a == NULL) {
         return NULL;
     }
@@ -680,18 +1221,29 @@ static PyObject *ifft_wrap(PyObject *self, PyObject *args)
         return NULL;
     }
 
-    ifft(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r));
+    if (getplans(n, FFTPLAN_BACKWARD, &p1, -1, &p2) < 0) {
+        Py_DECREF(a);
+        Py_DECREF(r);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    err = ifft(n, (double *)PyArray_DATA(a), (double *)PyArray_DATA(r), p1);
+    Py_END_ALLOW_THREADS
 
-    Py_DECREF(a);
-    return PyArray_Return(r);
+    return finish(a, r, err, p1, p2);
 }
 
 static char Doc_stmod[] =
-"Stockwell and inverse Stockwell transforms of 1D time-series data.\n\
-Regular FFT, inverse FFT, and Hilbert transforms are also included.";
+"Stockwell and inverse Stockwell transforms of 1D time-series data (or the\n\
+rows of a 2D array). Regular FFT, inverse FFT, and Hilbert transforms are\n\
+also included. The gaussian windows are kept for reuse, up to\n\
+$PYCTF_ST_CACHE megabytes of them (default 64); bigger sets are made as needed.";
 
 static PyMethodDef Methods[] = {
-    { "st", st_wrap, METH_VARARGS, Doc_st },
+    { "st", (PyCFunction)st_wrap, METH_VARARGS | METH_KEYWORDS, Doc_st },
+    { "st_accumulate", (PyCFunction)st_accumulate_wrap, METH_VARARGS | METH_KEYWORDS, Doc_st_accumulate },
+    { "fst", (PyCFunction)fst_wrap, METH_VARARGS | METH_KEYWORDS, Doc_fst },
     { "ist", ist_wrap, METH_VARARGS, Doc_ist },
     { "hilbert", hilbert_wrap, METH_VARARGS, Doc_hilbert },
     { "fft", fft_wrap, METH_VARARGS, Doc_fft },
@@ -699,6 +1251,31 @@ static PyMethodDef Methods[] = {
     { NULL, NULL, 0, NULL }
 };
 
+/* Get the plan cache from the samiir module, which might be installed
+as part of pyctf, or on its own. */
+
+static int import_fftplan(void)
+{
+    int i;
+    static char *names[] = { "pyctf.samiir.samiir", "samiir.samiir", "samiir", NULL };
+    PyObject *m, *cap = NULL;
+
+    for (i = 0; names[i] && cap == NULL; i++) {
+        PyErr_Clear();
+        m = PyImport_ImportModule(names[i]);
+        if (m) {
+            cap = PyObject_GetAttrString(m, "_fftplan");
+            Py_DECREF(m);
+        }
+    }
+    if (cap == NULL) {
+        return -1;
+    }
+    Fftplan = (FFTPLAN_API *)PyCapsule_GetPointer(cap, FFTPLAN_CAPSULE);
+    Py_DECREF(cap);
+    return Fftplan == NULL ? -1 : 0;
+}
+
 #if PY_MAJOR_VERSION >= 3
 
 static struct PyModuleDef moduledef = {
@@ -721,6 +1298,11 @@ PyMODINIT_FUNC PyInit_st(void)
 
     import_array();
 
+    if (import_fftplan() < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+
     return m;
 }
 
@@ -730,6 +1312,7 @@ PyMODINIT_FUNC initst()
 {
     Py_InitModule3("st", Methods, Doc_stmod);
     import_array();
+    import_fftplan();
 }
 
 #endif
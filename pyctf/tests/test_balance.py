@@ -0,0 +1,87 @@
+# Test gradiometer balancing against the coefficients in a synthetic .res4.
+
+import numpy as np
+import pytest
+from pyctf import ctf
+from pyctf.balance import balancer, coeffMatrix, GRADTYPE
+from test_dsdata import mkres4
+
+S = 20
+NREF, NPRI = 4, 6
+
+def mkbalres4(nsamp, nref, npri, gradOrder, seed = 0):
+    """Make a res4 container with nref references followed by npri
+    primaries, saved with the given gradient orders, and random
+    balancing coefficients of each order for every primary (and one
+    reference, which should be ignored)."""
+
+    rng = np.random.default_rng(seed)
+    r = mkres4(nsamp, nref + npri)
+    refs = ['R{:02d}'.format(i) for i in range(nref)]
+    r.chanName = [bytes(n + '-0000', 'ascii') for n in refs] + r.chanName[nref:]
+    s = r.chanRec['sensor']
+    s['type'][:nref] = ctf.TYPE_REF_MAG
+    s['gradOrder'][nref:] = gradOrder
+    r.sensorRes = s.tolist()
+
+    label = b''.join(bytes(n, 'ascii').ljust(ctf.SENSOR_LABEL, b'\x00') for n in refs)
+    label = label.ljust(ctf.MAX_BALANCING * ctf.SENSOR_LABEL, b'\x00')
+    r.coeffInfo = []
+    for name in r.chanName[nref - 1:]:
+        for gt in GRADTYPE[1:]:
+            c = np.zeros(ctf.MAX_BALANCING)
+            c[:nref] = rng.standard_normal(nref) * .1
+            r.coeffInfo.append((name, gt, nref, label) + tuple(c))
+    return r
+
+@pytest.fixture(scope = 'module')
+def r(tmp_path_factory):
+    name = str(tmp_path_factory.mktemp('data') / 'bal.res4')
+    ctf.write_res4_structs(name, mkbalres4(S, NREF, NPRI, [0, 0, 1, 2, 3, 3]))
+    return ctf.readRes4(name)
+
+def expected(r, x, order):
+    """Balance x (all the channels) one channel at a time, from r.coeff."""
+
+    y = x.copy()
+    cur = r.chanRec['sensor']['gradOrder']
+    for ci in r.coeff:
+        i = r.chanIndex[ci[ctf.ci_sensorName]]
+        if r.chanType[i] != ctf.TYPE_MEG:
+            continue
+        for name, cidx, c in ci[ctf.ci_sensorList]:
+            if ci[ctf.ci_type] == GRADTYPE[order]:
+                y[..., i, :] -= c * x[..., cidx, :]
+            if ci[ctf.ci_type] == GRADTYPE[cur[i]]:
+                y[..., i, :] += c * x[..., cidx, :]
+    return y
+
+def test_coeffMatrix(r):
+    assert not coeffMatrix(r, 0).any()
+    for order in (1, 2, 3):
+        W = coeffMatrix(r, order)
+        assert W.shape == (NPRI, NREF)
+        x = np.zeros((NREF + NPRI, 1))
+        for j in range(NREF):
+            x[:] = 0.
+            x[j] = 1.
+            y = expected(r, x, order) - expected(r, x, 0)
+            assert np.allclose(-W[:, j], y[NREF:, 0])
+    with pytest.raises(ValueError):
+        coeffMatrix(r, 4)
+
+def test_apply(r):
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal((2, NREF + NPRI, S))
+    ref = x[:, :NREF]
+    for order in (0, 1, 2, 3):
+        b = balancer(r, order)
+        y = expected(r, x, order)
+        assert np.allclose(b.apply(x.copy()), y)
+        assert np.allclose(b.apply(x[:, NREF:].copy(), ref), y[:, NREF:])
+        for idx in ([NREF + 1, 2, -1], slice(NREF + 2, None), [False] * NREF + [True] * NPRI):
+            z = b.apply(x[:, idx].copy(), ref, idx)
+            assert np.allclose(z, y[:, idx])
+        for idx in (NREF + 3, -1, 0):
+            z = b.apply(x[0, idx].copy(), ref[0], idx)
+            assert np.allclose(z, y[0, idx])
@@ -0,0 +1,51 @@
+# Test the channel indexing of ctf_meg4.dsData on a small .meg4 file.
+
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from pyctf.ctf_meg4 import dsData, chanSlice
+
+T, C, S = 2, 6, 50
+
+@pytest.fixture(scope = 'module')
+def d(tmp_path_factory):
+    name = str(tmp_path_factory.mktemp('data') / 'test.meg4')
+    x = np.arange(T * C * S, dtype = '>i4').reshape(T, C, S)
+    with open(name, 'wb') as f:
+        f.write(b'MEG41CP\x00')
+        f.write(x.tobytes())
+    r = SimpleNamespace(numTrials = T, numChannels = C, numSamples = S,
+                        chanGain = np.linspace(1., 2., C)[:, np.newaxis])
+    d = dsData(r, name)
+    d.x = x * r.chanGain
+    yield d
+    d.close()
+
+def test_chanSlice():
+    assert chanSlice(3, C) == 3
+    assert chanSlice(slice(1, 4), C) == slice(1, 4)
+    assert chanSlice([2, 3, 4], C) == slice(2, 5)
+    assert chanSlice(range(C), C) == slice(0, C)
+    assert chanSlice([-1], C) == slice(C - 1, C)
+    assert chanSlice([-2, -1], C) == slice(C - 2, C)
+    assert chanSlice([0, -1], C) == [0, C - 1]
+    assert chanSlice([3, 1], C) == [3, 1]
+    assert chanSlice([False, True] + [False] * (C - 2), C) == slice(1, 2)
+    assert chanSlice([], C) == []
+    for idx in ([C], [C - 1, C], [-C - 1]):
+        with pytest.raises(IndexError):
+            chanSlice(idx, C)
+
+def test_read(d):
+    for idx in ([2, 3, 4], range(C), np.arange(1, 3), [-1], [-2, -1],
+                [0, -1], [4, 1]):
+        y = d.getRawSegment(1, idx)
+        assert y.shape == (len(idx), S)
+        assert np.allclose(y, d.x[1, list(idx)])
+    mask = np.zeros(C, dtype = bool)
+    mask[[1, 4]] = True
+    assert np.allclose(d.getRawSegment(0, mask), d.x[0, [1, 4]])
+    assert np.allclose(d.getRawSegment(0, 2), d.x[0, 2])
+    for idx in ([C + 5], [C - 1, C], [-C - 1]):
+        with pytest.raises(IndexError):
+            d.getRawSegment(0, idx)
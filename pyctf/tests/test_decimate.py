@@ -0,0 +1,45 @@
+# Test that a decimated view reads everything at the new rate.
+
+import numpy as np
+import pytest
+import pyctf
+from pyctf import dsWriter
+from test_dsdata import mkres4
+
+T, C, S = 2, 4, 200
+
+@pytest.fixture(scope = 'module')
+def d(tmp_path_factory):
+    dsname = str(tmp_path_factory.mktemp('data') / 'dec.ds')
+    rng = np.random.default_rng(2)
+    with dsWriter(dsname, mkres4(S, C)) as w:
+        for tr in range(T):
+            w.writeTrial(rng.standard_normal((C, S)) * 1e-12 + 1e-12)
+    ds = pyctf.dsopen(dsname)
+    yield ds.decimate(4)
+    ds.close()
+
+def test_arrays(d):
+    n = d.getNumberOfSamples()
+    x = d.readInto(1, slice(0, C), demean = False)
+    assert x.shape == (C, n)
+    y = x - x.mean(axis = -1, keepdims = True)
+    assert np.allclose(d.getPriArray(1), y)
+    assert np.allclose(d.getIdxArray(1, slice(0, C)), y)
+    assert np.allclose(d.getDsData(1, 2), y[2])
+    assert d.getDsSegment(1, 2, 5, 10).shape == (10,)
+
+def test_epochs(d):
+    seglist = [(0, 0), (1, 10), (1, 20)]
+    e = d.getEpochs(seglist, 15, [1, 3])
+    assert e.shape == (3, 2, 15)
+    for i, (tr, s) in enumerate(seglist):
+        assert np.allclose(e[i], d.readInto(tr, [1, 3], s, 15))
+    c = d.getCov(seglist, 15, [1, 3], block = 2)
+    assert np.allclose(c, np.einsum('eit,ejt->ij', e, e) / (3 * 15))
+
+def test_fullrate(d):
+    with pytest.raises(AttributeError):
+        d.dsData
+    with pytest.raises(AttributeError):
+        d.getDsRawSegment(0, 0)
@@ -0,0 +1,137 @@
+# Test reading a small synthetic dataset.
+
+import os
+import numpy as np
+import pytest
+import pyctf
+from pyctf import ctf, ctf_meg4, dsWriter
+from pyctf.ctf_meg4 import meg4Files
+
+T, C, S = 3, 8, 100
+
+def mkres4(nsamp, nch, srate = 600.):
+    names = ['M{:03d}-0000'.format(i) for i in range(nch)]
+    r = ctf.res4data()
+    r.runDesc = b''
+    r.genRes = [b'test', b'', b'', 0, b'00:00', b'01-Jan-2020',
+                nsamp, nch, srate, 0., 0, 0, 0, 0, 0, b'', 0, 0, 0, 0, 0,
+                b'test', b'', b'', b'', b'', b'', b'', 1]
+    r.filterInfo = []
+    r.chanName = [bytes(n, 'ascii') for n in names]
+    r.coeffInfo = []
+    rec = np.zeros(nch, dtype = ctf.ChanRecDtype)
+    s = rec['sensor']
+    s['type'] = ctf.TYPE_MEG
+    s['properGain'] = 1.
+    s['qGain'] = 1e15
+    s['ioGain'] = 1.
+    s['numCoils'] = 1
+    r.chanRec = rec
+    r.sensorRes = rec['sensor'].tolist()
+    return r
+
+@pytest.fixture(scope = 'module')
+def ds(tmp_path_factory):
+    dsname = str(tmp_path_factory.mktemp('data') / 'test.ds')
+    x = np.arange(T * C * S).reshape(T, C, S) * 1e-15
+    with dsWriter(dsname, mkres4(S, C)) as w:
+        for tr in range(T):
+            w.writeTrial(x[tr])
+    ds = pyctf.dsopen(dsname)
+    ds.x = x
+    yield ds
+    ds.close()
+
+def test_consecutive(ds):
+    for idx in ([2, 3, 4], range(C), np.arange(1, 3)):
+        y = ds.readInto(1, idx, demean = False)
+        assert np.allclose(y, ds.x[1, list(idx)])
+
+def test_negative(ds):
+    for idx in ([-1], [-2, -1], [0, -1], [C - 1, -1]):
+        y = ds.readInto(0, idx, demean = False)
+        assert y.shape == (len(idx), S)
+        assert np.allclose(y, ds.x[0, idx])
+    y = ds.getIdxArray(0, [-1])
+    assert y.shape == (1, S)
+
+def test_mask(ds):
+    mask = np.zeros(C, dtype = bool)
+    mask[[1, 5]] = True
+    y = ds.readInto(2, mask, demean = False)
+    assert np.allclose(y, ds.x[2, [1, 5]])
+    y = ds.readInto(2, [False, True] + [False] * (C - 2), demean = False)
+    assert np.allclose(y, ds.x[2, [1]])
+
+def test_out_of_range(ds):
+    for idx in ([C + 5], [C - 1, C], [-C - 1]):
+        with pytest.raises(IndexError):
+            ds.readInto(0, idx)
+
+def test_getEpochs(ds):
+    seglist = [(0, 10), (2, 0), (0, 90)]    # the last one crosses into trial 1
+    flat = ds.x.transpose(1, 0, 2).reshape(C, -1)
+    for idx in ([1, 2, 3], [0, 5, -1], [-1], 6):
+        y = ds.getEpochs(seglist, 20, idx, demean = False)
+        ch = np.atleast_1d(np.arange(C)[idx])
+        for k, (tr, s) in enumerate(seglist):
+            assert np.allclose(y[k], flat[ch, tr * S + s : tr * S + s + 20])
+    for idx in ([C], [0, C + 3], [-C - 1], C):
+        with pytest.raises(IndexError):
+            ds.getEpochs(seglist, 20, idx)
+
+def test_close(tmp_path):
+    dsname = str(tmp_path / 'close.ds')
+    with dsWriter(dsname, mkres4(S, C)) as w:
+        w.writeTrial(np.zeros((C, S)))
+    for lazy in (False, True):
+        ds = pyctf.dsopen(dsname, lazy = lazy)
+        d = ds.dsData
+        assert 'w' not in d.__dict__
+        assert ds.readInto(0, [1, 2]).shape == (2, S)
+        d.close()
+        for name in ('m', 'f', 'w'):
+            with pytest.raises(ValueError):
+                getattr(d, name)
+
+def test_split(tmp_path):
+    dsname = str(tmp_path / 'split.ds')
+    x = np.arange(5 * C * S).reshape(5, C, S) * 1e-15
+    trsize = C * S * 4
+    with dsWriter(dsname, mkres4(S, C), maxsize = 8 + 2 * trsize) as w:
+        for tr in range(5):
+            w.writeChannels(x[tr, :3])
+            w.writeChannels(x[tr, 3:])
+    ds = pyctf.dsopen(dsname)
+    meg4 = ds.getDsFileNameExt('.meg4')
+    assert ds.getNumberOfTrials() == 5
+    names = meg4Files(meg4)
+    assert len(names) == 3
+    assert [os.path.getsize(n) for n in names] == [8 + 2 * trsize] * 2 + [8 + trsize]
+    for tr in range(5):
+        assert np.allclose(ds.readInto(tr, slice(0, C), demean = False), x[tr])
+    ds.close()
+
+def test_readonly(tmp_path, monkeypatch):
+    dsname = str(tmp_path / 'ro.ds')
+    with dsWriter(dsname, mkres4(S, C)) as w:
+        w.writeTrial(np.ones((C, S)))
+    ds = pyctf.dsopen(dsname)
+    w = ds.dsData.w
+    ds.close()
+
+    # Pretend the file is read-only (root can write it anyway).
+
+    openMeg4 = ctf_meg4.openMeg4
+    def ro(name, T, C, S, dtype, mode):
+        if mode != 'r':
+            raise PermissionError(name)
+        return openMeg4(name, T, C, S, dtype, mode)
+    monkeypatch.setattr(ctf_meg4, 'openMeg4', ro)
+    ds = pyctf.dsopen(dsname)
+    r = ds.dsData.w
+    assert r.dtype == w.dtype == np.int32
+    assert np.array_equal(r, w)
+    with pytest.raises(ValueError):
+        r[0, 0, 0] = 1
+    ds.close()
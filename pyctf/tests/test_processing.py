@@ -0,0 +1,55 @@
+# Test processing.Pipeline on a small synthetic dataset.
+
+import numpy as np
+import pytest
+import pyctf
+from pyctf import dsWriter
+from pyctf.processing import Pipeline
+from test_dsdata import mkres4
+
+T, C, S = 2, 4, 200
+
+@pytest.fixture(scope = 'module')
+def ds(tmp_path_factory):
+    dsname = str(tmp_path_factory.mktemp('data') / 'proc.ds')
+    rng = np.random.default_rng(1)
+    with dsWriter(dsname, mkres4(S, C)) as w:
+        for tr in range(T):
+            w.writeTrial(rng.standard_normal((C, S)) * 1e-12)
+    ds = pyctf.dsopen(dsname)
+    yield ds
+    ds.close()
+
+def test_offset_partial(ds):
+    pipe = Pipeline(ds, {'offset': [1, 1, 20, 60]})
+    whole = pipe.getIdxArray(1, [0, 2])
+    part = pipe.getIdxArray(1, [0, 2], 10, 100)
+    assert np.allclose(part, whole[:, 10 : 110])
+    with pytest.raises(ValueError):
+        pipe.getIdxArray(1, [0, 2], 30, 100)
+
+def test_offset_whole_trial(ds):
+    pipe = Pipeline(ds, {'offset': [1, 2, 0, 0]})
+    x = pipe.getIdxArray(0, slice(0, C))
+    assert np.allclose(x.mean(axis = -1), 0.)
+    with pytest.raises(ValueError):
+        pipe.getIdxArray(0, slice(0, C), 0, 100)
+
+def test_demean(ds):
+
+    # Without an offset stage the mean is removed, as by ds.getIdxArray().
+
+    for proc in ({}, {'offset': [0, 1, 20, 60]}, {'bandreject': [[1, 4, 59., 61.]]}):
+        pipe = Pipeline(ds, proc)
+        x = pipe.getIdxArray(1, [0, 2, 3], 10, 150)
+        assert np.allclose(x, pipe(ds.getIdxArray(1, [0, 2, 3], 10, 150)), atol = 1e-20)
+        if not proc.get('bandreject'):
+            assert np.allclose(x.mean(axis = -1), 0., atol = 1e-20)
+
+    # With one, only the baseline is.
+
+    pipe = Pipeline(ds, {'offset': [1, 1, 20, 60]})
+    x = pipe.getIdxArray(1, [0, 2])
+    y = ds.readInto(1, [0, 2], demean = False)
+    assert np.allclose(x, y - y[:, 20 : 60].mean(axis = -1, keepdims = True), atol = 1e-20)
+    assert (abs(x.mean(axis = -1)) > 1e-15).all()
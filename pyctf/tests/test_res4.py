@@ -0,0 +1,108 @@
+# Test parsing a .res4 file, lazily, eagerly, and from the header cache.
+
+import os
+import numpy as np
+import pytest
+from pyctf import ctf
+from test_balance import mkbalres4
+
+S, NREF, NPRI = 50, 3, 5
+
+def mkfile(name, nsamp = S, seed = 0):
+    r = mkbalres4(nsamp, NREF, NPRI, [0, 1, 2, 3, 3], seed)
+    rng = np.random.default_rng(seed)
+    for coils in ('dewar', 'head'):
+        c = r.chanRec[coils]
+        for f in ('x', 'y', 'z', 'nx', 'ny', 'nz', 'area'):
+            c[f] = rng.standard_normal(c.shape)
+        c['nturns'] = rng.integers(1, 5, c.shape)
+    ctf.write_res4_structs(name, r)
+
+def structparse(name):
+    """Read the channel records and coefficients one struct at a time."""
+
+    with open(name, 'rb') as f:
+        f.read(8)
+        gr = ctf.getstruct(f, ctf.GenRes)
+        f.read(gr[ctf.gr_rdlen])
+        for i in range(ctf.getstruct(f, ctf.NumFilters)[0]):
+            fi = ctf.getstruct(f, ctf.FilterInfo)
+            for j in range(fi[ctf.fi_nparam]):
+                ctf.getstruct(f, ctf.FilterParam)
+        M = gr[ctf.gr_numChannels]
+        for i in range(M):
+            ctf.getstruct(f, ctf.ChannelName)
+        sensRes = []
+        for i in range(M):
+            sr = ctf.getstruct(f, ctf.SensorRes)
+            crd = [ctf.getstruct(f, ctf.CoilRec) for j in range(ctf.MAX_COILS)]
+            crh = [ctf.getstruct(f, ctf.CoilRec) for j in range(ctf.MAX_COILS)]
+            sensRes.append((sr, crd, crh))
+        n = ctf.getstruct(f, ctf.NumCoeffs)[0]
+        coeffInfo = [ctf.getstruct(f, ctf.CoeffInfo) for i in range(n)]
+    return sensRes, coeffInfo
+
+def same(r, q):
+    assert r.genRes == q.genRes
+    assert r.chanName == q.chanName
+    assert r.chanIndex == q.chanIndex
+    assert r.sensRes == q.sensRes
+    assert r.coeffInfo == q.coeffInfo
+    assert r.coeff == q.coeff
+    for name in ('chanGain', 'coilPos', 'headCoilNorm', 'coilArea', 'coilTurns'):
+        assert np.array_equal(getattr(r, name), getattr(q, name))
+
+@pytest.fixture
+def name(tmp_path):
+    name = str(tmp_path / 'test.res4')
+    mkfile(name)
+    return name
+
+def test_parse(name):
+    r = ctf.readRes4(name)
+    sensRes, coeffInfo = structparse(name)
+    assert r.sensRes == sensRes
+    assert r.sensorRes == [s[0] for s in sensRes]
+    assert r.coeffInfo == coeffInfo
+    assert len(r.coeff) == (NPRI + 1) * 3
+
+def test_lazy(name):
+    r = ctf.readRes4(name)
+    q = ctf.readRes4(name, lazy = True)
+    assert 'coeffInfo' not in q.__dict__ and 'coeff' not in q.__dict__
+    same(r, q)
+
+def test_cache(name):
+    r = ctf.readRes4(name)
+    a = ctf.readRes4(name, cache = True)
+    b = ctf.readRes4(name, cache = True)
+    assert b is not a
+    same(r, a)
+    same(r, b)
+
+    # Changing a copy doesn't change the cache.
+
+    a.chanName[0] = b'X'
+    a.chanIndex.clear()
+    a.chanGain[:] = 0.
+    a.chanRec['sensor']['gradOrder'] = 3
+    a.coeff[0][ctf.ci_sensorList].clear()
+    a.coeff[1][ctf.ci_type] = b'XXXX'
+    a.sensRes[0][1][0] = None
+    same(r, ctf.readRes4(name, cache = True))
+
+    # A rewritten file is read again, whether or not the size changed.
+
+    st = os.stat(name)
+    mkfile(name, S + 1, seed = 1)
+    os.utime(name, ns = (st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert os.path.getsize(name) == st.st_size
+    c = ctf.readRes4(name, cache = True)
+    assert c.numSamples == S + 1
+    same(ctf.readRes4(name), c)
+
+    r = mkbalres4(S, NREF, NPRI, [0, 1, 2, 3, 3])
+    r.coeffInfo = r.coeffInfo[:2]
+    ctf.write_res4_structs(name, r)
+    c = ctf.readRes4(name, cache = True)
+    assert len(c.coeff) == 2
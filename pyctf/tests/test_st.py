@@ -0,0 +1,96 @@
+# Test the Stockwell transforms against st() of one row.
+
+import os, sys, subprocess
+import numpy as np
+import pytest
+from pyctf.st import st, fst, st_accumulate
+
+N = 240
+
+@pytest.fixture(scope = 'module')
+def X():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((5, N))
+
+@pytest.mark.parametrize('nthreads', [1, 3])
+def test_st_2d(X, nthreads):
+    for lo, hi in ((0, 0), (3, 40)):
+        S = st(X, lo, hi, nthreads = nthreads)
+        R = np.array([st(x, lo, hi) for x in X])
+        assert S.dtype == np.complex128
+        assert np.array_equal(S, R)
+        P = st(X, lo, hi, power = True, nthreads = nthreads)
+        assert np.allclose(P, abs(R)**2)
+
+@pytest.mark.parametrize('nthreads', [1, 0])
+def test_st_accumulate(X, nthreads):
+    lo, hi = 2, 50
+    R = np.array([st(x, lo, hi) for x in X])
+    acc = np.zeros((hi - lo + 1, N))
+    st_accumulate(acc, X, lo, hi, nthreads = nthreads)
+    assert np.allclose(acc, (abs(R)**2).sum(axis = 0))
+
+    acc[:] = 1.
+    csum = np.zeros(acc.shape, dtype = np.complex128)
+    st_accumulate(acc, X, lo, hi, weight = .5, csum = csum, nthreads = nthreads)
+    st_accumulate(acc, X[0], lo, hi, weight = 2., csum = csum, nthreads = nthreads)
+    assert np.allclose(acc, 1. + .5 * (abs(R)**2).sum(axis = 0) + 2. * abs(R[0])**2)
+    assert np.allclose(csum, .5 * R.sum(axis = 0) + 2. * R[0])
+
+    with pytest.raises(ValueError):
+        st_accumulate(np.zeros((hi - lo, N)), X, lo, hi)
+
+def test_fst(X):
+    lo, hi = 0, 30
+    S = st(X[0], lo, hi)
+    for tol in (1e-3, 1e-6, 1e-9):
+        for L in (N, N // 2, N // 3):
+            F = fst(X[0], lo, hi, tol = tol, L = L)
+            assert F.shape == (hi - lo + 1, L)
+            err = abs(F - S[:, :: N // L]).max()
+            assert err <= tol * abs(S).max()
+    F = fst(X, lo, hi, L = N // 2, nthreads = 2)
+    assert np.array_equal(F, np.array([fst(x, lo, hi, L = N // 2) for x in X]))
+
+    # All the rows, with L = n.
+
+    S = st(X[0])
+    F = fst(X[0], L = N)
+    assert np.allclose(F, S, rtol = 0., atol = 1e-6 * abs(S).max())
+
+# The window cache size is read from the environment once, so the cache
+# tests run in a new process. It transforms many lengths twice, so the
+# tables are evicted and remade, and the biggest don't fit at all; with
+# a zero size no tables are made.
+
+CHILD = """
+import sys, numpy as np
+sys.path[:0] = sys.argv[2:]
+import st
+out = {}
+for rep in range(2):
+    for n in range(100, 300, 7):
+        x = np.cos(np.arange(n) * .37) + np.arange(n) / n
+        y = st.st(np.array([x, -x]), 1, n // 3, nthreads = 2)
+        assert np.array_equal(y[0], -y[1])
+        for k, y in (('st', y[0]), ('fst', st.fst(x, 0, n // 4))):
+            key = '{}{}'.format(k, n)
+            if rep:
+                assert np.array_equal(out[key], y), key
+            out[key] = y
+np.savez(sys.argv[1], **out)
+"""
+
+@pytest.mark.parametrize('size', ['0.2', '0'])
+def test_wintab_cache(tmp_path, size):
+    name = str(tmp_path / 'st.npz')
+    dirs = [os.path.dirname(sys.modules[m].__file__)
+            for m in ('pyctf.st.st', 'pyctf.samiir.samiir')]
+    env = dict(os.environ, PYCTF_ST_CACHE = size)
+    subprocess.run([sys.executable, '-c', CHILD, name] + dirs, env = env,
+                   check = True)
+    with np.load(name) as out:
+        for n in range(100, 300, 7):
+            x = np.cos(np.arange(n) * .37) + np.arange(n) / n
+            assert np.array_equal(out['st{}'.format(n)], st(x, 1, n // 3))
+            assert np.array_equal(out['fst{}'.format(n)], fst(x, 0, n // 4))
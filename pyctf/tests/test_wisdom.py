@@ -0,0 +1,62 @@
+# Test saving and reading FFTW wisdom. The wisdom and the planner are
+# global to a process, so each step runs in a new one.
+
+import os, sys, subprocess
+import pytest
+import pyctf.samiir
+
+CHILD = """
+import sys, numpy as np
+sys.path.insert(0, sys.argv[1])
+import samiir
+read, write, n = sys.argv[2], sys.argv[3], int(sys.argv[4])
+if read:
+    samiir.setwisdom(read)
+samiir.setwisdom(write)
+samiir.warmup([n])
+x = np.ones((2, n), dtype = np.float32)
+samiir.dofilt(x, samiir.mkfft(4, 30, 600., n))    # single precision plans
+samiir.savewisdom()
+"""
+
+def child(read, write, n, planner = 'MEASURE'):
+    dir = os.path.dirname(sys.modules['pyctf.samiir.samiir'].__file__)
+    env = dict(os.environ, PYCTF_FFTW_WISDOM = '', PYCTF_FFTW_PLANNER = planner)
+    return subprocess.run([sys.executable, '-c', CHILD, dir, read, write, str(n)],
+                          env = env, check = True, stderr = subprocess.PIPE,
+                          universal_newlines = True).stderr
+
+def lines(name):
+    with open(name) as f:
+        return set(f.read().splitlines())
+
+def test_wisdom(tmp_path):
+    a, b, c = [str(tmp_path / name) for name in ('a', 'b', 'c')]
+
+    # warmup() and a float32 filter make wisdom for both files.
+
+    child('', a, 96)
+    for name in (a, a + 'f'):
+        assert os.path.getsize(name) > 0
+        with open(name) as f:
+            assert f.read().startswith('(fftw-3')
+
+    # Another length, after reading a, gives all of a's wisdom too, which
+    # it doesn't on its own.
+
+    child(a, b, 250)
+    child('', c, 250)
+    for ext in ('', 'f'):
+        assert lines(a + ext) <= lines(b + ext)
+        assert not lines(a + ext) <= lines(c + ext)
+
+def test_planner(tmp_path):
+
+    # Estimated plans don't make any wisdom; unknown planners are MEASURE.
+
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    assert child('', a, 64, 'estimate') == ''
+    assert not os.path.exists(a) or os.path.getsize(a) == 0
+    err = child('', b, 64, 'SLOPPY')
+    assert 'unknown PYCTF_FFTW_PLANNER SLOPPY' in err
+    assert os.path.getsize(b) > 0
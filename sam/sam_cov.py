@@ -15,7 +15,8 @@ def sam_cov():
     # Get these parameters, along with the standard ones, using the default parser:
 
     p = getSamParam(['Marker', 'SegFile', 'DataSegment', 'CovBand', 'OrientBand',
-                     'FilterType', 'Notch', 'Hz', 'OutName', 'CovName', 'CacheDir'])
+                     'FilterType', 'Notch', 'Hz', 'OutName', 'CovName', 'CacheDir',
+                     'Continuous'])
 
     dsname = p.DataSet                  # standard parameter
 
@@ -39,10 +40,12 @@ def sam_cov():
     ntrials = ds.getNumberOfTrials()
     nsamples = ds.getNumberOfSamples()
     fType = p.FilterType
+    continuous = p.get('Continuous', False)
 
     print("Making {} filter from {} to {} Hz".format(fType, lo, hi))
     if fType == 'FFT':
-        filt = mkfft(lo, hi, srate, nsamples)
+        # A continuous run is filtered all at once.
+        filt = mkfft(lo, hi, srate, nsamples * (ntrials if continuous else 1))
     elif fType == 'IIR':
         filt = mkiir(lo, hi, srate)
     else:
@@ -50,7 +53,7 @@ def sam_cov():
         exit()
 
     for mark, t0, t1, sf, name in mlist:
-        slist, slen = get_segment_list(ds, mark, t0, t1)
+        slist, slen = get_segment_list(ds, mark, t0, t1, continuous)
         print("Marker '{}': {} segments of {} samples".format(mark, len(slist), slen))
         print("Filtering and computing {} covariance".format(name))
 
@@ -78,16 +81,27 @@ def sam_cov():
 
     p.logParam()
 
-def cov(ds, slist, slen, filt):
+def cov(ds, slist, slen, filt, continuous = False):
     M = ds.getNumberOfPrimaries()
     C = np.zeros((M, M))
+    if continuous:
+        # Filter the whole run (filt must be that long); the segments
+        # may cross trial boundaries.
+        S = ds.getNumberOfSamples()
+        pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + M)
+        x = ds.readContinuous(0, S * ds.getNumberOfTrials(), pri)
+        x = dofilt(x, filt)
+        for tr, s in slist:
+            d = x[:, tr * S + s : tr * S + s + slen]
+            C += d.dot(d.T)
+        C /= len(slist) * slen
+        return C
     theTr = None
     for tr, s in slist:
         if tr != theTr:
             theTr = tr
             x = ds.getPriArray(tr)
-            for m in range(M):
-                x[m, :] = dofilt(x[m], filt)
+            x = dofilt(x, filt)
         d = x[:, s : s + slen]
         C += d.dot(d.T)
     C /= len(slist) * slen
@@ -123,8 +137,7 @@ def cov(ds, slist, slen, filt):
             print("warning: ignoring s = {}".format(s))
             continue
         x = ds.getPriArray(tr, a, wlen)
-        for m in range(M):
-            x[m, :] = dofilt(x[m], filt)
+        x = dofilt(x, filt)
         d = x[:, offset : offset + slen]
         C += d.dot(d.T)
     C /= len(slist) * slen
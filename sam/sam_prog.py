@@ -12,7 +12,7 @@ def sam_prog():
     # Get these parameters, along with the standard ones, using the default parser:
 
     p = getSamParam(['Marker', 'SegFile', 'DataSegment', 'CovBand', 'OrientBand',
-                     'FilterType', 'Notch', 'Hz', 'OutName', 'CovName'])
+                     'FilterType', 'Notch', 'Hz', 'OutName', 'CovName', 'Continuous'])
 
     print(p.values)
 
@@ -38,10 +38,12 @@ def sam_prog():
 
     fType = p.get('FilterType', 'FFT')      # default to FFT
     #fType = p.get('FilterType', 'IIR')
+    continuous = p.get('Continuous', False)
 
     print("Making {} filter from {} to {} Hz".format(fType, lo, hi))
     if fType == 'FFT':
-        filt = mkfft(lo, hi, srate, nsamples)
+        # A continuous run is filtered all at once.
+        filt = mkfft(lo, hi, srate, nsamples * (ntrials if continuous else 1))
     elif fType == 'IIR':
         filt = mkiir(lo, hi, srate)
     else:
@@ -49,22 +51,33 @@ def sam_prog():
         exit()
 
     for mark, t0, t1, sf, name in mlist:
-        slist, slen = get_segment_list(ds, mark, t0, t1)
+        slist, slen = get_segment_list(ds, mark, t0, t1, continuous)
         print("Marker '{}': {} segments of {} samples".format(mark, len(slist), slen))
         print("Filtering and computing {} covariance".format(name))
 
     p.logParam()
 
-def cov(ds, slist, slen, filt):
+def cov(ds, slist, slen, filt, continuous = False):
     M = ds.getNumberOfPrimaries()
     C = np.zeros((M, M))
+    if continuous:
+        # Filter the whole run (filt must be that long); the segments
+        # may cross trial boundaries.
+        S = ds.getNumberOfSamples()
+        pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + M)
+        x = ds.readContinuous(0, S * ds.getNumberOfTrials(), pri)
+        x = dofilt(x, filt)
+        for tr, s in slist:
+            d = x[:, tr * S + s : tr * S + s + slen]
+            C += d.dot(d.T)
+        C /= len(slist) * slen
+        return C
     theTr = None
     for tr, s in slist:
         if tr != theTr:
             theTr = tr
             x = ds.getPriArray(tr)
-            for m in range(M):
-                x[m, :] = dofilt(x[m], filt)
+            x = dofilt(x, filt)
         d = x[:, s : s + slen]
         C += d.dot(d.T)
     C /= len(slist) * slen
@@ -0,0 +1,400 @@
+#! /usr/bin/env python
+
+"""Time the hot paths of pyctf on a synthetic dataset, and write the
+results as JSON, so that changes can be compared against a baseline."""
+
+import sys, os, json, shutil, struct, tempfile, platform, tracemalloc
+from time import perf_counter
+import numpy as np
+import pyctf
+from pyctf import ctf, dsWriter
+from pyctf.util import usage, parseargs, printerror, printusage, msg
+
+usage("""[-o out.json] [-d dir] [-k] [-q] [-r repeat] [-t trials] [-n samples]
+    [-c nthreads] [-f dataset] [-b name,...]
+
+Make a synthetic CTF dataset with a 275 channel MEG layout (plus
+references and a trigger channel) in dir (default, a temporary
+directory, removed afterwards unless -k), and time reading it (readInto,
+readContinuous, getEpochs), dofilt (IIR, FFT, FHilbert, in float64 and
+float32), st and mtst, covariance accumulation, readwts, marker parsing,
+and opening datasets eagerly, lazily, and with the .res4 cache.
+
+-t and -n set the number of trials (default 20) and samples per trial
+(default 6000, at 1200 Hz). Each test is run -r times (default 5) and
+the best and median times are reported. -c is passed as nthreads to
+dofilt (default 1). -b runs only the named benchmarks (reads, copies,
+open, dofilt, st, cov, readwts, markers, fwd). -q suppresses the summary
+on stderr.
+
+SolveFwd needs a real dataset with a default.hdm file (and pyctf
+built with _samlib); give its name with -f, otherwise it's skipped.
+
+The JSON (on stdout, or in out.json) has a "meta" section describing
+the machine and the parameters, and a "results" list with one entry
+per test: its name, parameters, and times in seconds.""")
+
+NMEG = 275
+NREF = 29
+SRATE = 1200.
+
+# A synthetic .res4 container.
+
+def mkres4(nsamp, srate):
+    """Return a res4data container for nsamp samples per trial at srate Hz,
+    with NMEG radial gradiometers on a sphere, NREF reference magnetometers,
+    and a UPPT001 trigger channel."""
+
+    names = ['M{:03d}-0000'.format(i) for i in range(NMEG)]
+    names += ['R{:02d}-0000'.format(i) for i in range(NREF)]
+    names += ['UPPT001']
+    M = len(names)
+
+    r = ctf.res4data()
+    r.runDesc = b''
+    gr = [b'bench', b'', b'', 0, b'00:00', b'01-Jan-2020',
+          nsamp, M, srate, 0., 0, 0, 0, 0, 0, b'', 0, 0, 0, 0, 0,
+          b'bench', b'', b'', b'', b'', b'', b'', len(r.runDesc) + 1]
+    r.genRes = gr
+    r.filterInfo = []
+    r.chanName = [bytes(n, 'ascii') for n in names]
+    r.coeffInfo = []
+
+    rec = np.zeros(M, dtype = ctf.ChanRecDtype)
+    s = rec['sensor']
+    s['type'][:NMEG] = ctf.TYPE_MEG
+    s['type'][NMEG:NMEG + NREF] = ctf.TYPE_REF_MAG
+    s['type'][-1] = ctf.TYPE_UPPT
+    s['properGain'] = 1.
+    s['qGain'] = 1e15           # 1 fT per count
+    s['ioGain'] = 1.
+    s['qGain'][-1] = 1.
+    s['numCoils'][:NMEG] = 2
+    s['numCoils'][NMEG:] = 1
+
+    # The MEG coils are on a hemisphere of radius 12 cm, the second
+    # coil of each gradiometer 5 cm further out; the references are
+    # 20 cm up.
+
+    g = np.arange(NMEG) * np.pi * (3. - np.sqrt(5.))
+    z = 1. - np.arange(NMEG) / NMEG
+    n = np.stack((np.sqrt(1. - z * z) * np.cos(g), np.sqrt(1. - z * z) * np.sin(g), z), axis = 1)
+    for f in ('dewar', 'head'):
+        c = rec[f]
+        c['nturns'][:, :2] = 1
+        c['area'][:, :2] = 2.5e-4
+        for k in range(2):
+            p = n * (.12 + .05 * k)
+            c['x'][:NMEG, k], c['y'][:NMEG, k], c['z'][:NMEG, k] = p.T
+            c['nx'][:NMEG, k], c['ny'][:NMEG, k], c['nz'][:NMEG, k] = n.T
+        c['z'][NMEG:, 0] = .2
+        c['nz'][NMEG:, 0] = 1.
+    r.chanRec = rec
+    r.sensorRes = rec['sensor'].tolist()
+    return r
+
+def mkds(dsname, ntrials, nsamp, srate):
+    """Write the synthetic dataset: 1/f-ish noise in Tesla, a 10 Hz
+    rhythm, and a trigger at the start of each trial. Also write a
+    marker file with a few thousand marks, and a .wts file."""
+
+    r = mkres4(nsamp, srate)
+    M = r.genRes[ctf.gr_numChannels]
+    rng = np.random.default_rng(1)
+    t = np.arange(nsamp) / srate
+    with dsWriter(dsname, r) as w:
+        for tr in range(ntrials):
+            x = np.cumsum(rng.standard_normal((M, nsamp)), axis = 1) * 1e-14
+            x[:NMEG] += 1e-13 * np.sin(2. * np.pi * 10. * t + rng.uniform(0, 2 * np.pi, (NMEG, 1)))
+            x[-1] = 0.
+            x[-1, : nsamp // 100] = 1.
+            w.writeTrial(x)
+
+    # Marks, every 100 ms.
+
+    marks = [(tr, s / srate) for tr in range(ntrials) for s in range(0, nsamp, int(srate / 10))]
+    with open(os.path.join(dsname, 'MarkerFile.mrk'), 'w') as f:
+        f.write("PATH OF DATASET:\n{}\n\n\nNUMBER OF MARKERS:\n1\n\n\n".format(dsname))
+        f.write("CLASSGROUPID:\n3\nNAME:\nstim\nCOMMENT:\n\nCOLOR:\nred\nEDITABLE:\nYes\n")
+        f.write("CLASSID:\n1\nNUMBER OF SAMPLES:\n{}\nLIST OF SAMPLES:\n".format(len(marks)))
+        f.write("TRIAL NUMBER\t\tTIME FROM SYNC POINT (in seconds)\n")
+        for tr, tm in marks:
+            f.write("                  +{}\t\t\t\t     +{:.10e}\n".format(tr, tm))
+        f.write("\n\n")
+
+def mkwts(wtsname, N, step = .005):
+    """Write a version 1 SAMCOEFF file with weights for N channels on a
+    grid of step meters spanning 10 cm on each side."""
+
+    x1, x2 = -.05, .05
+    nv = int(round((x2 - x1) / step)) + 1
+    W = nv ** 3
+    with open(wtsname, 'wb') as f:
+        f.write(struct.pack(">8s1i", b'SAMCOEFF', 1))
+        f.write(struct.pack(">256s2i4x11d256s3i3i3i2i4x", b'bench', N, W,
+                            x1, x2, x1, x2, x1, x2, step, 0., 0., 0., 0.,
+                            b'', 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+        f.write(struct.pack(">%di" % N, *range(N)))
+        np.random.default_rng(2).standard_normal((W, N)).astype('>f8').tofile(f)
+    return W
+
+# Timing.
+
+Repeat = 5
+Results = []
+Quiet = False
+
+def bench(name, f, **params):
+    """Run f() Repeat times (after one untimed call) and record the
+    best and median times."""
+
+    f()
+    t = []
+    for i in range(Repeat):
+        t0 = perf_counter()
+        f()
+        t.append(perf_counter() - t0)
+    res = {'name': name, 'params': params, 'repeat': Repeat,
+           'best': min(t), 'median': float(np.median(t))}
+    Results.append(res)
+    if not Quiet:
+        p = ' '.join('{}={}'.format(k, v) for k, v in params.items())
+        msg("{:24s} {:40s} {:10.3f} ms\n".format(name, p, res['best'] * 1e3))
+    return res
+
+def skip(name, why):
+    Results.append({'name': name, 'skipped': why})
+    if not Quiet:
+        msg("{:24s} skipped: {}\n".format(name, why))
+
+def allocated(f):
+    """Return the peak number of bytes allocated while running f()."""
+
+    f()
+    tracemalloc.start()
+    f()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+# The benchmarks.
+
+def b_reads(ds, ntrials, nsamp):
+    pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + ds.r.numPrimaries)
+    for dtype in ('float64', 'float32'):
+        out = np.empty((NMEG, nsamp), dtype = dtype)
+        bench('readInto', lambda: ds.readInto(1, pri, 0, nsamp, out), dtype = dtype, nch = NMEG, n = nsamp)
+        sel = list(range(0, NMEG, 3))
+        o = out[:len(sel)]
+        bench('readInto', lambda: ds.readInto(1, sel, 0, nsamp, o), dtype = dtype, nch = len(sel), n = nsamp, idx = 'list')
+        n = nsamp // 2
+        o = out[:, :n]
+        bench('readContinuous', lambda: ds.readContinuous(nsamp - n // 2, n, pri, o), dtype = dtype, nch = NMEG, n = n)
+    for seglen in (nsamp // 10, nsamp // 2):
+        seglist = [(tr, s) for tr in range(ntrials) for s in range(0, nsamp - seglen + 1, seglen)]
+        bench('getEpochs', lambda: ds.getEpochs(seglist, seglen), nseg = len(seglist), seglen = seglen)
+        bench('getEpochs', lambda: ds.getEpochs(seglist, seglen, balance = 1), nseg = len(seglist), seglen = seglen, balance = 1)
+
+def b_copies(ds, nsamp):
+    """How many trial-sized arrays are allocated per read."""
+
+    pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + ds.r.numPrimaries)
+    size = NMEG * nsamp * 8
+    out = np.empty((NMEG, nsamp))
+    for name, f in (('readInto', lambda: ds.readInto(1, pri, 0, nsamp, out)),
+                    ('getPriArray', lambda: ds.getPriArray(1)),
+                    ('getIdxArray', lambda: ds.getIdxArray(1, pri))):
+        b = allocated(f)
+        Results.append({'name': 'copies', 'params': {'call': name, 'nch': NMEG, 'n': nsamp},
+                        'bytes': b, 'copies': b / size})
+        if not Quiet:
+            msg("{:24s} {:40s} {:10.2f} copies\n".format('copies', 'call=' + name, b / size))
+
+def b_open(dsname):
+    for lazy, cache in ((False, False), (True, False), (True, True)):
+        def f():
+            ds = pyctf.dsopen(dsname, lazy = lazy, cache = cache)
+            x = ds.r.time, ds.getSampleRate(), ds.getNumberOfTrials()
+            ds.close()
+        bench('dsopen', f, lazy = lazy, cache = cache)
+
+def b_dofilt(ds, nsamp, nthreads):
+    srate = ds.getSampleRate()
+    rng = np.random.default_rng(3)
+    for n in (nsamp // 4, nsamp, 4 * nsamp):
+        x = rng.standard_normal((NMEG, n))
+        for kind, filt in (('iir', pyctf.mkiir(1., 40., srate)),
+                           ('fft', pyctf.mkfft(1., 40., srate, n)),
+                           ('fhilb', pyctf.mkfhilb(8., 12., srate, n))):
+            for dtype in ('float64', 'float32'):
+                a = x.astype(dtype)
+                bench('dofilt', lambda: pyctf.dofilt(a, filt, nthreads = nthreads),
+                      filter = kind, dtype = dtype, nch = NMEG, n = n, nthreads = nthreads)
+
+def b_st(nsamp, nthreads):
+    from pyctf.st import st, fst, st_accumulate, mtst, calc_tapers
+    rng = np.random.default_rng(4)
+    for n in (nsamp // 10, nsamp // 4, nsamp):
+        x = rng.standard_normal(n)
+        bench('st', lambda: st(x), n = n, lo = 0, hi = n // 2)
+        hi = n // 10
+        bench('st', lambda: st(x, 0, hi), n = n, lo = 0, hi = hi)
+        bench('fst', lambda: fst(x, 0, hi), n = n, lo = 0, hi = hi, tol = 1e-6)
+        K = 3
+        tapers = calc_tapers(K, n)
+        bench('mtst', lambda: mtst(K, tapers, x, 0, hi), n = n, K = K, lo = 0, hi = hi)
+
+        # A sensor group at once, versus a loop over the channels.
+
+        nch = 32
+        X = rng.standard_normal((nch, n))
+        bench('st', lambda: [abs(st(x, 0, hi))**2 for x in X], n = n, lo = 0, hi = hi, nch = nch, loop = True)
+        bench('st', lambda: st(X, 0, hi, power = True, nthreads = nthreads), n = n, lo = 0, hi = hi,
+              nch = nch, power = True, nthreads = nthreads)
+        acc = np.zeros((hi + 1, n))
+        bench('st_accumulate', lambda: st_accumulate(acc, X, 0, hi, nthreads = nthreads), n = n, lo = 0, hi = hi,
+              nch = nch, nthreads = nthreads)
+
+def b_cov(ds, ntrials, nsamp):
+    seglen = nsamp // 4
+    seglist = [(tr, s) for tr in range(ntrials) for s in range(0, nsamp - seglen + 1, seglen)]
+    bench('getCov', lambda: ds.getCov(seglist, seglen), nseg = len(seglist), seglen = seglen)
+    bench('getCov', lambda: ds.getCov(seglist, seglen, dtype = 'float32'), nseg = len(seglist), seglen = seglen, dtype = 'float32')
+    bench('getCov', lambda: ds.getCov(seglist, seglen, balance = 1), nseg = len(seglist), seglen = seglen, balance = 1)
+
+    # The way sam_cov.py accumulates, one segment at a time.
+
+    pri = slice(ds.r.firstPrimary, ds.r.firstPrimary + ds.r.numPrimaries)
+    def f():
+        C = np.zeros((NMEG, NMEG))
+        for tr, s in seglist:
+            x = ds.readInto(tr, pri, s, seglen)
+            C += np.dot(x, x.T)
+        return C
+    bench('cov segment loop', f, nseg = len(seglist), seglen = seglen)
+
+def b_readwts(dsname):
+    from pyctf.readwts import readwts
+    for step in (.01, .005):
+        name = os.path.join(dsname, 'bench{}.wts'.format(int(step * 1000)))
+        W = mkwts(name, NMEG, step)
+        bench('readwts', lambda: readwts(name), nvox = W, nch = NMEG)
+
+def b_markers(dsname):
+    from pyctf.markers import markers
+    m = markers(dsname)
+    bench('markers', lambda: markers(dsname), nmarks = len(m['stim']))
+
+def b_fwd(fwdds):
+    try:
+        from pyctf import _samlib
+    except ImportError as e:
+        skip('SolveFwd', "no _samlib ({})".format(e))
+        return
+    if fwdds is None:
+        skip('SolveFwd', "no dataset with a head model (-f)")
+        return
+    ds = pyctf.dsopen(fwdds)
+    _samlib.GetDsInfo(ds)
+    _samlib.SetModel("MultiSphere")
+    _samlib.GetHDM()
+    _samlib.SetIntPnt()
+    pos = (0, 5, 5)
+    ori = (0.5, 0.03170106, 0.91827921)
+    bench('SolveFwd', lambda: _samlib.SolveFwd(None, pos, ori), dataset = fwdds, npos = 1)
+    pts = [(x, y, 5) for x in range(-4, 5, 2) for y in range(-4, 5, 2)]
+    bench('SolveFwd', lambda: [_samlib.SolveFwd(None, p, ori) for p in pts], dataset = fwdds, npos = len(pts))
+
+ALL = ['reads', 'copies', 'open', 'dofilt', 'st', 'cov', 'readwts', 'markers', 'fwd']
+
+def main():
+    global Repeat, Quiet
+
+    optlist, args = parseargs("o:d:kqr:t:n:c:f:b:")
+    outname = None
+    dirname = None
+    keep = False
+    ntrials = 20
+    nsamp = 6000
+    nthreads = 1
+    fwdds = None
+    which = ALL
+    for opt, arg in optlist:
+        if opt == '-o':
+            outname = arg
+        elif opt == '-d':
+            dirname = arg
+        elif opt == '-k':
+            keep = True
+        elif opt == '-q':
+            Quiet = True
+        elif opt == '-r':
+            Repeat = int(arg)
+        elif opt == '-t':
+            ntrials = int(arg)
+        elif opt == '-n':
+            nsamp = int(arg)
+        elif opt == '-c':
+            nthreads = int(arg)
+        elif opt == '-f':
+            fwdds = arg
+        elif opt == '-b':
+            which = arg.split(',')
+            for b in which:
+                if b not in ALL:
+                    printerror("unknown benchmark {}".format(b))
+                    sys.exit(1)
+    if args:
+        printusage()
+        sys.exit(1)
+
+    tmp = None
+    if dirname is None:
+        dirname = tmp = tempfile.mkdtemp(prefix = 'pyctfbench')
+    else:
+        os.makedirs(dirname, exist_ok = True)
+    dsname = os.path.join(dirname, 'bench.ds')
+
+    try:
+        t0 = perf_counter()
+        mkds(dsname, ntrials, nsamp, SRATE)
+        Results.append({'name': 'dsWriter', 'params': {'ntrials': ntrials, 'nch': NMEG + NREF + 1, 'n': nsamp},
+                        'best': perf_counter() - t0, 'repeat': 1})
+
+        ds = pyctf.dsopen(dsname)
+        if 'reads' in which:
+            b_reads(ds, ntrials, nsamp)
+        if 'copies' in which:
+            b_copies(ds, nsamp)
+        if 'open' in which:
+            b_open(dsname)
+        if 'dofilt' in which:
+            b_dofilt(ds, nsamp, nthreads)
+        if 'st' in which:
+            b_st(nsamp, nthreads)
+        if 'cov' in which:
+            b_cov(ds, ntrials, nsamp)
+        if 'readwts' in which:
+            b_readwts(dsname)
+        if 'markers' in which:
+            b_markers(dsname)
+        if 'fwd' in which:
+            b_fwd(fwdds)
+        ds.close()
+    finally:
+        if tmp and not keep:
+            shutil.rmtree(tmp)
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'node': platform.node(),
+            'ncpu': os.cpu_count(), 'ntrials': ntrials, 'nsamp': nsamp,
+            'srate': SRATE, 'nch': NMEG, 'repeat': Repeat}
+    s = json.dumps({'meta': meta, 'results': Results}, indent = 1)
+    if outname:
+        with open(outname, 'w') as f:
+            f.write(s + '\n')
+    else:
+        print(s)
+
+if __name__ == '__main__':
+    main()
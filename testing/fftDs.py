@@ -6,6 +6,7 @@ import pyctf
 from pyctf import ctf
 from pyctf.util import *
 from pyctf.st import *
+from pyctf.processing import Pipeline
 
 usage("""[options] [dataset]
 For the -m, -c, and -T options, you can specify multiple arguments in
@@ -105,8 +106,14 @@ if dsname == None:
     dsname = args[0]
 ds = pyctf.dsopen(dsname)
 
-if nflag:
-    ds.removeProcessing()
+# Apply the viewing filters, if any, to whole trials of all the channels.
+
+pipe = None
+if not nflag:
+    try:
+        pipe = Pipeline(ds)
+    except FileNotFoundError:
+        pass
 
 srate = ds.getSampleRate()
 ntrials = ds.getNumberOfTrials()
@@ -199,9 +206,12 @@ if K > 0:
     tapers = calc_tapers(K, seglen)
     print("bw = %g Hz" % calcbw(K, seglen, srate))
 
+cidx = [ds.getChannelIndex(c) for c in clist]
+
 n = 0
 maxm = len(tlist)
 m = 1
+last_tr = None
 for (tr, t) in tlist: # for each trial
     if t + t0 < T0 or t + t1 > T1:
         printerror("warning: segment exceeds trial boundaries for trial %d, time %g" % (tr, t))
@@ -210,9 +220,15 @@ for (tr, t) in tlist: # for each trial
     if m % 10 == 0:
         print('trial %d, %d samples at %d, %d of %d' % (tr, seglen, samp, m, maxm))
     m += 1
-    for c in clist: # for each channel in channel list
-        ch = ds.getChannelIndex(c)
-        d = ds.getDsSegment(tr, ch, samp, seglen)
+    if pipe and tr != last_tr:
+        D = pipe.getIdxArray(tr, cidx)
+        last_tr = tr
+    for k, ch in enumerate(cidx): # for each channel in channel list
+        if pipe:
+            d = D[k, samp : samp + seglen]
+            d = d - d.mean()
+        else:
+            d = ds.getDsSegment(tr, ch, samp, seglen)
         d *= 1e15 # convert from tesla to femtotesla
 
         #print(c)
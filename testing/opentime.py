@@ -0,0 +1,36 @@
+#! /usr/bin/env python
+
+"""Time opening many datasets, eagerly, lazily, and lazily with the
+.res4 header cache, and reading a few header fields from each, the
+way batch tools like avghc do."""
+
+import sys
+from time import time
+import pyctf
+
+if len(sys.argv) < 2:
+    print("usage: %s [-n count] dataset ..." % sys.argv[0])
+    sys.exit(1)
+
+args = sys.argv[1:]
+count = 1000
+if args[0] == '-n':
+    count = int(args[1])
+    args = args[2:]
+
+# Cycle through the datasets until count have been opened.
+
+dslist = [args[i % len(args)] for i in range(count)]
+
+def opentime(lazy, cache):
+    t0 = time()
+    for dsname in dslist:
+        ds = pyctf.dsopen(dsname, lazy = lazy, cache = cache)
+        x = ds.r.time, ds.getSampleRate(), ds.getNumberOfTrials()
+        ds.close()
+    return time() - t0
+
+for lazy, cache in ((False, False), (True, False), (True, True)):
+    t = opentime(lazy, cache)
+    print("lazy = %s, cache = %s: %d opens, %.3f s, %.2f ms per dataset" %
+          (lazy, cache, count, t, t * 1000. / count))